@@ -1,14 +1,14 @@
 """Building objects for colony."""
 from dataclasses import dataclass, field
-from typing import Any, List, Dict, Set, Tuple, Optional
+from typing import TYPE_CHECKING, Any, List, Dict, Set, Tuple, Optional
 
 import numpy as np
 
-from colony.configuration import res_cfg
-from colony.utils.image_manager import ImageManager
 from colony.utils.cooridinate_helper import LocationFinder
 from colony.characters.terrain import TerrainManager
-from colony.configs.map_generator.ref import BUILDABLE
+
+if TYPE_CHECKING:  # rendering modules (and cv2) are not needed for pure simulation
+    from colony.utils.image_manager import ImageManager
 
 TECH_CAP: int = 3
 
@@ -39,14 +39,14 @@ class ColonyBuildingManager:
         self,
         terrain_man: TerrainManager,
         combined_step: Dict[Tuple[int, int], Any],
-        image_manager: ImageManager = None,
+        image_manager: "ImageManager" = None,
         seed: int = 720,
     ):
         self.terrain_man: TerrainManager = terrain_man
         # width and height to calculate random locations
         self.height, self.width = self.terrain_man.bitmap.shape
         # imager to retrive building orientation information
-        self.image_manager: ImageManager = image_manager
+        self.image_manager: "ImageManager" = image_manager
         # colony spore locations
         self.combined_step: Dict[Tuple[int, int], Any] = combined_step
 
@@ -60,13 +60,17 @@ class ColonyBuildingManager:
         self.rng: np.random.RandomState = np.random.RandomState(seed)
         # random location builder, refactored part from this class
         self.finder: LocationFinder = LocationFinder(
-            terrain_man=terrain_man, rng=self.rng
+            terrain_man=terrain_man,
+            combined_step=self.combined_step,
+            building_step=self.building_step,
+            rng=self.rng,
         )
 
     def update_combined_step(self, combined_step: Dict[Tuple[int, int], Any]):
         """Should be called at the end of each iteration, such that building manager can
         get up-to-date information of current tile info."""
         self.combined_step = combined_step
+        self.finder.update_steps(self.combined_step, self.building_step)
 
     def progress_building_step(self):
         pass
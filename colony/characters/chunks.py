@@ -0,0 +1,100 @@
+"""Chunk index over the bitmap, so that per-step work can be limited to populated areas."""
+
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+
+CHUNK_SIZE: int = 64
+
+
+class ChunkManager:
+    """Splits the world into fixed-size square chunks and keeps per-chunk occupancy.
+
+    A chunk is active when at least one spore or building tile sits inside it. Consumers
+    that only care about populated areas (placement searches, rendering) iterate over
+    active chunks instead of the whole bitmap, so their cost follows the populated area
+    rather than the map size.
+    """
+
+    def __init__(self, width: int, height: int, chunk_size: int = CHUNK_SIZE):
+        """
+        Args
+            width: width of bitmap in tiles.
+            height: height of bitmap in tiles.
+            chunk_size: side length of a chunk in tiles. Edge chunks may be smaller.
+        """
+        assert chunk_size > 0, f"Chunk size should be positive, got {chunk_size}."
+        self.width: int = width
+        self.height: int = height
+        self.chunk_size: int = chunk_size
+
+        # number of chunks on each axis, edge chunks are clipped by map border
+        self.chunks_x: int = -(-width // chunk_size)
+        self.chunks_y: int = -(-height // chunk_size)
+
+        # per-chunk counters, indexed by [chunk_y][chunk_x]
+        self.spore_count: np.ndarray = np.zeros((self.chunks_y, self.chunks_x), dtype=np.int32)
+        self.structure_count: np.ndarray = np.zeros((self.chunks_y, self.chunks_x), dtype=np.int32)
+        # a chunk is active if it has any spores or buildings
+        self.active: np.ndarray = np.zeros((self.chunks_y, self.chunks_x), dtype=bool)
+
+    def chunk_of(self, coor: Tuple[int, int]) -> Tuple[int, int]:
+        """Get (chunk_x, chunk_y) of a tile."""
+        x, y = coor
+        return x // self.chunk_size, y // self.chunk_size
+
+    def chunk_bounds(self, chunk: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """Get tile bounds (x_start, y_start, x_end, y_end) of a chunk, end exclusive and
+        clipped to map borders."""
+        cx, cy = chunk
+        x_start: int = cx * self.chunk_size
+        y_start: int = cy * self.chunk_size
+        return (
+            x_start,
+            y_start,
+            min(x_start + self.chunk_size, self.width),
+            min(y_start + self.chunk_size, self.height),
+        )
+
+    def _refresh_active(self):
+        np.logical_or(self.spore_count > 0, self.structure_count > 0, out=self.active)
+
+    def add_spores(self, coor: Tuple[int, int], count: int = 1):
+        """Add (or remove with a negative count) spores on a single tile."""
+        cx, cy = self.chunk_of(coor)
+        self.spore_count[cy, cx] += count
+        self.active[cy, cx] = self.spore_count[cy, cx] > 0 or self.structure_count[cy, cx] > 0
+
+    def update_spores(self, step: Dict[Tuple[int, int], List[int]]):
+        """Rebuild spore counters from a spore step. Costs O(number of occupied tiles)."""
+        self.spore_count.fill(0)
+        if step:
+            coors: np.ndarray = np.fromiter(
+                (v for coor in step.keys() for v in coor), dtype=np.int64, count=2 * len(step)
+            ).reshape(-1, 2)
+            counts: np.ndarray = np.fromiter((len(v) for v in step.values()), dtype=np.int32, count=len(step))
+            np.add.at(
+                self.spore_count,
+                (coors[:, 1] // self.chunk_size, coors[:, 0] // self.chunk_size),
+                counts,
+            )
+        self._refresh_active()
+
+    def add_structure(self, start: Tuple[int, int], size: Tuple[int, int], count: int = 1):
+        """Register a building footprint. Footprints crossing chunk borders are counted
+        tile by tile in every chunk they touch."""
+        x, y = start
+        xs, ys = np.meshgrid(np.arange(x, x + size[0]), np.arange(y, y + size[1]))
+        np.add.at(self.structure_count, (ys // self.chunk_size, xs // self.chunk_size), count)
+        self._refresh_active()
+
+    def active_chunks(self) -> List[Tuple[int, int]]:
+        """List (chunk_x, chunk_y) of all active chunks."""
+        cys, cxs = np.nonzero(self.active)
+        return list(zip(cxs.tolist(), cys.tolist()))
+
+    def all_chunks(self) -> Iterable[Tuple[int, int]]:
+        """Iterate over every chunk, active or not."""
+        for cy in range(self.chunks_y):
+            for cx in range(self.chunks_x):
+                yield cx, cy
@@ -1,6 +1,6 @@
 import numpy as np
 from dataclasses import dataclass, field
-from typing import Any, Dict, Tuple, List
+from typing import TYPE_CHECKING, Any, Dict, Tuple, List
 
 
 from colony.characters.colony_stats import HappinessManager, ColonyResourceManager
@@ -9,7 +9,9 @@ from colony.characters.terrain import TerrainManager
 from colony.characters.spore import Spore, ColonySporeManager
 from colony.characters.storage import SporeStorage
 from colony.utils.info_manager import InfoManager
-from colony.utils.image_manager import ImageManager
+
+if TYPE_CHECKING:  # rendering modules (and cv2) are not needed for pure simulation
+    from colony.utils.image_manager import ImageManager
 
 STEP_INTERVAL: int = 10
 
@@ -30,7 +32,7 @@ class Colony:
         viewer_width: int = 1440,
         viewer_height: int = 900,
         init_pop: int = 10,
-        image_manager: ImageManager = None,
+        image_manager: "ImageManager" = None,
         seed: int = 0,
         verbose: bool = True,
     ):
@@ -62,7 +64,7 @@ class Colony:
 
         # pointers to other managers, order matters
         self.info: ColonyGeneralInfo = ColonyGeneralInfo()
-        self.image_manager: ImageManager = image_manager
+        self.image_manager: "ImageManager" = image_manager
         self.spore_man: ColonySporeManager = ColonySporeManager(
             init_pop=init_pop, terrain_man=self.terrain_man
         )
@@ -2,7 +2,7 @@
 import numpy as np
 from typing import Dict, List, Tuple
 
-from colony.configuration import res_cfg
+from colony import configuration
 from colony.characters.spore import Spore, ColonySporeManager
 from colony.characters.storage import ColonyStorage, SporeStorage
 from colony.characters.buildings import ColonyBuildingManager
@@ -71,6 +71,7 @@ class ColonyResourceManager:
         self.building_man: ColonyBuildingManager = building_man
         self.happiness_man: HappinessManager = happiness_man
 
+        res_cfg = configuration.res_cfg
         self.storage: ColonyStorage = ColonyStorage(res_cfg.starting_res)
 
         # setup random number generators for resource income and consumption
@@ -2,11 +2,12 @@ import numpy as np
 from dataclasses import dataclass, field
 from typing import Dict, Tuple, List, Optional
 
-from colony.configuration import res_cfg
+from colony import configuration
 from colony.characters.storage import SporeStorage
 from colony.characters.terrain import TerrainManager
 from colony.utils.batch_random import BatchNormal, BatchUniform
 from colony.progression.step import get_direction, get_next_coor
+from colony.utils.tile_helpers import is_passable
 
 
 
@@ -92,11 +93,11 @@ class ColonySporeManager:
             x: int = self.rng.randint(low=0, high=self.width)
             y: int = self.rng.randint(low=0, high=self.height)
 
-            # roll the coor of spore
-            if not self.allow_init_overlapping:
-                while (x, y) in self.step:
-                    x = self.rng.randint(low=0, high=self.width)
-                    y = self.rng.randint(low=0, high=self.height)
+            # roll the coor of spore, spores cannot be placed on impassable tiles like water
+            while ((x, y) in self.step and not self.allow_init_overlapping) \
+                    or not is_passable(self.terrain_man.bitmap[y, x]):
+                x = self.rng.randint(low=0, high=self.width)
+                y = self.rng.randint(low=0, high=self.height)
         else:
             x, y = coor
             if coor in self.step and (not self.allow_init_overlapping):
@@ -109,7 +110,7 @@ class ColonySporeManager:
             age=0,
             pos=coor,
             health=INITAL_HEALTH,
-            storage=SporeStorage(res={res_type: 0 for res_type in res_cfg.starting_res.keys()}),
+            storage=SporeStorage(res={res_type: 0 for res_type in configuration.res_cfg.starting_res.keys()}),
         )
         # add to spore dict
         self.spores[s.sid] = s
@@ -118,6 +119,7 @@ class ColonySporeManager:
         if coor not in self.step:
             self.step[coor] = []
         self.step[coor].append(s.sid)
+        self.terrain_man.chunks.add_spores(coor)
         # update counters
         self.id_counter += 1
         self.current_pop += 1
@@ -160,6 +162,7 @@ class ColonySporeManager:
                 spore_counter += 1
 
         self.step = new_step
+        self.terrain_man.chunks.update_spores(self.step)
         return self.step
 
     def calculate_spore_health(self):
@@ -184,6 +187,7 @@ class ColonySporeManager:
                 if spore.health <= 0:  # spore will die because of stravation
                     self.remove_a_spore(spore_id)
                     del self.step[coor][spore_inlist_id]
+                    self.terrain_man.chunks.add_spores(coor, count=-1)
                     if (self.step[coor]) == 0:
                         del self.step[coor]
                 else:
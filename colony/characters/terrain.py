@@ -1,21 +1,67 @@
 """Terrain manager controlling bitmap."""
 
-from typing import Any, Dict, Tuple, List
+from typing import Any, Dict, Tuple, List, Set
 import numpy as np
 
-from colony.configuration import map_cfg
-from colony.configs.map_generator.ref import STRUCTURE_PREFIX
+from colony import configuration
+from colony.characters.chunks import ChunkManager
+from colony.generators.chunk_store import ChunkedBitmap
+from colony.utils.tile_helpers import decode_tiles
 
 
 class TerrainManager:
     """Manages terrian."""
 
-    def __init__(self, bitmap: np.ndarray = map_cfg.bitmap):
-        """Init"""
-        # make a copy of raw map, in case there is a need to revert something
-        self.original_bitmap: np.ndarray = bitmap.copy()
+    def __init__(self, bitmap: np.ndarray = None):
+        """Init
+
+        Args
+            bitmap: bitmap to manage; the shared map in configuration.map_cfg is built and
+                used if not given.
+        """
+        if bitmap is None:
+            bitmap = configuration.map_cfg.bitmap
+        # pristine values of modified tiles, in case there is a need to revert something.
+        # a sparse overlay instead of a full copy, so huge (memory-mapped) maps are not doubled
+        self.original_tiles: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        # tiles changed since the visualizer last repainted them
+        self.changed_tiles: Set[Tuple[int, int]] = set()
         self.bitmap: np.ndarray = bitmap
         self.height, self.width = self.bitmap.shape
+        # per-chunk occupancy, shared by spore and building managers
+        self.chunks: ChunkManager = ChunkManager(self.width, self.height, configuration.world_cfg.chunk_size)
+        if isinstance(bitmap, ChunkedBitmap):  # chunks with spores are kept in memory
+            bitmap.store.is_pinned = lambda chunk: self.chunks.spore_count[chunk[1], chunk[0]] > 0
+
+    def set_tile(self, coor: Tuple[int, int], tile: Tuple[int, int, int]):
+        """Change a single tile to (terrain, structure, tech), remembering its pristine value
+        on the first change."""
+        x, y = coor
+        if coor not in self.original_tiles:
+            self.original_tiles[coor] = self.bitmap[y, x].item()
+        self.bitmap[y, x] = tile
+        self.changed_tiles.add(coor)
+
+    def pop_changed_tiles(self) -> Set[Tuple[int, int]]:
+        """Get tiles changed since the last call, and start tracking afresh."""
+        changed_tiles, self.changed_tiles = self.changed_tiles, set()
+        return changed_tiles
+
+    def get_code(self, coor: Tuple[int, int]) -> int:
+        """Compatibility accessor: old-style code of a tile, as used in map_ref."""
+        return int(decode_tiles(self.bitmap[coor[1], coor[0]]))
+
+    def get_original_tile(self, coor: Tuple[int, int]) -> Tuple[int, int, int]:
+        """Get the tile as it was generated, before any changes."""
+        if coor in self.original_tiles:
+            return self.original_tiles[coor]
+        return self.bitmap[coor[1], coor[0]].item()
+
+    def revert_tile(self, coor: Tuple[int, int]):
+        """Restore a tile to its generated value."""
+        if coor in self.original_tiles:
+            self.bitmap[coor[1], coor[0]] = self.original_tiles.pop(coor)
+            self.changed_tiles.add(coor)
 
     def add_building(
         self,
@@ -25,16 +71,14 @@ class TerrainManager:
         tech: int,
     ):
         """Add building to bitmap. The bitmap is read directly by visulaizer to draw stuff
-        on screen, and in this function we modify tiles that the building occupies to codes
-        that visualizer can recognize.
+        on screen, and in this function we set the structure layer of tiles that the building
+        occupies, while their terrain layer is kept.
         1. The upper left tile will be the drawing tile.
-        2. If a building occupies more than one tile, then only the drawing tile has the code
-            that visualizer would use, and other tiles would have codes with a zero as postfix
-            such that the visualizer would ignore.
-        3. Building codes are related to codes recognized by visualizer but a bit different:
-            e.g. a building may have code 21, and the drawing code could be 7223 and 7220,
-            where 7 is prefix of building, and 3 means tech level is 3; or 0 means it's just
-            occupied by this building but visualizer should not draw anything on this tile.
+        2. If a building occupies more than one tile, then only the drawing tile has a tech
+            level, and other tiles would have tech level 0 such that the visualizer would ignore.
+        3. In old-style codes (see decode_tiles), a building with code 21 gives drawing code
+            7223 and footprint code 7220, where 7 is prefix of building, and 3 means tech
+            level is 3; or 0 means it's just occupied by this building.
 
         Args
             start: upper left tile of building, also the tile to draw the building in visualizer.
@@ -43,10 +87,10 @@ class TerrainManager:
             tech: tech level of building.
         """
         x, y = start
-        building_code: int = STRUCTURE_PREFIX * 1000 + building_type * 10
         for x_extend in range(size[0]):
             for y_extend in range(size[1]):
-                if x_extend == 0 and y_extend == 0:
-                    self.bitmap[y][x] = building_code + tech
-                else:
-                    self.bitmap[y + y_extend][x + x_extend] = building_code
+                coor: Tuple[int, int] = (x + x_extend, y + y_extend)
+                terrain: int = self.bitmap[coor[1], coor[0]]["terrain"]
+                drawing_tech: int = tech if (x_extend == 0 and y_extend == 0) else 0
+                self.set_tile(coor, (terrain, building_type, drawing_tech))
+        self.chunks.add_structure(start, size)
@@ -1,17 +1,18 @@
 """Input interface to Colony instances.
 """
-import cv2
-from typing import Dict, List, Tuple, Union
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
 
-from colony.configuration import res_cfg
+from colony import configuration
 from colony.characters.colony import Colony
 from colony.characters.colony_stats import HappinessManager, ColonyResourceManager
 from colony.characters.buildings import Building, ColonyBuildingManager
 from colony.characters.terrain import TerrainManager
 from colony.characters.spore import Spore, ColonySporeManager
-from colony.utils.image_manager import ImageManager
 from colony.utils.cooridinate_helper import bfs
 
+if TYPE_CHECKING:  # rendering modules (and cv2) are not needed for pure simulation
+    from colony.utils.image_manager import ImageManager
+
 
 class ColonyCommander:
     """Interface to issue commands to a Colony instance. Many of functions are wrappers to existing
@@ -21,7 +22,7 @@ class ColonyCommander:
         # setup pointers to manger classes
         self.colony: Colony = colony
         self.terrain_man: TerrainManager = colony.terrain_man
-        self.image_manager: ImageManager = colony.image_manager
+        self.image_manager: "ImageManager" = colony.image_manager
         self.spore_man: ColonySporeManager = colony.spore_man
         self.happiness_man: HappinessManager = colony.happiness_man
         self.building_man: ColonyBuildingManager = colony.building_man
@@ -57,7 +58,7 @@ class ColonyCommander:
             orientation: orientation of the sctructure. If not supplied, use random.
         """
         assert level > 0, "Tech level should be larger than 0."
-        res_required: Dict[int, int] = res_cfg.building_costs[structure_type][level]
+        res_required: Dict[int, int] = configuration.res_cfg.building_costs[structure_type][level]
         # perform resource check
         if not self.perform_resource_check(res_required=res_required):
             print('Building, res check failed')
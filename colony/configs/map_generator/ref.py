@@ -1,9 +1,24 @@
 """Reference of numbers in map bitmap and definition.
 """
-from telnetlib import SE
 from typing import Dict, Set, Tuple
+import numpy as np
 
 STRUCTURE_PREFIX: int = 7
+
+# terrain classes stored in the "terrain" layer of bitmaps; 0 is reserved for void
+VOID: int = 0
+GRASS: int = 1
+TREE: int = 2
+WATER: int = 3
+MOUNTAIN: int = 4
+# terrain class -> old-style tile code in map_ref
+TERRAIN_CODES: Dict[int, int] = {GRASS: 101, TREE: 111, WATER: 201, MOUNTAIN: 301}
+
+# bitmaps are stored as compact layers (4 bytes per tile):
+#   terrain: terrain class, see above
+#   structure: building type (e.g. 11, 21) occupying the tile; 0 for none
+#   tech: tech level on the drawing tile of a building; 0 on the rest of its footprint
+TILE_DTYPE: np.dtype = np.dtype([("terrain", np.uint8), ("structure", np.uint16), ("tech", np.uint8)])
 # buildale tiles
 BUILDABLE: Set[int] = {101, }
 # passiable tiles
@@ -45,3 +60,34 @@ map_ref: Dict[int, Tuple] = {
     7213: ("timber (lv.3)", (24, 56, 101)),
     7214: ("timber (lv.4)", (24, 56, 101)),
 }
+
+
+# precomputed lookup tables, so that layer decoding is a single gather
+def _build_terrain_table(values: Dict[int, Tuple], dtype, width: int = None) -> np.ndarray:
+    shape = (256,) if width is None else (256, width)
+    table: np.ndarray = np.zeros(shape, dtype=dtype)
+    for terrain, value in values.items():
+        table[terrain] = value
+    return table
+
+
+# terrain class -> old code / passable / buildable / BGR color
+TERRAIN_CODE_LUT: np.ndarray = _build_terrain_table(TERRAIN_CODES, np.int32)
+PASSABLE_LUT: np.ndarray = _build_terrain_table(
+    {t: c in PASSABLE for t, c in TERRAIN_CODES.items()}, bool
+)
+BUILDABLE_LUT: np.ndarray = _build_terrain_table(
+    {t: c in BUILDABLE for t, c in TERRAIN_CODES.items()}, bool
+)
+TERRAIN_COLOR_LUT: np.ndarray = _build_terrain_table(
+    {t: map_ref[c][-1] for t, c in TERRAIN_CODES.items()}, np.uint8, width=3
+)
+
+# building type -> BGR color, for buildings drawn without images
+STRUCTURE_DEFAULT_COLOR: Tuple[int, int, int] = (70, 87, 96)
+STRUCTURE_COLOR_LUT: np.ndarray = np.tile(
+    np.array(STRUCTURE_DEFAULT_COLOR, dtype=np.uint8), (np.iinfo(np.uint16).max + 1, 1)
+)
+for _code, (_name, _color) in map_ref.items():
+    if _code // 1000 == STRUCTURE_PREFIX:
+        STRUCTURE_COLOR_LUT[(_code % 1000) // 10] = _color
@@ -1,6 +1,5 @@
 """Detailed map generation rules.
 """
-import yaml
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Dict, Tuple
@@ -18,6 +17,8 @@ class GreenMapRules:
         self.water_types: Dict[str, float] = cfg["water_types"]
         self.water_percentage: float = cfg["water_percentage"]
         self.water_upper_limit: float = cfg["water_upper_limit"]
+        # rivers keep this ratio of side length away from map corners
+        self.river_side_offset: float = cfg["water_rules"]["river_rules"]["side_offset"]
 
         # vegies
         self.wood_percentage: float = cfg["wood_percentage"]
@@ -26,6 +27,8 @@ class GreenMapRules:
 def load_rules(map_type: str):
     """Returns a map rule dataclass object with given map type and config name.
     """
+    import yaml  # deferred, so that importing generators does not pull in yaml
+
     all_cfg = yaml.safe_load(open(RULES))
     rules = None
     if map_type == "green":
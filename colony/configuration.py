@@ -1,16 +1,40 @@
 """Holding multiple types of settings for importing.
+
+Settings objects (spore_cfg, world_cfg, map_cfg and res_cfg) are built lazily, when they
+are first accessed as attributes of this module. In particular the map is only generated
+when a Colony asks for it, so importing the simulation stays cheap.
 """
-import yaml
+import os
+import sys
+import tempfile
+import weakref
+import numpy as np
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import Any, List, Dict
+from typing import Any, Callable, List, Dict, Optional, Tuple
 
-from colony.generators.map_generator import GreenMapGenerator
+from colony.generators.map_generator import GreenMapGenerator, GENERATOR_VERSION
+from colony.configs.map_generator.rule_loader import RULES
+from colony.generators.chunk_store import ChunkStore, ChunkedBitmap
+from colony.configs.map_generator.ref import TILE_DTYPE
+from colony.utils.disk_cache import cache_key, cache_path, mark_used, prune_cache, write_atomic
 
 config_path = Path(__file__).parent.joinpath("configs")
+# next to a kept memmap_path, holds the key of the map in it
+MEMMAP_KEY_SUFFIX: str = ".key"
+# least recently used cached maps are deleted once they take more than this on disk
+MAP_CACHE_BYTES: int = 4 * 1024 ** 3
 map_generator_mapper: dict[str, Any] = {"green": GreenMapGenerator}
 
 
+def load_config_yaml(relative_path: str) -> dict:
+    """Parse a yaml file under the configs folder."""
+    import yaml  # deferred, only needed once a setting is first accessed
+
+    with open(config_path.joinpath(relative_path)) as config_file:
+        return yaml.safe_load(config_file)
+
+
 @dataclass
 class SporeSettings:
     """
@@ -35,15 +59,18 @@ class SporeSettings:
     crowd_threshold: int
 
 
-# objected shared in multiple places
-spore_cfg = SporeSettings(
-    **yaml.safe_load(open(config_path.joinpath("spore_beheavoir/default.yaml")))
-)
-
 
 @dataclass
 class WorldSetup:
-    """Some general settings for world."""
+    """Some general settings for world.
+
+    Attributes:
+        chunk_size: side length of simulation chunks, in tiles.
+        streaming: generate chunks on demand and evict cold ones to disk instead of
+            building the whole map up front; for very large worlds.
+        chunk_memory_budget_mb: memory budget of loaded chunks in streaming mode.
+        chunk_store_dir: folder for evicted chunks in streaming mode; temporary if None.
+    """
 
     setting_id: str
     width: int
@@ -51,10 +78,12 @@ class WorldSetup:
     initial_population: int
     viewer_width: int
     viewer_height: int
+    chunk_size: int = 64
+    streaming: bool = False
+    chunk_memory_budget_mb: float = 256
+    chunk_store_dir: Optional[str] = None
 
 
-world_cfg = WorldSetup(**yaml.safe_load(open(config_path.joinpath("world/default.yaml"))))
-
 @dataclass
 class MapSetup:
     """Map settings and pointers to generators and bitmaps."""
@@ -75,17 +104,121 @@ class MapSetup:
 
         self.map_description: str = config["map_description"]
         self.map_type: str = config["map_type"]
+        # "memory" keeps the bitmap in RAM; "memmap" backs it with a file on disk
+        self.backing: str = config.get("backing", "memory")
+        self.memmap_path: Optional[str] = config.get("memmap_path")
+        assert self.backing in ("memory", "memmap"), f"Unknown map backing {self.backing}."
+        # reuse maps generated by earlier runs with the same settings
+        self.cache: bool = config.get("cache", False)
+        assert not (self.cache and self.backing == "memmap"), \
+            "Map cache is already memory-mapped; set cache: false to use memmap backing."
+        self.cache_key: Optional[str] = None
+        # threads generating the map, all CPUs if not set; does not change the generated map
+        self.workers: Optional[int] = config.get("workers")
 
+        if world_cfg.streaming:  # chunks will be generated when they are first touched
+            self.bitmap = self._build_streaming_bitmap(world_cfg)
+        elif self.cache:
+            self.bitmap = self._load_or_build_cached_bitmap(world_cfg)
+        elif self.backing == "memmap":
+            self.bitmap = self._open_memmap_bitmap(world_cfg)
+        else:
+            self.bitmap = self._create_generator(world_cfg).get_bitmap()
+
+    def _create_generator(self, world_cfg: WorldSetup, lazy: bool = False, out: np.ndarray = None):
         map_generator_class = map_generator_mapper[self.map_type]
-        map_generator = map_generator_class(
-            self.seed, width=world_cfg.width, height=world_cfg.height
+        return map_generator_class(
+            self.seed,
+            width=world_cfg.width,
+            height=world_cfg.height,
+            lazy=lazy,
+            out=out,
+            workers=self.workers,
         )
-        self.bitmap = map_generator.get_bitmap()
 
+    def _build_streaming_bitmap(self, world_cfg: WorldSetup) -> ChunkedBitmap:
+        store = ChunkStore(
+            self._create_generator(world_cfg, lazy=True),
+            chunk_size=world_cfg.chunk_size,
+            store_dir=world_cfg.chunk_store_dir,
+            memory_budget_mb=world_cfg.chunk_memory_budget_mb,
+        )
+        return ChunkedBitmap(store, width=world_cfg.width, height=world_cfg.height, dtype=TILE_DTYPE)
+
+    def _map_key(self, world_cfg: WorldSetup) -> str:
+        """Key of everything deciding the generated map."""
+        return cache_key(
+            self.map_type,
+            self.seed,
+            world_cfg.width,
+            world_cfg.height,
+            RULES.read_bytes(),
+            GENERATOR_VERSION,
+            TILE_DTYPE.descr,
+        )
+
+    def _open_memmap_bitmap(self, world_cfg: WorldSetup) -> np.memmap:
+        """Generate the map into a .npy file mapped to memory. A temporary file is removed once
+        the map is released or the program exits. A given memmap_path is kept, along with the
+        key of its map in a ".key" file next to it, and later runs with the same settings open
+        it again without generating. Reused maps are opened copy-on-write like cached maps, so
+        changes made during a run never reach the file.
+        """
+        shape: Tuple[int, int] = (world_cfg.height, world_cfg.width)
+        if self.memmap_path is None:
+            fd, self.memmap_path = tempfile.mkstemp(prefix="colony_map_", suffix=".npy")
+            os.close(fd)
+            bitmap: np.memmap = np.lib.format.open_memmap(self.memmap_path, mode="w+", dtype=TILE_DTYPE, shape=shape)
+            weakref.finalize(bitmap, _remove_file, self.memmap_path)
+            self._create_generator(world_cfg, out=bitmap)
+            return bitmap
+
+        key: str = self._map_key(world_cfg)
+        key_path: Path = Path(self.memmap_path + MEMMAP_KEY_SUFFIX)
+        if Path(self.memmap_path).is_file() and key_path.is_file() and key_path.read_text() == key:
+            bitmap = np.load(self.memmap_path, mmap_mode="c")
+            if bitmap.shape == shape and bitmap.dtype == TILE_DTYPE:
+                return bitmap
+            del bitmap
+        _remove_file(str(key_path))  # invalid until the new map is complete
+        bitmap = np.lib.format.open_memmap(self.memmap_path, mode="w+", dtype=TILE_DTYPE, shape=shape)
+        self._create_generator(world_cfg, out=bitmap)
+        bitmap.flush()
+        del bitmap
+        key_path.write_text(key)
+        return np.load(self.memmap_path, mmap_mode="c")
+
+    def _load_or_build_cached_bitmap(self, world_cfg: WorldSetup) -> np.ndarray:
+        """Memory-map a map generated earlier with identical settings, or generate it into the
+        cache first. The map is opened copy-on-write, so changes (like buildings) stay in this
+        process and never reach the cache file."""
+        self.cache_key = self._map_key(world_cfg)
+        path: Path = cache_path("maps", self.cache_key, ".npy")
+        if path.is_file():
+            mark_used(path)
+        else:
+            def generate_into(temp_path: Path):
+                out: np.memmap = np.lib.format.open_memmap(
+                    temp_path, mode="w+", dtype=TILE_DTYPE, shape=(world_cfg.height, world_cfg.width)
+                )
+                self._create_generator(world_cfg, out=out)
+                out.flush()
+                del out
+
+            write_atomic(path, generate_into)
+        self.memmap_path = str(path)
+        bitmap: np.memmap = np.load(path, mmap_mode="c")
+        # pruned after mapping, as a map larger than the budget is still used by this run
+        prune_cache("maps", MAP_CACHE_BYTES)
+        return bitmap
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-map_cfg = MapSetup(
-    yaml.safe_load(open(config_path.joinpath("map_generator/default.yaml"))), world_cfg
-)
 
 @dataclass
 class ResSetup:
@@ -102,6 +235,23 @@ class ResSetup:
         for building_code, building_cost in self.building_costs.items():
             self.building_costs[building_code] = [{}] + building_cost
 
-res_cfg = ResSetup(
-    **yaml.safe_load(open(config_path.joinpath("resource/default.yaml")))
-)
\ No newline at end of file
+
+# objected shared in multiple places, built on first access by __getattr__
+_config_builders: Dict[str, Callable[[], Any]] = {
+    "spore_cfg": lambda: SporeSettings(**load_config_yaml("spore_beheavoir/default.yaml")),
+    "world_cfg": lambda: WorldSetup(**load_config_yaml("world/default.yaml")),
+    "map_cfg": lambda: MapSetup(
+        load_config_yaml("map_generator/default.yaml"), sys.modules[__name__].world_cfg
+    ),
+    "res_cfg": lambda: ResSetup(**load_config_yaml("resource/default.yaml")),
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Build a shared settings object the first time it is accessed, then keep it as a
+    normal module attribute."""
+    if name not in _config_builders:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value: Any = _config_builders[name]()
+    globals()[name] = value
+    return value
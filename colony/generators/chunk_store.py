@@ -0,0 +1,239 @@
+"""On-demand chunk generation and cold-chunk eviction for very large worlds.
+
+Instead of holding the whole bitmap in memory, a ChunkedBitmap asks a ChunkStore for the
+chunk holding each tile it is indexed with. Chunks are generated deterministically from
+(seed, chunk coordinates) the first time they are touched; when the memory budget is
+exceeded, least recently used chunks without spores are compressed to disk and reloaded
+transparently later.
+"""
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterator, Set, Tuple, Union
+
+import numpy as np
+
+from colony.configs.map_generator.ref import TILE_DTYPE
+
+
+DEFAULT_MEMORY_BUDGET_MB: int = 256
+
+
+class ChunkStore:
+    """LRU cache of generated chunks backed by a compressed on-disk store."""
+
+    def __init__(
+        self,
+        generator,
+        chunk_size: int,
+        store_dir: Union[str, Path] = None,
+        memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+    ):
+        """
+        Args
+            generator: a map generator implementing generate_chunk(chunk, chunk_size).
+            chunk_size: side length of a chunk in tiles; should match ChunkManager's.
+            store_dir: folder for evicted chunks. A temporary folder is used if not given.
+            memory_budget_mb: max size of loaded chunks before cold ones are evicted.
+        """
+        self.generator = generator
+        self.chunk_size: int = chunk_size
+        self.store_dir: Path = Path(
+            store_dir if store_dir is not None else tempfile.mkdtemp(prefix="colony_chunks_")
+        )
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_budget: int = int(memory_budget_mb * 1024 ** 2)
+
+        # loaded chunks in LRU order, least recently used first
+        self.loaded: "OrderedDict[Tuple[int, int], np.ndarray]" = OrderedDict()
+        self.memory_used: int = 0
+        # chunks changed since they were last written to disk
+        self.dirty: Set[Tuple[int, int]] = set()
+        # chunks with an up-to-date copy on disk
+        self.on_disk: Set[Tuple[int, int]] = set()
+        # callback telling whether a chunk must stay in memory (e.g. it has spores)
+        self.is_pinned: Callable[[Tuple[int, int]], bool] = lambda chunk: False
+
+    def _chunk_path(self, chunk: Tuple[int, int]) -> Path:
+        return self.store_dir.joinpath(f"{chunk[0]}_{chunk[1]}.npz")
+
+    def get(self, chunk: Tuple[int, int]) -> np.ndarray:
+        """Get tiles of a chunk, loading it from disk or generating it if needed."""
+        tiles: np.ndarray = self.loaded.get(chunk)
+        if tiles is not None:
+            self.loaded.move_to_end(chunk)
+            return tiles
+
+        if chunk in self.on_disk:
+            with np.load(self._chunk_path(chunk)) as stored:
+                tiles = stored["tiles"]
+        else:
+            tiles = self.generator.generate_chunk(chunk, self.chunk_size)
+        self.loaded[chunk] = tiles
+        self.memory_used += tiles.nbytes
+        self._evict_if_needed()
+        return tiles
+
+    def mark_dirty(self, chunk: Tuple[int, int]):
+        """Flag a loaded chunk as modified so that eviction writes it back."""
+        self.dirty.add(chunk)
+        self.on_disk.discard(chunk)
+
+    def _evict_if_needed(self):
+        """Evict cold chunks by LRU order until memory use is under budget. Pinned chunks and
+        the most recently used chunk are never evicted."""
+        if self.memory_used <= self.memory_budget:
+            return
+        for chunk in list(self.loaded.keys())[:-1]:
+            if self.memory_used <= self.memory_budget:
+                break
+            if self.is_pinned(chunk):
+                continue
+            self.evict(chunk)
+
+    def evict(self, chunk: Tuple[int, int]):
+        """Compress a loaded chunk to disk (unless an identical copy is already there) and
+        release its memory."""
+        tiles: np.ndarray = self.loaded.pop(chunk)
+        if chunk not in self.on_disk:
+            np.savez_compressed(self._chunk_path(chunk), tiles=tiles)
+            self.on_disk.add(chunk)
+        self.dirty.discard(chunk)
+        self.memory_used -= tiles.nbytes
+
+
+class ChunkedBitmap:
+    """Array-like view over a ChunkStore. Supports the subset of ndarray indexing the colony
+    uses: bitmap[y, x] for single tiles, bitmap[y0:y1, x0:x1] windows (step 1), reading
+    scattered tiles by integer arrays like bitmap[ys, xs] (broadcast as ndarray does), and
+    fields like bitmap["structure"], which are read lazily with the same indexing. Only
+    single tiles and windows can be written.
+    """
+
+    def __init__(self, store: ChunkStore, width: int, height: int, dtype=TILE_DTYPE):
+        self.store: ChunkStore = store
+        self.shape: Tuple[int, int] = (height, width)
+        self.dtype = np.dtype(dtype)
+        self.ndim: int = 2
+        self.size: int = width * height
+
+    @staticmethod
+    def _is_fancy(key) -> bool:
+        return isinstance(key, tuple) and any(isinstance(index, (np.ndarray, list)) for index in key)
+
+    def _normalize(self, key) -> Tuple[Union[int, slice], Union[int, slice]]:
+        assert isinstance(key, tuple) and len(key) == 2, \
+            f"Index chunked bitmaps by [y, x], got {key}."
+        normalized = []
+        for index, length in zip(key, self.shape):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(length)
+                assert step == 1, "Chunked bitmaps only support contiguous windows."
+                normalized.append(slice(start, stop))
+            else:
+                index = int(index)
+                if index < 0:
+                    index += length
+                if not 0 <= index < length:
+                    raise IndexError(f"Index {index} out of range for size {length}.")
+                normalized.append(index)
+        return tuple(normalized)
+
+    def _windows(self, y_range: slice, x_range: slice) -> Iterator[Tuple[Tuple[int, int], slice, slice, slice, slice]]:
+        """Split a tile window into per-chunk pieces. Yields chunk coordinates, then local
+        (y, x) slices inside the chunk, then (y, x) slices inside the window."""
+        size: int = self.store.chunk_size
+        for cy in range(y_range.start // size, -(-y_range.stop // size)):
+            y_start: int = max(y_range.start, cy * size)
+            y_end: int = min(y_range.stop, (cy + 1) * size)
+            for cx in range(x_range.start // size, -(-x_range.stop // size)):
+                x_start: int = max(x_range.start, cx * size)
+                x_end: int = min(x_range.stop, (cx + 1) * size)
+                yield (
+                    (cx, cy),
+                    slice(y_start - cy * size, y_end - cy * size),
+                    slice(x_start - cx * size, x_end - cx * size),
+                    slice(y_start - y_range.start, y_end - y_range.start),
+                    slice(x_start - x_range.start, x_end - x_range.start),
+                )
+
+    def _gather(self, key) -> np.ndarray:
+        """Read tiles at integer index arrays, chunk by chunk."""
+        assert len(key) == 2, f"Index chunked bitmaps by [y, x], got {key}."
+        ys, xs = key
+        # slices next to index arrays give an axis of their own, after (x) or before (y) them
+        if isinstance(ys, slice):
+            xs = np.asarray(xs)
+            ys = np.arange(*ys.indices(self.shape[0])).reshape((-1,) + (1,) * xs.ndim)
+        elif isinstance(xs, slice):
+            ys = np.asarray(ys)[..., None]
+            xs = np.arange(*xs.indices(self.shape[1]))
+        ys, xs = np.broadcast_arrays(np.asarray(ys, dtype=np.int64), np.asarray(xs, dtype=np.int64))
+        shape: Tuple[int, ...] = ys.shape
+        ys = np.where(ys < 0, ys + self.shape[0], ys).ravel()
+        xs = np.where(xs < 0, xs + self.shape[1], xs).ravel()
+        if ys.size and (ys.min() < 0 or ys.max() >= self.shape[0] or xs.min() < 0 or xs.max() >= self.shape[1]):
+            raise IndexError(f"Tile index out of range for bitmap of shape {self.shape}.")
+
+        size: int = self.store.chunk_size
+        chunks_x: int = -(-self.shape[1] // size)
+        chunk_ids: np.ndarray = (ys // size) * chunks_x + xs // size
+        order: np.ndarray = np.argsort(chunk_ids, kind="stable")
+        unique_ids, starts = np.unique(chunk_ids[order], return_index=True)
+        out: np.ndarray = np.empty(ys.size, dtype=self.dtype)
+        for chunk_id, picked in zip(unique_ids.tolist(), np.split(order, starts[1:])):
+            tiles: np.ndarray = self.store.get((chunk_id % chunks_x, chunk_id // chunks_x))
+            out[picked] = tiles[ys[picked] % size, xs[picked] % size]
+        return out.reshape(shape)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return ChunkedField(self, key)
+        if self._is_fancy(key):
+            return self._gather(key)
+        y, x = self._normalize(key)
+        size: int = self.store.chunk_size
+        if not isinstance(y, slice) and not isinstance(x, slice):
+            return self.store.get((x // size, y // size))[y % size, x % size]
+
+        y_range: slice = y if isinstance(y, slice) else slice(y, y + 1)
+        x_range: slice = x if isinstance(x, slice) else slice(x, x + 1)
+        window: np.ndarray = np.empty(
+            (y_range.stop - y_range.start, x_range.stop - x_range.start), dtype=self.dtype
+        )
+        for chunk, local_y, local_x, out_y, out_x in self._windows(y_range, x_range):
+            window[out_y, out_x] = self.store.get(chunk)[local_y, local_x]
+        # drop axes indexed by integers, like ndarray does
+        return window[0 if not isinstance(y, slice) else slice(None), 0 if not isinstance(x, slice) else slice(None)]
+
+    def __setitem__(self, key, value):
+        assert not isinstance(key, str) and not self._is_fancy(key), \
+            "Chunked bitmaps are only written by single tiles or windows."
+        y, x = self._normalize(key)
+        y_range: slice = y if isinstance(y, slice) else slice(y, y + 1)
+        x_range: slice = x if isinstance(x, slice) else slice(x, x + 1)
+        value = np.broadcast_to(
+            np.array(value, dtype=self.dtype),
+            (y_range.stop - y_range.start, x_range.stop - x_range.start),
+        )
+        for chunk, local_y, local_x, out_y, out_x in self._windows(y_range, x_range):
+            self.store.get(chunk)[local_y, local_x] = value[out_y, out_x]
+            self.store.mark_dirty(chunk)
+
+    def __len__(self):
+        return self.shape[0]
+
+
+class ChunkedField:
+    """One field of every tile of a ChunkedBitmap, like bitmap["structure"]. Read-only; tiles
+    are only read when it is indexed, the same ways as the bitmap."""
+
+    def __init__(self, bitmap: ChunkedBitmap, name: str):
+        self.bitmap: ChunkedBitmap = bitmap
+        self.name: str = name
+        self.shape: Tuple[int, int] = bitmap.shape
+        self.dtype = bitmap.dtype[name]
+        self.ndim: int = 2
+
+    def __getitem__(self, key):
+        return self.bitmap[key][self.name]
@@ -0,0 +1,100 @@
+"""Multi-octave value noise, evaluated with whole-array operations.
+
+Lattice values come from an integer hash of (seed, octave, lattice coordinates) instead of a
+stored table, so noise is defined over the whole (unbounded) tile plane and any window of it
+can be evaluated on its own. A tile gets the same value whichever window it is evaluated in,
+which lets maps be generated band by band or chunk by chunk without seams.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+def _hash_lattice(seed: int, octave: int, iy: np.ndarray, ix: np.ndarray) -> np.ndarray:
+    """Pseudo random values in [0, 1) of lattice points, for every pair of iy (rows) and ix
+    (columns)."""
+    mask = np.uint64(0xFFFFFFFF)
+    h: np.ndarray = (
+        iy.astype(np.uint64)[:, None] * np.uint64(0x8DA6B343)
+        + ix.astype(np.uint64)[None, :] * np.uint64(0xD8163841)
+        + np.uint64((seed + octave * 0xCB1AB31F) & 0xFFFFFFFF)
+    ) & mask
+    # avalanche, so that neighbouring lattice points are uncorrelated
+    h ^= h >> np.uint64(16)
+    h = (h * np.uint64(0x7FEB352D)) & mask
+    h ^= h >> np.uint64(15)
+    h = (h * np.uint64(0x846CA68B)) & mask
+    h ^= h >> np.uint64(16)
+    return (h.astype(np.float64) / 2 ** 32).astype(np.float32)
+
+
+def _lattice_axis(coors: np.ndarray, frequency: float, offset: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Lower lattice index and smoothstep weight of the upper lattice point, per coordinate."""
+    positions: np.ndarray = (coors + 0.5) * frequency + offset
+    lower: np.ndarray = np.floor(positions)
+    fraction: np.ndarray = positions - lower
+    return lower.astype(np.int64), (fraction * fraction * (3 - 2 * fraction)).astype(np.float32)
+
+
+class FractalNoise:
+    """Sum of value noise octaves. Each octave doubles the frequency of the previous one and
+    its amplitude is scaled by persistence. Values are normalized to [0, 1).
+    """
+    def __init__(
+        self,
+        rng: np.random.RandomState,
+        scale: float,
+        octaves: int = 4,
+        persistence: float = 0.5,
+    ):
+        """
+        Args
+            rng: RandomState instance that is used to seed the noise.
+            scale: wavelength of the first octave, in tiles.
+            octaves: number of octaves to sum.
+            persistence: amplitude ratio between consecutive octaves.
+        """
+        assert scale > 0, f"Noise scale should be positive, got {scale}."
+        self.seed: int = int(rng.randint(2 ** 31))
+        self.scale: float = scale
+        self.octaves: int = octaves
+        self.amplitudes: np.ndarray = persistence ** np.arange(octaves)
+        self.amplitudes /= self.amplitudes.sum()
+        # random lattice shifts, so that octaves do not align at the map origin
+        self.offsets: np.ndarray = rng.uniform(0, 1024, size=(octaves, 2))
+
+    def sample(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """Evaluate noise on the grid of given global tile rows and columns.
+
+        Args
+            ys: 1D array of tile y indices, non-negative.
+            xs: 1D array of tile x indices, non-negative.
+
+        Returns
+            np.ndarray: float32 noise of shape (len(ys), len(xs)).
+        """
+        values: np.ndarray = np.zeros((len(ys), len(xs)), dtype=np.float32)
+        for octave in range(self.octaves):
+            frequency: float = 2 ** octave / self.scale
+            iy, ty = _lattice_axis(ys, frequency, self.offsets[octave, 0])
+            ix, tx = _lattice_axis(xs, frequency, self.offsets[octave, 1])
+            y_base, x_base = iy.min(), ix.min()
+            lattice: np.ndarray = _hash_lattice(
+                self.seed, octave,
+                np.arange(y_base, iy.max() + 2), np.arange(x_base, ix.max() + 2),
+            )
+            lattice *= np.float32(self.amplitudes[octave])
+            # interpolate along x for every lattice row (few rows), then along y for every tile
+            # row as lower + (upper - lower) * ty, gathering whole rows
+            rows: np.ndarray = lattice[:, ix - x_base]
+            rows += (lattice[:, ix - x_base + 1] - rows) * tx
+            steps: np.ndarray = np.diff(rows, axis=0)
+            values += rows[iy - y_base]
+            upper: np.ndarray = steps[iy - y_base]
+            upper *= ty[:, None]
+            values += upper
+        return values
+
+    def window(self, y_start: int, x_start: int, height: int, width: int) -> np.ndarray:
+        """Evaluate noise over a contiguous window of the map."""
+        return self.sample(np.arange(y_start, y_start + height), np.arange(x_start, x_start + width))
@@ -1,49 +1,337 @@
+"""Water body generators.
+
+Each water body is first planned with a few random numbers (sides, center, meanders, ...),
+and then painted into any window of the map with whole-array operations. Planning is cheap
+and independent of map size, and a planned body paints identically no matter how the map
+is split into windows (chunks, parallel tiles), since masks only depend on global tile
+coordinates.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Tuple
+
 import numpy as np
 
-def add_single_waterbody(water_type: str,
-                         water_size: int,
-                         map: np.ndarray,
-                         rng: np.random.RandomState):
-    """Add a single type of waterbody to the map, by calling corresponding water functions.
+from colony.configs.map_generator.ref import WATER
+
+SIDES: List[str] = ["left", "top", "right", "bottom"]
+# rows of a window painted at once, which bounds temporary memory on huge maps
+PAINT_BAND_ROWS: int = 512
+# meandering strength of rivers, as a ratio to the map length across the river
+RIVER_MEANDER: float = 0.1
+# bumpiness of lake shores and coastlines, as a ratio to their radius/depth
+SHORE_ROUGHNESS: float = 0.15
+
+
+@dataclass
+class WaterBody(ABC):
+    """A planned water body in global tile coordinates."""
+
+    @abstractmethod
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """Tile bounding box (y_start, y_end, x_start, x_end) of this body, end exclusive."""
+
+    @abstractmethod
+    def mask(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """Whether tiles are water. ys is a column and xs a row of global tile indices, and
+        the result is broadcast to their outer shape."""
+
+    def paint(self, tiles: np.ndarray, y_start: int = 0, x_start: int = 0):
+        """Paint this body onto a window of layered tiles whose upper left tile is at
+        (x_start, y_start) of the map."""
+        body_y_start, body_y_end, body_x_start, body_x_end = self.bounds()
+        height, width = tiles.shape
+        y_from: int = max(body_y_start, y_start)
+        y_to: int = min(body_y_end, y_start + height)
+        x_from: int = max(body_x_start, x_start)
+        x_to: int = min(body_x_end, x_start + width)
+        if y_from >= y_to or x_from >= x_to:
+            return
+        xs: np.ndarray = np.arange(x_from, x_to, dtype=np.int32)[None, :]
+        terrain: np.ndarray = tiles["terrain"]
+        for band_start in range(y_from, y_to, PAINT_BAND_ROWS):
+            band_end: int = min(band_start + PAINT_BAND_ROWS, y_to)
+            ys: np.ndarray = np.arange(band_start, band_end, dtype=np.int32)[:, None]
+            window: np.ndarray = terrain[
+                band_start - y_start: band_end - y_start, x_from - x_start: x_to - x_start
+            ]
+            window[self.mask(ys, xs)] = WATER
+
+
+def _smooth_bridge(rng: np.random.RandomState, length: int, std: float) -> np.ndarray:
+    """A smoothed random walk starting and ending at zero (a Brownian bridge), with roughly
+    the given std around its middle."""
+    if length < 2:
+        return np.zeros(max(length, 1), dtype=np.float32)
+    walk: np.ndarray = np.cumsum(rng.normal(0., 2. * std / np.sqrt(length), length))
+    walk -= np.linspace(0., walk[-1], length)
+    kernel_size: int = max(1, length // 20)
+    kernel: np.ndarray = np.ones(kernel_size) / kernel_size
+    smoothed: np.ndarray = np.convolve(np.pad(walk, kernel_size, mode="edge"), kernel, mode="same")
+    smoothed = smoothed[kernel_size: kernel_size + length]
+    return (smoothed - np.linspace(smoothed[0], smoothed[-1], length)).astype(np.float32)
+
+
+def _harmonics(rng: np.random.RandomState, count: int, roughness: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Random amplitudes and phases of low-frequency harmonics (k = 2, 3, ...)."""
+    amplitudes: np.ndarray = rng.uniform(0., roughness, count) / np.arange(1, count + 1)
+    phases: np.ndarray = rng.uniform(0., 2 * np.pi, count)
+    return amplitudes, phases
+
+
+@dataclass
+class StraightRiver(WaterBody):
+    """A river between two opposite sides. Its centerline is a 1D array along the flowing
+    axis, so the mask is a single comparison per tile."""
+
+    vertical: bool  # flows from top to bottom if True, else from left to right
+    centerline: np.ndarray  # cross-axis position of the river center, per along-axis tile
+    half_width: float
+    map_shape: Tuple[int, int]
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        height, width = self.map_shape
+        low: int = max(0, int(np.floor(self.centerline.min() - self.half_width)))
+        high: int = int(np.ceil(self.centerline.max() + self.half_width)) + 1
+        if self.vertical:
+            return 0, height, low, min(high, width)
+        return low, min(high, height), 0, width
+
+    def mask(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        if self.vertical:
+            return np.abs(xs + 0.5 - self.centerline[ys]) < self.half_width
+        return np.abs(ys + 0.5 - self.centerline[xs]) < self.half_width
+
+
+@dataclass
+class BendingRiver(WaterBody):
+    """A river between two adjacent sides, bending around their shared corner. Tiles are
+    seen in polar coordinates around the corner, and the river centerline is a radius per
+    angle step (angle 0 along the horizontal side, pi/2 along the vertical side)."""
+
+    corner: Tuple[float, float]  # (x, y) of the shared corner, on tile edges
+    radii: np.ndarray  # radius of the river center, per angle step
+    half_width: float
+    map_shape: Tuple[int, int]
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        height, width = self.map_shape
+        reach: int = int(np.ceil(self.radii.max() + self.half_width)) + 1
+        corner_x, corner_y = self.corner
+        y_start: int = 0 if corner_y == 0 else max(0, height - reach)
+        x_start: int = 0 if corner_x == 0 else max(0, width - reach)
+        return y_start, min(y_start + reach, height), x_start, min(x_start + reach, width)
+
+    def mask(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        dx: np.ndarray = np.abs(xs.astype(np.float32) + 0.5 - self.corner[0])
+        dy: np.ndarray = np.abs(ys.astype(np.float32) + 0.5 - self.corner[1])
+        angle_steps: np.ndarray = np.arctan2(dy, dx) * np.float32((len(self.radii) - 1) / (np.pi / 2))
+        center: np.ndarray = self.radii[np.rint(angle_steps).astype(np.int32)]
+        return np.abs(np.hypot(dx, dy) - center) < self.half_width
+
+
+@dataclass
+class Seaside(WaterBody):
+    """Sea along one side of the map, with a bumpy coastline."""
+
+    side: str
+    depths: np.ndarray  # depth of sea measured from the side, per tile along the side
+    map_shape: Tuple[int, int]
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        height, width = self.map_shape
+        reach: int = int(np.ceil(self.depths.max())) + 1
+        if self.side == "left":
+            return 0, height, 0, min(reach, width)
+        if self.side == "right":
+            return 0, height, max(0, width - reach), width
+        if self.side == "top":
+            return 0, min(reach, height), 0, width
+        return max(0, height - reach), height, 0, width
+
+    def mask(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        height, width = self.map_shape
+        if self.side == "left":
+            return xs + 0.5 < self.depths[ys]
+        if self.side == "right":
+            return width - xs - 0.5 < self.depths[ys]
+        if self.side == "top":
+            return ys + 0.5 < self.depths[xs]
+        return height - ys - 0.5 < self.depths[xs]
+
+
+@dataclass
+class Lake(WaterBody):
+    """A single lake with a bumpy shore: radius(angle) = R * (1 + sum a_k cos(k * angle + p_k))."""
+
+    center: Tuple[float, float]  # (x, y)
+    radius: float
+    amplitudes: np.ndarray
+    phases: np.ndarray
+    map_shape: Tuple[int, int]
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        height, width = self.map_shape
+        reach: float = self.radius * (1 + self.amplitudes.sum()) + 1
+        x, y = self.center
+        return (
+            max(0, int(y - reach)), min(height, int(np.ceil(y + reach))),
+            max(0, int(x - reach)), min(width, int(np.ceil(x + reach))),
+        )
+
+    def mask(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        dx: np.ndarray = xs.astype(np.float32) + 0.5 - np.float32(self.center[0])
+        dy: np.ndarray = ys.astype(np.float32) + 0.5 - np.float32(self.center[1])
+        angles: np.ndarray = np.arctan2(dy, dx)
+        shore: np.ndarray = np.ones(np.broadcast_shapes(dx.shape, dy.shape), dtype=np.float32)
+        for k, (amplitude, phase) in enumerate(zip(self.amplitudes, self.phases), start=2):
+            shore += np.float32(amplitude) * np.cos(k * angles + np.float32(phase))
+        return np.hypot(dx, dy) < shore * np.float32(self.radius)
+
+
+def plan_river(
+    water_size: int,
+    map_shape: Tuple[int, int],
+    rng: np.random.RandomState,
+    side_offset: float = 0.,
+) -> WaterBody:
+    """Plan a river. A river starts at one of four sides of the map, travese to another side.
+    Its ends keep side_offset (ratio to side length) away from map corners."""
+    height, width = map_shape
+    start_side, end_side = rng.choice(SIDES, size=2, replace=False)
+    start_pos, end_pos = rng.uniform(side_offset, 1 - side_offset, size=2)
+
+    if {start_side, end_side} in ({"left", "right"}, {"top", "bottom"}):
+        vertical: bool = start_side in ("top", "bottom")
+        along, across = (height, width) if vertical else (width, height)
+        half_width: float = max(0.5, water_size / along / 2)
+        # straight line between both ends, plus meanders that vanish at both ends
+        centerline: np.ndarray = np.linspace(start_pos * across, end_pos * across, along, dtype=np.float32)
+        centerline += _smooth_bridge(rng, along, RIVER_MEANDER * across)
+        centerline = np.clip(centerline, half_width, across - half_width)
+        return StraightRiver(vertical, centerline, half_width, map_shape)
+
+    # adjacent sides share a corner; the river bends around it
+    horizontal_side, vertical_side = (start_side, end_side) if start_side in ("top", "bottom") \
+        else (end_side, start_side)
+    horizontal_pos, vertical_pos = (start_pos, end_pos) if start_side in ("top", "bottom") \
+        else (end_pos, start_pos)
+    corner: Tuple[float, float] = (
+        0. if vertical_side == "left" else float(width),
+        0. if horizontal_side == "top" else float(height),
+    )
+    # distances of both river ends from the shared corner
+    horizontal_radius: float = horizontal_pos * width
+    vertical_radius: float = vertical_pos * height
+    steps: int = max(2, int(np.pi / 2 * max(horizontal_radius, vertical_radius)))
+    radii: np.ndarray = np.linspace(horizontal_radius, vertical_radius, steps, dtype=np.float32)
+    radii += _smooth_bridge(rng, steps, RIVER_MEANDER * min(horizontal_radius, vertical_radius))
+    length: float = np.pi / 2 * float(radii.mean())
+    half_width = max(0.5, water_size / length / 2)
+    radii = np.maximum(radii, half_width)
+    return BendingRiver(corner, radii, half_width, map_shape)
+
+
+def plan_seaside(
+    water_size: int,
+    map_shape: Tuple[int, int],
+    rng: np.random.RandomState,
+) -> WaterBody:
+    """Plan a seaside. Takes up one of the four sides on map."""
+    height, width = map_shape
+    side: str = rng.choice(SIDES)
+    along, across = (height, width) if side in ("left", "right") else (width, height)
+    mean_depth: float = min(water_size / along, across)
+    # coastline bumps integrate to zero over the side, so the sea keeps its size
+    amplitudes, phases = _harmonics(rng, 4, SHORE_ROUGHNESS)
+    positions: np.ndarray = np.linspace(0., 2 * np.pi, along, endpoint=False)
+    depths: np.ndarray = np.ones(along, dtype=np.float32)
+    for k, (amplitude, phase) in enumerate(zip(amplitudes, phases), start=1):
+        depths += np.float32(amplitude) * np.cos(k * positions + phase).astype(np.float32)
+    return Seaside(side, depths * np.float32(mean_depth), map_shape)
+
+
+def plan_lake(
+    water_size: int,
+    map_shape: Tuple[int, int],
+    rng: np.random.RandomState,
+) -> WaterBody:
+    """Plan a lake, a single water body occupying about given water_size of tiles."""
+    height, width = map_shape
+    amplitudes, phases = _harmonics(rng, 4, SHORE_ROUGHNESS)
+    # area of the bumpy shape is pi * R^2 * (1 + sum(a_k^2) / 2)
+    radius: float = np.sqrt(water_size / (np.pi * (1 + (amplitudes ** 2).sum() / 2)))
+    reach: float = radius * (1 + amplitudes.sum())
+    # keep the whole lake inside the map when possible
+    x: float = rng.uniform(reach, width - reach) if 2 * reach < width else width / 2
+    y: float = rng.uniform(reach, height - reach) if 2 * reach < height else height / 2
+    return Lake((x, y), radius, amplitudes, phases, map_shape)
+
+
+def add_river(water_size: int, map: np.ndarray, rng: np.random.RandomState, side_offset: float = 0.):
+    """Add a river to the map. A river starts at one of four sides of the map, travese to another side
+    """
+    plan_river(water_size, map.shape, rng, side_offset).paint(map)
+
+
+def add_seaside(water_size: int, map: np.ndarray, rng: np.random.RandomState):
+    """Add a seaside to map. Takes up one of the four sides on map.
+    """
+    plan_seaside(water_size, map.shape, rng).paint(map)
+
+
+def add_lake(water_size: int, map: np.ndarray, rng: np.random.RandomState):
+    """Add a lake to the map, a single water body occupying given water_size of tiles.
+    """
+    plan_lake(water_size, map.shape, rng).paint(map)
+
+
+def plan_single_waterbody(
+    water_type: str,
+    water_size: int,
+    map_shape: Tuple[int, int],
+    rng: np.random.RandomState,
+    side_offset: float = 0.,
+) -> WaterBody:
+    """Plan a single type of waterbody, by calling corresponding water functions.
 
     Args
         water_type: type of water body to add.
-        water_size: size of water body, in mega pixel.
-        map: a pointer to map array.
+        water_size: size of water body, in number of tiles.
+        map_shape: (height, width) of the whole map.
         rng: RandomState instance that is used as RNG.
+        side_offset: rivers keep this ratio of side length away from map corners.
+
+    Returns
+        WaterBody or None: the planned water body, None for "no water".
     """
     if water_type == "no water":
-        return
+        return None
     if water_type == "river":
-        add_river(water_size, map, rng)
+        return plan_river(water_size, map_shape, rng, side_offset)
     elif water_type == "sea side":
-        add_seaside(water_size, map, rng)
+        return plan_seaside(water_size, map_shape, rng)
     elif water_type == "lake":
-        add_lake(water_size, map, rng)
+        return plan_lake(water_size, map_shape, rng)
     else:
         raise NotImplementedError(f"Unknown water type: {water_type}")
 
 
-def add_river(water_size: int, map: np.ndarray, rng: np.random.RandomState):
-    """Add a river to the map. A river starts at one of four sides of the map, travese to another side
-    """
-    width, height = map.shape
-    start_side, end_side = rng.choice(["left", "top", "right", "bottom"], size=2, replace=False)
-    
-    
-    # TODO
-    return
-
-def add_seaside(water_size: int, map: np.ndarray, rng: np.random.RandomState):
-    """Add a seaside to map. Takes up one of the four sides on map.
-    """
-    width, height = map.shape
-    # TODO
-    return
+def add_single_waterbody(water_type: str,
+                         water_size: int,
+                         map: np.ndarray,
+                         rng: np.random.RandomState,
+                         side_offset: float = 0.) -> WaterBody:
+    """Add a single type of waterbody to the map, by planning and then painting it.
 
-def add_lake(water_size: int, map: np.ndarray, rng: np.random.RandomState):
-    """Add a lake to the map, a single water body occupying given water_size of mega pixels.
+    Args
+        water_type: type of water body to add.
+        water_size: size of water body, in number of tiles.
+        map: a pointer to map array.
+        rng: RandomState instance that is used as RNG.
+        side_offset: rivers keep this ratio of side length away from map corners.
     """
-    width, height = map.shape
-    # TODO
-    return
\ No newline at end of file
+    water_body: WaterBody = plan_single_waterbody(water_type, water_size, map.shape, rng, side_offset)
+    if water_body is not None:
+        water_body.paint(map)
+    return water_body
@@ -1,46 +1,132 @@
 """All types of map generators are defined here.
 """
 import abc
+import os
 import re
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from colony.configs.map_generator.ref import GRASS, TREE, MOUNTAIN
 from colony.configs.map_generator.rule_loader import GreenMapRules, load_rules
-from colony.generators.map_element_gen.water_generator import add_single_waterbody
+from colony.generators.map_element_gen.noise import FractalNoise
+from colony.generators.map_element_gen.water_generator import WaterBody, plan_single_waterbody
+from colony.utils.tile_helpers import empty_tiles
+
+# bump whenever generated maps change for the same seed and rules, to invalidate map caches
+GENERATOR_VERSION: int = 3
+# side length of map tiles built at once (and in parallel), which bounds temporary memory
+BUILD_TILE_SIZE: int = 512
+# feature sizes of forests and mountain ranges, as ratios to the shorter map side
+WOOD_SCALE: float = 0.1
+MOUNTAIN_SCALE: float = 0.25
+MIN_NOISE_SCALE: float = 8.
+# max number of rows and columns of the map sampled to find noise thresholds
+THRESHOLD_SAMPLES: int = 512
 
 
 class GreenMapGenerator():
     """Generator for grass-based map.
     """
-    def __init__(self, seed: int = None, width: int = None, height: int = None):
+    def __init__(
+        self,
+        seed: int = None,
+        width: int = None,
+        height: int = None,
+        lazy: bool = False,
+        out: np.ndarray = None,
+        workers: int = None,
+    ):
         """
         Args
             seed: seed for this generator.
             world_cfg: use this pointer to access world infomration like size.
+            lazy: do not build the whole map; chunks are generated on demand by
+                generate_chunk() instead.
+            out: array (e.g. an np.memmap) to write the map into, instead of allocating one.
+            workers: number of threads building map tiles, all CPUs if not given. The map is
+                identical for any number of workers.
 
         """
+        self.seed = seed
         self.rng = np.random.RandomState(seed)
+        self.width: int = width
+        self.height: int = height
+        self.workers: int = workers if workers is not None else (os.cpu_count() or 1)
 
-        # map place holder
-        self.map = np.full(shape=(width, height), fill_value=101)
         # load map rules
         self.rules = load_rules("green")
 
-        # build the map by the rules
-        self._build_map()
+        # whole-map features are planned up front, so that chunks can paint them as well
+        self.water_bodies: List[WaterBody] = self._plan_waters()
+        shorter_side: int = min(width, height)
+        self.wood_noise: FractalNoise = FractalNoise(self.rng, max(MIN_NOISE_SCALE, WOOD_SCALE * shorter_side))
+        self.mountain_noise: FractalNoise = FractalNoise(
+            self.rng, max(MIN_NOISE_SCALE, MOUNTAIN_SCALE * shorter_side)
+        )
+        # noise levels above which grass turns into trees and mountains
+        self.wood_threshold: float = None
+        self.mountain_threshold: float = None
+        self._plan_thresholds()
+
+        # map place holder
+        self.map: np.ndarray = None
+        if not lazy:
+            if out is None:
+                self.map = empty_tiles((height, width))
+            else:
+                assert out.shape == (height, width), f"Output shape {out.shape} mismatches map size."
+                self.map = out
+                self.map["terrain"] = GRASS
+                self.map["structure"] = 0
+                self.map["tech"] = 0
+            # build the map by the rules
+            self._build_map()
 
     def _build_map(self):
-        """Build map by multiple steps with given rules.
+        """Build map tile by tile with given rules. Tiles are independent views into the map, so
+        they are built across a thread pool (NumPy releases the GIL on large array operations).
+        """
+        def build_tile(start: Tuple[int, int]):
+            y_start, x_start = start
+            self._build_window(
+                self.map[y_start: y_start + BUILD_TILE_SIZE, x_start: x_start + BUILD_TILE_SIZE],
+                y_start,
+                x_start,
+            )
+
+        tiles: List[Tuple[int, int]] = [
+            (y_start, x_start)
+            for y_start in range(0, self.height, BUILD_TILE_SIZE)
+            for x_start in range(0, self.width, BUILD_TILE_SIZE)
+        ]
+        if self.workers <= 1 or len(tiles) == 1:
+            for tile in tiles:
+                build_tile(tile)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # consume results so that exceptions in workers are raised here
+            list(pool.map(build_tile, tiles))
+
+    def _build_window(self, tiles: np.ndarray, y_start: int, x_start: int):
+        """Build a window of the map by multiple steps. Every step only depends on global tile
+        coordinates, so windows can be built in any order and join seamlessly.
+
+        Args
+            tiles: grass-filled layered tiles of the window, modified in place.
+            y_start: y of the upper left tile of the window on map.
+            x_start: x of the upper left tile of the window on map.
         """
         # add water bodies
-        self._add_waters()
+        self._add_waters(tiles, y_start, x_start)
 
         # add vegies
-        self._add_vegies()
+        self._add_vegies(tiles, y_start, x_start)
 
         # add solids
-        self._add_solids()
+        self._add_solids(tiles, y_start, x_start)
 
-    def _add_waters(self):
-        """Add water bodies to the map. First roll what types of water to add and then add them.
+    def _plan_waters(self) -> List[WaterBody]:
+        """Plan water bodies of the map. First roll what types of water to add and then plan them.
         """
         # roll water types with pre-defined possibilities of each type
         water_types, water_type_p = zip(*self.rules.water_types.items())
@@ -60,7 +146,7 @@ class GreenMapGenerator():
             reroll += 2
 
         while reroll and \
-            (water_size) * len(waters_to_add) <= self.rules.water_upper_limit:  # only if there is not too much water
+            (water_size) * (len(waters_to_add) + 1) <= self.rules.water_upper_limit:  # only if there is not too much water
 
             water_type = self.rng.choice(water_types, p=water_type_p)
             if water_type == "multiple":
@@ -69,16 +155,91 @@ class GreenMapGenerator():
                 waters_to_add.append(water_type)
                 reroll -= 1
 
-        # add those rolled water bodies one by one
+        # plan those rolled water bodies one by one
+        water_bodies: List[WaterBody] = []
         for water in waters_to_add:
             print(f'water {water} rolled')
-            add_single_waterbody(water, int(water_size * self.map.size), self.map, self.rng)  # water size in mega pixel
+            water_body: WaterBody = plan_single_waterbody(
+                water,
+                int(water_size * self.width * self.height),  # water size in tiles
+                (self.height, self.width),
+                self.rng,
+                side_offset=self.rules.river_side_offset,
+            )
+            if water_body is not None:
+                water_bodies.append(water_body)
+        return water_bodies
+
+    def _plan_thresholds(self):
+        """Find noise thresholds giving wood_percentage of trees and mountain_percentage of
+        mountains. Noise is thresholded at its quantiles on a strided sample of the map, with
+        water painted first, since trees and mountains only grow on grass.
+        """
+        ys: np.ndarray = np.unique(np.linspace(0, self.height - 1, min(self.height, THRESHOLD_SAMPLES)).astype(int))
+        xs: np.ndarray = np.unique(np.linspace(0, self.width - 1, min(self.width, THRESHOLD_SAMPLES)).astype(int))
+        grass: np.ndarray = np.ones((len(ys), len(xs)), dtype=bool)
+        for water_body in self.water_bodies:
+            grass &= ~water_body.mask(ys[:, None], xs[None, :])
+
+        wood: np.ndarray = self.wood_noise.sample(ys, xs)
+        self.wood_threshold = self._quantile_threshold(wood[grass], self.rules.wood_percentage * grass.size)
+        grass &= wood < self.wood_threshold
+
+        mountain: np.ndarray = self.mountain_noise.sample(ys, xs)
+        self.mountain_threshold = self._quantile_threshold(
+            mountain[grass], self.rules.mountain_percentage * grass.size
+        )
+
+    @staticmethod
+    def _quantile_threshold(values: np.ndarray, count: float) -> float:
+        """Threshold so that about count of values are greater or equal to it."""
+        count = int(round(count))
+        if count <= 0:
+            return np.inf
+        if count >= len(values):
+            return -np.inf
+        return float(np.partition(values, len(values) - count)[len(values) - count])
+
+    def _add_waters(self, tiles: np.ndarray, y_start: int, x_start: int):
+        """Paint planned water bodies onto a window of the map.
+        """
+        for water_body in self.water_bodies:
+            water_body.paint(tiles, y_start, x_start)
+
+    def _add_vegies(self, tiles: np.ndarray, y_start: int, x_start: int):
+        """Grow trees on grass where wood noise is high.
+        """
+        height, width = tiles.shape
+        terrain: np.ndarray = tiles["terrain"]
+        wood: np.ndarray = self.wood_noise.window(y_start, x_start, height, width)
+        terrain[(terrain == GRASS) & (wood >= self.wood_threshold)] = TREE
+
+    def _add_solids(self, tiles: np.ndarray, y_start: int, x_start: int):
+        """Raise mountains on grass where mountain noise is high.
+        """
+        height, width = tiles.shape
+        terrain: np.ndarray = tiles["terrain"]
+        mountain: np.ndarray = self.mountain_noise.window(y_start, x_start, height, width)
+        terrain[(terrain == GRASS) & (mountain >= self.mountain_threshold)] = MOUNTAIN
+
+    def generate_chunk(self, chunk: Tuple[int, int], chunk_size: int) -> np.ndarray:
+        """Generate a single chunk of the map. The result only depends on the seed and chunk
+        coordinates, so a chunk may be dropped and generated again at any time.
 
-    def _add_vegies(self):
-        return
-    
-    def _add_solids(self):
-        return
+        Args
+            chunk: (chunk_x, chunk_y) coordinates of the chunk.
+            chunk_size: side length of a chunk in tiles; edge chunks are clipped to map size.
+        """
+        cx, cy = chunk
+        x_start: int = cx * chunk_size
+        y_start: int = cy * chunk_size
+        assert 0 <= x_start < self.width and 0 <= y_start < self.height, f"Chunk {chunk} out of map."
+        chunk_map: np.ndarray = empty_tiles(
+            (min(chunk_size, self.height - y_start), min(chunk_size, self.width - x_start))
+        )
+        # features are placed in global tile coordinates, so chunks join seamlessly
+        self._build_window(chunk_map, y_start, x_start)
+        return chunk_map
 
     def get_bitmap(self):
         """Return the bitmap of generated map.
@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import os
 import sys
 import tqdm
 
@@ -7,15 +6,22 @@ import cv2
 
 from colony.characters.colony import Colony
 from colony.utils.image_manager import ImageManager
+from colony.vis.frame_pacer import FramePacer
+from colony.vis.frame_sink import FrameSink
+from colony.vis.pipeline import PipelinedRunner
 from colony.vis.step_visulizer import StepVisulizer
 from colony.configuration import world_cfg, res_cfg
 
 
-target_folder: str = "/Users/frank/Projects/ColonySim/frames"
+# dump mode output; frames go to a folder of the same name if no video encoder is available
+target_video: str = "colony.mp4"
+target_fps: int = 24
 target_frame: int = 24 * 80
 
 # auto progression frames per second
 auto_speed: int = 10
+# auto progression simulation steps per second; several steps are run per frame if higher
+auto_tick_rate: float = 10
 FAST_FORWARD: int = 0
 
 
@@ -33,6 +39,10 @@ DEFAULT_TILE_SET: str = "space"
 
 SEED: int = 720
 
+# dump and autoplay modes run simulation and rendering in separate processes if positive,
+# with this many render processes
+RENDER_WORKERS: int = 0
+
 
 if __name__ == '__main__':
 
@@ -40,6 +50,29 @@ if __name__ == '__main__':
     #mode = 'dump'
     mode = 'autoplay'
 
+    if RENDER_WORKERS > 0 and mode in ("dump", "autoplay"):
+        runner: PipelinedRunner = PipelinedRunner(
+            colony_kwargs=dict(viewer_width=VX, viewer_height=VY, init_pop=INIT_POP, seed=SEED, verbose=False),
+            painter_style=PAINTER_STYLE,
+            tile_set=DEFAULT_TILE_SET,
+            render_workers=RENDER_WORKERS,
+            max_steps=target_frame if mode == "dump" else None,
+        )
+        if mode == "dump":
+            # frames are views into shared memory, reused once the next one is requested
+            with FrameSink(target_video, fps=target_fps, background=False) as sink:
+                for single_frame in tqdm.tqdm(runner.frames(), total=target_frame + 1):
+                    sink.write(single_frame)
+        else:
+            # one frame per step here, so only frames are paced
+            pacer: FramePacer = FramePacer(tick_rate=auto_speed, fps=auto_speed)
+            for single_frame in runner.frames():
+                cv2.imshow(WINDOW_NAME, single_frame)
+                if cv2.waitKey(pacer.wait_ms()) > 0:
+                    break
+            cv2.destroyAllWindows()
+        sys.exit()
+
     # create image manager (image assets related)
     image_manager: ImageManager = ImageManager(
         set_name=DEFAULT_TILE_SET,
@@ -80,38 +113,39 @@ if __name__ == '__main__':
                 break
         cv2.destroyAllWindows()
 
-    # generate each step as a frame and save these images
+    # generate each step as a frame and encode them into a video
     elif mode == "dump":
-        frame = 0
-        for frame in tqdm.tqdm(range(target_frame)):
-            cycle_counter += 1        
-            colony_survived = chicken_col.progress_a_step()
-            chicken_col.printer.print_info()
-            single_frame = visualizer.plot_step()
-
-            out_name = os.path.join(target_folder, '%05d.png' % frame)
-            cv2.imwrite(out_name, single_frame)
-            if not colony_survived:
-                break
-        print("Frames generated, converting it to video...")
-        # ffmpeg -r 24 -i %05d.png -vcodec mpeg4 -y colony.mp4
-        #os.system(f"ffmpeg -r 24 -i {target_folder}/%05d.png -vcodec mpeg4 -y colony.mp4")
+        # frames are encoded on a background thread while the colony keeps going
+        with FrameSink(target_video, fps=target_fps) as sink:
+            for frame in tqdm.tqdm(range(target_frame)):
+                cycle_counter += 1
+                colony_survived = chicken_col.progress_a_step()
+                chicken_col.printer.print_info()
+                sink.write(visualizer.plot_step())  # a new array every step, no copy needed
+                if not colony_survived:
+                    break
+            print("Frames generated, finishing video...")
 
     # auto progression
     elif mode == "autoplay":
-        interval = int(1 / auto_speed * 1000)
-        while True:
-            cycle_counter += 1
-            
-            colony_survived = chicken_col.progress_a_step()
-            chicken_col.printer.print_info()
-            single_frame = visualizer.plot_step()
-            cv2.imshow(WINDOW_NAME, single_frame)
-            key = cv2.waitKey(interval)  # this one controlls time interval
+        # simulation keeps its tick rate and frames their frame rate, whatever each costs
+        pacer: FramePacer = FramePacer(tick_rate=auto_tick_rate, fps=auto_speed)
+        cv2.imshow(WINDOW_NAME, single_frame)
+        colony_survived = True
+        while colony_survived:
+            ticks: int = pacer.ticks_due()
+            for _ in range(ticks):
+                cycle_counter += 1
+                colony_survived = chicken_col.progress_a_step()
+                chicken_col.printer.print_info()
+                if not colony_survived:
+                    break
+            if ticks:  # nothing new to show otherwise
+                single_frame = visualizer.plot_step()
+                cv2.imshow(WINDOW_NAME, single_frame)
+            key = cv2.waitKey(pacer.wait_ms())  # compute time is already taken off
             if key > 0:
-                cv2.destroyAllWindows()
-                break
-            if not colony_survived:
                 break
+        cv2.destroyAllWindows()
     else:
         raise NotImplementedError()
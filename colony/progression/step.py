@@ -2,7 +2,7 @@ from typing import Tuple
 import numpy as np
 #from colony.characters.spore import Spore
 
-from colony.configuration import spore_cfg
+from colony import configuration
 from colony.utils.cooridinate_helper import validate_coor
 
 
@@ -71,7 +71,7 @@ def determine_event(sex_a: int, sex_b: int):
 #         return [True, True], 0
 
 #     elif event_code == 1: # fight
-#         fatality = spore_cfg.duel_fatality
+#         fatality = configuration.spore_cfg.duel_fatality
 #         probs = np.random.random(2)
 #         a_survives = True
 #         b_survices = True 
@@ -84,7 +84,7 @@ def determine_event(sex_a: int, sex_b: int):
 #     elif event_code == 2: # proliforate 
 #         probs = np.random.random()
 #         new_born = 0
-#         if probs <= spore_cfg.one_night_chance:
+#         if probs <= configuration.spore_cfg.one_night_chance:
 #             new_born += 1
 #         return [True, True], new_born
 
@@ -2,7 +2,7 @@
 from typing import Tuple
 import numpy as np
 from typing import Dict, List, Tuple, Set
-from colony.configs.map_generator.ref import BUILDABLE, PASSABLE
+from colony.utils.tile_helpers import is_buildable, is_passable
 from colony.characters.terrain import TerrainManager
 
 STD_MOVEMENTS: List[Tuple[int, int]] = [(1, 0), (-1, 0), (0, 1), (0, -1)]
@@ -25,7 +25,7 @@ def validate_coor(
     # first level check if coor is inside map
     if x_low <= x < x_high and y_low <= y < y_high:
         # check if this tile is occupied by terrain
-        if not bitmap[y][x] in PASSABLE:
+        if not is_passable(bitmap[y, x]):
             return False
         # then check if this tile is occupied by other spores
         if not spore_overlapping and coor in step:
@@ -115,7 +115,7 @@ class LocationFinder:
         self.building_step = building_step
     
     def update_steps(self, combined_step, building_step):
-        self.combind_step = combined_step
+        self.combined_step = combined_step
         self.building_step = building_step
 
     def get_random_coor_naive(self) -> Tuple[int, int]:
@@ -123,12 +123,21 @@ class LocationFinder:
         x: int = self.rng.randint(low=0, high=self.width)
         y: int = self.rng.randint(low=0, high=self.height)
         return x, y
-    
+
+    def get_searchable_chunks(self) -> List[Tuple[int, int]]:
+        """Chunks to search for free tiles. Only active (populated) chunks are searched, so
+        the cost follows the colony's size rather than the map's. An empty colony falls
+        back to all chunks."""
+        chunks: List[Tuple[int, int]] = self.terrain_man.chunks.active_chunks()
+        if not chunks:
+            chunks = list(self.terrain_man.chunks.all_chunks())
+        return chunks
+
     def get_random_coor(self) -> Tuple[int, int]:
         """
         Roll a pair of coor from unoccupied tiles.
-        We first find all available tiles and cache them into a class variable,
-        and then randomly choose one. If that one doesn't work (like 2x1 buildings),
+        We first find all available tiles in searchable chunks and cache them into a class
+        variable, and then randomly choose one. If that one doesn't work (like 2x1 buildings),
         this function will be called again until we exhaust all options.
 
         Returns
@@ -142,22 +151,27 @@ class LocationFinder:
             if self.available_tiles_generated:  # case 2
                 return None
             # case 1
-            for x in range(self.width):
-                for y in range(self.height):
-                    coor: Tuple[int, int] = (x, y)
-                    if coor not in self.combined_step and \
-                        coor not in self.building_step:
-                        self.available_tiles.append(coor)
+            for chunk in self.get_searchable_chunks():
+                x_start, y_start, x_end, y_end = self.terrain_man.chunks.chunk_bounds(chunk)
+                for x in range(x_start, x_end):
+                    for y in range(y_start, y_end):
+                        coor: Tuple[int, int] = (x, y)
+                        if coor not in self.combined_step and \
+                            coor not in self.building_step:
+                            self.available_tiles.append(coor)
             self.rng.shuffle(self.available_tiles)
             self.available_tiles_generated = True
         # return a random index in cache
-        return self.available_tiles.pop()
+        return self.available_tiles.pop() if self.available_tiles else None
 
     def tile_buildable(self, loc: Tuple[int, int]) -> bool:
         """Checks if the given location is buildable. First checks if there are exisiting spores
-        on this tile, and then checks if the terrain allows."""
+        on this tile, and then checks if the terrain allows. Footprints may cross chunk borders,
+        so only map borders are checked here."""
+        if not (0 <= loc[0] < self.width and 0 <= loc[1] < self.height):
+            return False
         if (loc not in self.combined_step) and \
-            (self.terrain_man.bitmap[loc[1]][loc[0]] in BUILDABLE):
+            is_buildable(self.terrain_man.bitmap[loc[1], loc[0]]):
             return True
         return False
 
@@ -0,0 +1,75 @@
+"""Small helpers for on-disk caches shared across runs and processes.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Callable, List
+
+
+# root of all caches; can be moved with the COLONY_CACHE_DIR environment variable
+CACHE_ROOT: Path = Path(
+    os.environ.get("COLONY_CACHE_DIR", Path.home().joinpath(".cache", "colony"))
+)
+
+
+def cache_key(*parts: Any) -> str:
+    """Hash any number of key parts into a short hex string. Bytes are hashed as they are,
+    anything else by its repr."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else repr(part).encode())
+        hasher.update(b"\0")  # separator, so that ("ab", "c") differs from ("a", "bc")
+    return hasher.hexdigest()
+
+
+def cache_folder(category: str) -> Path:
+    """Get folder of a cache category, creating it if needed."""
+    folder: Path = CACHE_ROOT.joinpath(category)
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+def cache_path(category: str, key: str, suffix: str) -> Path:
+    """Get file path of a cache entry, creating its category folder if needed."""
+    return cache_folder(category).joinpath(key + suffix)
+
+
+def write_atomic(path: Path, writer: Callable[[Path], None]):
+    """Let writer() produce a temporary file next to path and move it in place afterwards,
+    so that concurrent processes never see a half-written cache entry."""
+    temp_path: Path = path.with_name(f"{path.stem}.{os.getpid()}.tmp{path.suffix}")
+    try:
+        writer(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def mark_used(path: Path):
+    """Record that a cache entry was just read, so that prune_cache() keeps it longer."""
+    try:
+        os.utime(path)
+    except OSError:  # removed by another process meanwhile
+        pass
+
+
+def prune_cache(category: str, max_bytes: int):
+    """Delete least recently used entries of a category until it takes at most max_bytes.
+    Entries are ordered by modification time, which writes and mark_used() refresh."""
+    entries: List[os.DirEntry] = []
+    with os.scandir(cache_folder(category)) as scanner:
+        for entry in scanner:
+            # skip entries still being written by write_atomic()
+            if entry.is_file() and ".tmp" not in entry.name:
+                entries.append(entry)
+    stats: List[os.stat_result] = [entry.stat() for entry in entries]
+    total: int = sum(stat.st_size for stat in stats)
+    for entry, stat in sorted(zip(entries, stats), key=lambda pair: pair[1].st_mtime_ns):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            continue
+        total -= stat.st_size
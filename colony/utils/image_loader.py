@@ -1,14 +1,22 @@
 """Loads image assets from the disk and perform necessary processing.
 """
+import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import cv2
 
+from colony.utils.sprite_atlas import atlas_key, load_atlas, save_atlas
+
 
 ASSET_FOLDER = Path(__file__).parent.joinpath("../assets")
+# processed structure images are packed into an atlas on disk and mapped by later runs
+CACHE_ATLASES: bool = True
+# threads decoding image files; cv2 releases the GIL while decoding
+DECODE_WORKERS: int = min(8, os.cpu_count() or 1)
 
 
 @dataclass
@@ -18,8 +26,9 @@ class ImageLoader:
         name: Name of tileset; can be different from its folder name.
         asset_root: Relative path to tileset folder.
         structure: files used for game structural-buildings.
-        surface: files used as floor tiles.
+        surface: files used as floor tiles; decoded on first get_surface_images().
         raw_image_set: Points to an ImageSet instance holding raw resolution images.
+        surface_images: Decoded floor tiles, by surface kind.
 
     """
     name: str
@@ -27,25 +36,58 @@ class ImageLoader:
     structure: Dict[str, Dict[str, str]]
     surface: Optional[Dict[str, List[Path]]] = field(default_factory=lambda: {})
     raw_image_set: Dict[int, Dict[str, Dict[str, Any]]] = field(default_factory=lambda: {})
+    surface_images: Dict[str, List[np.ndarray]] = field(default_factory=lambda: {}, init=False, repr=False)
 
     def __post_init__(self):
         """Formating and check data correctness."""
         assert self.name, "Make sure name is not empty."
         self.asset_root = Path(self.asset_root)
+        # structure images are mapped from an atlas if one was built for the same files
+        key: Optional[str] = None
+        atlas: Optional[Dict[int, Dict[str, Any]]] = None
+        if CACHE_ATLASES:
+            key = atlas_key(ASSET_FOLDER.joinpath(self.asset_root), self.structure)
+            atlas = load_atlas(key)
+        if atlas is not None:
+            self.raw_image_set = atlas
+        else:
+            self._load_structures()
+            if key is not None:
+                save_atlas(key, self.raw_image_set)
+        for k, v in self.surface.items():
+            self.surface[k] = [Path(p) for p in v]
+        
+    def _load_structures(self):
+        """Decode structure images from disk."""
+        entries: List[Tuple[str, Path, List[Tuple[int]], int]] = [
+            (image_name, *self.unpack_path_size_type(v)) for image_name, v in self.structure.items()
+        ]
+        decoded: List[List[np.ndarray]] = self.load_images_from_disk(
+            [(path, len(sizes)) for _, path, sizes, _ in entries]
+        )
         # load and dump raw image arrays to an ImageSet instance
-        for image_name, v in self.structure.items():
-            path, sizes, type = self.unpack_path_size_type(v)
-            images: List[np.ndarray] = self.load_image_from_disk(
-                asset_path=path, split=len(sizes)
-            )
+        for (image_name, path, sizes, type), images in zip(entries, decoded):
             self.raw_image_set[type] = {
                 "name": image_name,
                 "images": images,
                 "sizes": sizes
             }
-        for k, v in self.surface.items():
-            self.surface[k] = [Path(p) for p in v]
-        
+
+    def get_surface_images(self, kind: str) -> List[np.ndarray]:
+        """Floor tiles of a surface kind (e.g. "ground"), decoded when first requested."""
+        if kind not in self.surface_images:
+            self.surface_images[kind] = [
+                images[0] for images in self.load_images_from_disk([(path, 1) for path in self.surface[kind]])
+            ]
+        return self.surface_images[kind]
+
+    def load_images_from_disk(self, jobs: List[Tuple[Path, int]]) -> List[List[np.ndarray]]:
+        """load_image_from_disk() of (asset_path, split) jobs over a thread pool, in order."""
+        if len(jobs) <= 1 or DECODE_WORKERS <= 1:
+            return [self.load_image_from_disk(path, split) for path, split in jobs]
+        with ThreadPoolExecutor(max_workers=min(DECODE_WORKERS, len(jobs))) as pool:
+            return list(pool.map(lambda job: self.load_image_from_disk(*job), jobs))
+
     @staticmethod
     def unpack_path_size_type(prop_set: Dict[str, Any]) -> Tuple[Path, List[Tuple[int]], int]:
         """Unpack image path, sub-image orientation and sizes
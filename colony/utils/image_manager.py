@@ -1,9 +1,11 @@
 """Intermediate interface connecting plotting modules and assets on disk.
 """
 
+import time
 import numpy as np
+from collections import Counter, OrderedDict
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import yaml
 
 import cv2
@@ -14,6 +16,70 @@ AVAILABLE_TILESETS: Dict[str, str] = {
     "space": "Isometric_Space_Colony"
 }
 PRESIZING_STEP: float = 0.1
+# mip chains of raw images stop at this width
+MIP_MIN_WIDTH: int = 8
+# memory kept for scaled images and sprites, in bytes; widths in use may go beyond it
+DEFAULT_CACHE_BUDGET: int = 256 * 1024 ** 2
+
+
+@dataclass
+class Sprite:
+    """A scaled image prepared for compositing. Color is premultiplied by alpha, so painting
+    is frame * inverse_alpha / 255 + premultiplied, without looking at alpha per pixel again.
+
+    Attributes
+        image: The BGRA image it was made from.
+        premultiplied: BGR color times alpha / 255, uint8.
+        inverse_alpha: 255 - alpha, repeated on three channels, uint8.
+    """
+    image: np.ndarray
+    premultiplied: np.ndarray = field(init=False, repr=False)
+    inverse_alpha: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.image.shape[-1] == 3:  # no alpha, fully opaque
+            alpha: np.ndarray = np.full(self.image.shape[:2] + (1,), 255, dtype=np.uint16)
+        else:
+            alpha = self.image[:, :, 3:].astype(np.uint16)
+        color: np.ndarray = self.image[:, :, :3].astype(np.uint16)
+        self.premultiplied = ((color * alpha + 127) // 255).astype(np.uint8)
+        self.inverse_alpha = np.repeat(255 - alpha, 3, axis=2).astype(np.uint8)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.image.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held besides the image."""
+        return self.premultiplied.nbytes + self.inverse_alpha.nbytes
+
+    def blend(self, region: np.ndarray, y_start: int = 0, x_start: int = 0):
+        """Composite the sprite onto a BGR region in place. The region may be smaller than the
+        sprite, when the sprite is clipped; (y_start, x_start) is where it starts on the sprite.
+        """
+        height, width = region.shape[:2]
+        crop: Tuple[slice, slice] = (slice(y_start, y_start + height), slice(x_start, x_start + width))
+        cv2.multiply(region, self.inverse_alpha[crop], dst=region, scale=1 / 255)
+        cv2.add(region, self.premultiplied[crop], dst=region)
+
+
+@dataclass
+class ScaledImages:
+    """Images of a building type scaled to one tile width, and sprites made from them when
+    first requested."""
+    images: List[np.ndarray]
+    sprites: List[Optional[Sprite]]
+    nbytes: int
+
+
+@dataclass
+class CacheStats:
+    """Counters of the scaled image cache of ImageManager."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    nbytes: int = 0
 
 
 def get_tileset_yaml(set_name: str):
@@ -32,25 +98,37 @@ class ImageManager:
         self, 
         set_name: str,
         seed: int = 720,
-        pre_sizing: Tuple[float, float, float] = [0.8, 2, 0.1]):
+        pre_sizing: Optional[Tuple[float, float, float]] = None,
+        cache_budget: int = DEFAULT_CACHE_BUDGET):
         """
-        The 
+        Images are scaled to a tile width when first requested, and kept in a cache of
+        cache_budget bytes that drops least recently used images first. Widths pinned with
+        pin() are never dropped.
 
         Args
             set_name: Short name of tileset so that it can load assets from disk. 
             seed: Controls random choosing operations (like random orientation of a tile).
-            tile_width: Width of a tile in pixel size. Essential for resizing.
             pre_sizing: Pre-caching resized tiles, format is (min, max, step), inclusively
-                and step is of 0.1. This may be buggy due to np.arange results.
+                and step is of 0.1. This may be buggy due to np.arange results. None to
+                resize only on request.
+            cache_budget: Bytes kept for scaled images and sprites.
         """
         self.seed = seed
         self.rng = np.random.RandomState(seed)
         self.set_name: str = set_name
         self.tile_width: int = None
         self.pre_sizing: Tuple[float, float, float] = pre_sizing
-        # stores images in various resolutions; key mega tile width in px; 0 is raw size
-        # other zooming levels will be saved to different keys.
-        self.cache: Dict[int, Any] = {0: {}}
+        # images as loaded, by building type
+        self.raw_images: Dict[int, List[np.ndarray]] = {}
+        # mip chain of each raw image, by building type: the image, then halvings of it
+        self.mipmaps: Dict[int, List[List[np.ndarray]]] = {}
+        # scaled images by (mega tile width in px, building type), least recently used first;
+        # width 0 is raw size
+        self.cache: "OrderedDict[Tuple[int, int], ScaledImages]" = OrderedDict()
+        self.cache_budget: int = cache_budget
+        self.stats: CacheStats = CacheStats()
+        # widths in use and how many users each has; never dropped from cache
+        self.pinned: Counter = Counter()
         # stores how many x and y mega pixels each image occupies
         self.sizes: Dict[int, List[Tuple(int, int)]] = {}
         # stores names of buildings
@@ -60,11 +138,12 @@ class ImageManager:
         assert self.tile_width is None, "prepare_tileset(tile_width) function should be only executed once."
         self.tile_width = tile_width
         print("Loading assets...", end='')
+        start: float = time.perf_counter()
         # image loader to read images from the disk
         self.loader: ImageLoader = ImageLoader(**get_tileset_yaml(self.set_name))
         self._unpack_raw_tileset()
         self._prescale(self.tile_width, self.pre_sizing)
-        print('Done')
+        print(f"Done in {time.perf_counter() - start:.2f}s")
 
     def _unpack_raw_tileset(self):
         """Load raw tileset and add their image arrays as well as sizes to internal storage."""
@@ -74,10 +153,13 @@ class ImageManager:
             images: List[Tuple[int, int]] = tile_dict["images"]
             building_name: str = tile_dict["name"]
             self.sizes[tile_name] = sizes
-            self.cache[0][tile_name] = images
+            self.raw_images[tile_name] = images
+            self.mipmaps[tile_name] = [ImageManager.build_mip_chain(image) for image in images]
             self.building_names[tile_name] = building_name
 
-    def _prescale(self, tile_width: int, re_sizing: Tuple[float, float, float]):
+    def _prescale(self, tile_width: int, re_sizing: Optional[Tuple[float, float, float]]):
+        if re_sizing is None:
+            return
         if tile_width <= 0:
             print("No tile width information, not rescaling...", end='')
             return
@@ -97,6 +179,26 @@ class ImageManager:
         org_ratio: float = org_h / org_w
         return cv2.resize(image, (width, int(width * org_ratio)))
 
+    @staticmethod
+    def build_mip_chain(image: np.ndarray) -> List[np.ndarray]:
+        """The image followed by its halvings down to MIP_MIN_WIDTH, averaged by INTER_AREA."""
+        chain: List[np.ndarray] = [image]
+        while chain[-1].shape[1] // 2 >= MIP_MIN_WIDTH:
+            height, width = chain[-1].shape[:2]
+            chain.append(cv2.resize(chain[-1], (width // 2, max(height // 2, 1)), interpolation=cv2.INTER_AREA))
+        return chain
+
+    @staticmethod
+    def resize_from_mip_chain(chain: List[np.ndarray], width: int) -> np.ndarray:
+        """Resize the first image of a mip chain to width, retaining its aspect ratio, starting
+        from the smallest level not narrower than width."""
+        org_h, org_w = chain[0].shape[:2]
+        size: Tuple[int, int] = (width, int(width * org_h / org_w))
+        for level in reversed(chain):
+            if level.shape[1] >= width:
+                return cv2.resize(level, size, interpolation=cv2.INTER_AREA)
+        return cv2.resize(chain[0], size)  # enlarging
+
     def load_new_set(self, set_name: str, reset_rng: bool = True):
         """Load a new tileset.
         Not fully implemented"""
@@ -107,21 +209,65 @@ class ImageManager:
 
     def rescale_tile_set(self, target_width: int):
         """Resize tileset to specified size."""
-        if target_width in self.cache:  # size already exists
-            return
         assert isinstance(target_width, int), f"Use int as width to resize tileset, not {type(target_width)}"
-        
-        # setup new scaling dict
-        self.cache[target_width] = {}  # Dict[int, List[np.ndarray]]
-        # unpack raw image set
-        for tile_code, org_images in self.cache[0].items():  # 0 is key for raw set
-            # resize each original tile image
-            resized: List[np.ndarray] = []
-            sizes = self.sizes[tile_code]
-            for image, size in zip(org_images, sizes):
-                new_width: int = int(target_width * (1 + (max(size) - 1) * 0.5))
-                resized.append(ImageManager.resize_image_by_width(image, new_width))
-            self.cache[target_width][tile_code] = resized
+        for tile_code in self.raw_images:
+            self._scaled(tile_code, target_width)
+
+    def pin(self, width: int):
+        """Keep images of a tile width cached while it is in use, until unpin(width)."""
+        self.pinned[width] += 1
+
+    def unpin(self, width: int):
+        self.pinned[width] -= 1
+        if self.pinned[width] <= 0:
+            del self.pinned[width]
+            self._evict()
+
+    def _scaled(self, building_type: int, width: int) -> ScaledImages:
+        """Images of a building type at a tile width, scaled now if not cached."""
+        key: Tuple[int, int] = (width, building_type)
+        scaled: Optional[ScaledImages] = self.cache.get(key)
+        if scaled is not None:
+            self.stats.hits += 1
+            self.cache.move_to_end(key)
+            return scaled
+
+        self.stats.misses += 1
+        org_images: List[np.ndarray] = self.raw_images[building_type]
+        if width == 0:  # raw images are kept anyway and not counted
+            images: List[np.ndarray] = org_images
+            nbytes: int = 0
+        else:
+            images = []
+            for chain, size in zip(self.mipmaps[building_type], self.sizes[building_type]):
+                new_width: int = int(width * (1 + (max(size) - 1) * 0.5))
+                images.append(ImageManager.resize_from_mip_chain(chain, new_width))
+            nbytes = sum(image.nbytes for image in images)
+        scaled = ScaledImages(images=images, sprites=[None] * len(images), nbytes=0)
+        self.cache[key] = scaled
+        self._add_bytes(key, scaled, nbytes)
+        return scaled
+
+    def _add_bytes(self, key: Tuple[int, int], scaled: ScaledImages, nbytes: int):
+        """Count bytes added to a cache entry, unless the entry was evicted meanwhile; its
+        images then only live as long as callers keep them."""
+        if self.cache.get(key) is not scaled:
+            return
+        scaled.nbytes += nbytes
+        self.stats.nbytes += nbytes
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used images of widths not pinned until within budget."""
+        if self.stats.nbytes <= self.cache_budget:
+            return
+        for key in list(self.cache):
+            if self.stats.nbytes <= self.cache_budget:
+                break
+            if key[0] in self.pinned:
+                continue
+            self.stats.nbytes -= self.cache.pop(key).nbytes
+            self.stats.evictions += 1
 
     def get_tile_orientation(self, building_type: int, orientation: int = None):
         """Get tile oirentation. If an orientation is parsed, then check if this orientation is
@@ -145,12 +291,24 @@ class ImageManager:
                 returned.
         """
         assert self.tile_width is not None, "Run prepare_tileset(tile_width) first."
-        if not width in self.cache:
-            self.rescale_tile_set(width)
-        
-        tile_images: List[np.ndarray] = self.cache[width][building_type]
+        tile_images: List[np.ndarray] = self._scaled(building_type, width).images
         image_index: int = index if (index is not None) else self.rng.choice(len(tile_images))
         image_array: np.ndarray = tile_images[image_index]
         image_size: Tuple[int, int] = self.sizes[building_type][image_index]
 
         return image_array, image_size
+
+    def get_tile_sprite(self, building_type: int, width: int, index: int = None) -> Tuple[Sprite, Tuple[int, int]]:
+        """Same as get_tile_image(), but returns the image as a Sprite ready for compositing.
+        Sprites are cached with their images, so each scaled image is prepared only once.
+        """
+        assert self.tile_width is not None, "Run prepare_tileset(tile_width) first."
+        scaled: ScaledImages = self._scaled(building_type, width)
+        image_index: int = index if (index is not None) else self.rng.choice(len(scaled.images))
+        sprites: List[Optional[Sprite]] = scaled.sprites
+        if sprites[image_index] is None:
+            sprites[image_index] = Sprite(scaled.images[image_index])
+            self._add_bytes((width, building_type), scaled, sprites[image_index].nbytes)
+        image_size: Tuple[int, int] = self.sizes[building_type][image_index]
+
+        return sprites[image_index], image_size
@@ -0,0 +1,53 @@
+"""Helpers for screen rectangles, given as (x_start, y_start, x_end, y_end) with ends exclusive.
+"""
+from typing import Iterable, List, Optional, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+
+def clip_rect(rect: Rect, width: int, height: int) -> Optional[Rect]:
+    """Clip a rectangle to a frame of given size. Returns None if nothing is left."""
+    x_start, y_start, x_end, y_end = rect
+    x_start, y_start = max(x_start, 0), max(y_start, 0)
+    x_end, y_end = min(x_end, width), min(y_end, height)
+    if x_start >= x_end or y_start >= y_end:
+        return None
+    return (x_start, y_start, x_end, y_end)
+
+
+def rects_overlap(rect_a: Rect, rect_b: Rect) -> bool:
+    """Whether two rectangles share any pixel."""
+    return rect_a[0] < rect_b[2] and rect_b[0] < rect_a[2] and rect_a[1] < rect_b[3] and rect_b[1] < rect_a[3]
+
+
+def union_rect(rect_a: Rect, rect_b: Rect) -> Rect:
+    """Smallest rectangle covering both rectangles."""
+    return (
+        min(rect_a[0], rect_b[0]),
+        min(rect_a[1], rect_b[1]),
+        max(rect_a[2], rect_b[2]),
+        max(rect_a[3], rect_b[3]),
+    )
+
+
+def merge_rects(rects: Iterable[Rect]) -> List[Rect]:
+    """Merge overlapping rectangles into their unions until no two of them overlap. Every pixel
+    covered by the input is covered by exactly one output rectangle."""
+    merged: List[Rect] = []
+    for rect in rects:
+        # absorb every merged rectangle overlapping this one; the union may overlap more
+        x_start, y_start, x_end, y_end = rect
+        absorbed: bool = True
+        while absorbed:
+            absorbed = False
+            for index, (other_x_start, other_y_start, other_x_end, other_y_end) in enumerate(merged):
+                # rects_overlap(), inlined as this is the hot loop
+                if x_start < other_x_end and other_x_start < x_end \
+                        and y_start < other_y_end and other_y_start < y_end:
+                    x_start, y_start = min(x_start, other_x_start), min(y_start, other_y_start)
+                    x_end, y_end = max(x_end, other_x_end), max(y_end, other_y_end)
+                    merged.pop(index)
+                    absorbed = True
+                    break
+        merged.append((x_start, y_start, x_end, y_end))
+    return merged
@@ -0,0 +1,96 @@
+"""Sprite atlas: structure images of a tileset, already decoded, split and cropped, packed into
+one binary file with an index, so that later runs map them from disk instead of decoding.
+
+Atlases are kept in the disk cache and keyed by the tileset and the size and modification time
+of its source images, so they are rebuilt whenever an asset changes. To build one ahead of a
+run:
+    python -m colony.utils.sprite_atlas space
+"""
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from colony.utils.disk_cache import cache_key, cache_path, mark_used, prune_cache, write_atomic
+
+
+# bump whenever images are processed differently on load, to invalidate built atlases
+ATLAS_VERSION: int = 1
+# least recently used atlases are deleted once they take more than this on disk
+ATLAS_CACHE_BYTES: int = 1024 ** 3
+# one record per sprite; pixels of a sprite start at offset in the atlas
+ATLAS_INDEX_DTYPE: np.dtype = np.dtype([
+    ("type", np.int32),
+    ("name", "U64"),
+    ("offset", np.int64),
+    ("shape", np.int32, (3,)),
+    ("size", np.int32, (2,)),
+])
+
+
+def atlas_key(asset_folder: Path, structure: Dict[str, Dict[str, Any]]) -> str:
+    """Cache key of the atlas of given structure entries of a tileset YAML."""
+    sources: List[Tuple[str, int, int]] = []
+    for prop_set in structure.values():
+        stat = asset_folder.joinpath(prop_set["path"]).stat()
+        sources.append((str(prop_set["path"]), stat.st_size, stat.st_mtime_ns))
+    return cache_key(ATLAS_VERSION, str(asset_folder.resolve()), sorted(structure.items()), sources)
+
+
+def _atlas_paths(key: str) -> Tuple[Path, Path]:
+    return cache_path("atlases", key, ".pixels.npy"), cache_path("atlases", key, ".index.npy")
+
+
+def save_atlas(key: str, raw_image_set: Dict[int, Dict[str, Any]]):
+    """Pack a raw image set of ImageLoader into an atlas."""
+    records: List[Tuple] = []
+    chunks: List[np.ndarray] = []
+    offset: int = 0
+    for asset_type, entry in raw_image_set.items():
+        for image, size in zip(entry["images"], entry["sizes"]):
+            records.append((asset_type, entry["name"], offset, image.shape, size))
+            chunks.append(np.ascontiguousarray(image).ravel())
+            offset += image.size
+    pixels: np.ndarray = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+    pixels_path, index_path = _atlas_paths(key)
+    # index last, as its presence marks a complete atlas
+    write_atomic(pixels_path, lambda temp_path: np.save(temp_path, pixels))
+    write_atomic(index_path, lambda temp_path: np.save(temp_path, np.array(records, dtype=ATLAS_INDEX_DTYPE)))
+    prune_cache("atlases", ATLAS_CACHE_BYTES)
+
+
+def load_atlas(key: str) -> Optional[Dict[int, Dict[str, Any]]]:
+    """Map an atlas from disk as a raw image set of ImageLoader, None if not built. Images
+    are read-only views of the mapped file."""
+    pixels_path, index_path = _atlas_paths(key)
+    try:
+        index: np.ndarray = np.load(index_path, mmap_mode="r")
+        pixels: np.ndarray = np.load(pixels_path, mmap_mode="r")
+    except FileNotFoundError:  # not built, or half of it pruned
+        return None
+    mark_used(index_path)
+    mark_used(pixels_path)
+    raw_image_set: Dict[int, Dict[str, Any]] = {}
+    for record in index:
+        entry: Dict[str, Any] = raw_image_set.setdefault(
+            int(record["type"]), {"name": str(record["name"]), "images": [], "sizes": []}
+        )
+        shape: Tuple[int, ...] = tuple(record["shape"].tolist())
+        offset: int = int(record["offset"])
+        entry["images"].append(pixels[offset: offset + int(np.prod(shape))].reshape(shape))
+        entry["sizes"].append(tuple(record["size"].tolist()))
+    return raw_image_set
+
+
+def build_atlases(set_names: Iterable[str]):
+    """Build atlases of given tilesets, if not built yet."""
+    # imported here, as the image manager loads atlases through ImageLoader
+    from colony.utils.image_manager import get_tileset_yaml
+    from colony.utils.image_loader import ImageLoader
+    for set_name in set_names:
+        ImageLoader(**get_tileset_yaml(set_name))
+
+
+if __name__ == "__main__":
+    build_atlases(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""Helpers reading layered bitmap tiles (see TILE_DTYPE in map_generator/ref.py).
+
+All functions work on a single tile as well as on whole arrays of tiles.
+"""
+import numpy as np
+
+from colony.configs.map_generator.ref import (
+    STRUCTURE_PREFIX,
+    TERRAIN_CODE_LUT,
+    PASSABLE_LUT,
+    BUILDABLE_LUT,
+    TERRAIN_COLOR_LUT,
+    STRUCTURE_COLOR_LUT,
+    TERRAIN_CODES,
+    TILE_DTYPE,
+    GRASS,
+)
+
+# old-style code -> terrain class
+_CODE_TERRAIN: dict = {code: terrain for terrain, code in TERRAIN_CODES.items()}
+
+
+def is_passable(tiles: np.ndarray) -> np.ndarray:
+    """Spores can walk on tiles whose terrain allows and that have no structure."""
+    return PASSABLE_LUT[tiles["terrain"]] & (tiles["structure"] == 0)
+
+
+def is_buildable(tiles: np.ndarray) -> np.ndarray:
+    """Buildings can be placed on tiles whose terrain allows and that have no structure."""
+    return BUILDABLE_LUT[tiles["terrain"]] & (tiles["structure"] == 0)
+
+
+def tile_colors(tiles: np.ndarray) -> np.ndarray:
+    """Colors of tiles, in the same channel order as map_ref. Structures cover terrain."""
+    return np.where(
+        (tiles["structure"] > 0)[..., None],
+        STRUCTURE_COLOR_LUT[tiles["structure"]],
+        TERRAIN_COLOR_LUT[tiles["terrain"]],
+    )
+
+
+def decode_tiles(tiles: np.ndarray) -> np.ndarray:
+    """Compatibility accessor: get old-style tile codes used as keys of map_ref,
+    e.g. 101 for grass or 7213 for a level-3 timber."""
+    structure: np.ndarray = tiles["structure"].astype(np.int32)
+    return np.where(
+        structure > 0,
+        STRUCTURE_PREFIX * 1000 + structure * 10 + tiles["tech"],
+        TERRAIN_CODE_LUT[tiles["terrain"]],
+    )
+
+
+def encode_tile(code: int) -> tuple:
+    """Compatibility helper: convert an old-style tile code to a layered tile. Structure
+    codes are assumed to be built on grass."""
+    if code // 1000 == STRUCTURE_PREFIX:
+        return (GRASS, (code % 1000) // 10, code % 10)
+    return (_CODE_TERRAIN[code], 0, 0)
+
+
+def empty_tiles(shape, terrain: int = GRASS) -> np.ndarray:
+    """Allocate a layered bitmap filled with a single terrain class."""
+    tiles: np.ndarray = np.zeros(shape, dtype=TILE_DTYPE)
+    tiles["terrain"] = terrain
+    return tiles
@@ -0,0 +1,32 @@
+"""Camera of the main viewer: which part of the map is shown, and how large.
+"""
+from dataclasses import dataclass, replace
+from typing import Tuple
+
+
+# zoom limits, relative to fitting the whole map into the frame
+MIN_ZOOM: float = 0.25
+MAX_ZOOM: float = 64.
+
+
+@dataclass(frozen=True)
+class Camera:
+    """
+    Attributes
+        center: (x, y) map position shown at the center of frame, in tiles; may be fractional.
+        zoom: scale relative to fitting the whole map into the frame, so 1 shows the whole map
+            and 2 shows a quarter of it at twice the tile size.
+    """
+    center: Tuple[float, float]
+    zoom: float = 1.
+
+    def __post_init__(self):
+        assert MIN_ZOOM <= self.zoom <= MAX_ZOOM, f"Zoom {self.zoom} out of [{MIN_ZOOM}, {MAX_ZOOM}]."
+
+    def panned(self, dx: float, dy: float) -> "Camera":
+        """Camera moved by (dx, dy) tiles."""
+        return replace(self, center=(self.center[0] + dx, self.center[1] + dy))
+
+    def zoomed(self, factor: float) -> "Camera":
+        """Camera zoomed in by factor (out if below 1), within zoom limits."""
+        return replace(self, zoom=min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM))
@@ -1,13 +1,15 @@
 """Painter functions to draw 2D or isometric views of upper panel.
 """
-from typing import Dict, List, Tuple, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 import cv2
 import numpy as np
 from math import sqrt
 
-from colony.configs.map_generator.ref import map_ref
+from colony.utils.rect_helpers import Rect, clip_rect, merge_rects
+from colony.utils.tile_helpers import tile_colors
 from colony.utils.color_helpers import shift_color
-from colony.utils.image_manager import ImageManager
+from colony.utils.image_manager import ImageManager, Sprite
+from colony.vis.camera import Camera
 from colony.vis.colony_viewers_basic import ColonyView, STAGE_BACKGROUND
 
 
@@ -32,6 +34,9 @@ DEFAULT_TILE_SET: str = "space"
 
 DIRT_COLOR: Tuple[float, ...] = (83, 118, 155)  # BGR for sake of opencv
 
+# extra pixels around tile extents, covering outlines and rounding
+ISO_TILE_EXTENT_MARGIN: int = 2
+
 
 class ColonyViewIso(ColonyView):
     def __init__(
@@ -59,6 +64,10 @@ class ColonyViewIso(ColonyView):
         # offsets from edges, will be calculated later
         self.width_offset: float = 0
         self.height_offset: float = 0
+        # face colors of mega pixels, by (color, shift)
+        self.shifted_colors: Dict[Tuple[Tuple[int, ...], int], Tuple[int, ...]] = {}
+        # None fits the whole map into frame
+        self.camera: Optional[Camera] = None
 
         # figure out multiplier when projecting into isometric spaces
         self._figure_out_multiplier()
@@ -94,11 +103,40 @@ class ColonyViewIso(ColonyView):
         self.width_offset = 0 + self.left_blank
         self.height_offset = self.tile_height * self.height / 2 + self.top_blank
 
+        if self.camera is not None:
+            self._apply_camera(self.camera)
+
         # figure out tile depth above and below surface
         # simple case now, just cut them into halves
         self.tile_upper_depth = self.tile_height * ISO_TILE_UPPER_THICKNESS_SCALAR
         self.tile_lower_depth = self.tile_height * ISO_TILE_LOWER_THICKNESS_SCALAR
 
+    def _apply_camera(self, camera: Camera):
+        """Scale tiles fitting the whole map by zoom, and shift them so that the camera center
+        lands on the frame center."""
+        self.tile_width *= camera.zoom
+        self.tile_height *= camera.zoom
+        center_x, center_y = camera.center
+        self.width_offset = self.frame_width / 2 - (center_x + center_y) * self.tile_width / 2
+        self.height_offset = self.frame_height / 2 - (center_y - center_x) * self.tile_height / 2
+
+    def set_camera(self, camera: Optional[Camera]):
+        """Look at the map through a camera, or fit the whole map if None. The playground has
+        to be painted again afterwards."""
+        self.camera = camera
+        self._figure_out_multiplier()
+
+    def view_key(self) -> Optional[Tuple]:
+        # views through a camera change with every pan and zoom, and are not kept on disk
+        if self.camera is not None:
+            return None
+        return (self.tile_width, self.tile_height, self.width_offset, self.height_offset)
+
+    def tiles_on_frame(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Whether painting given tiles may touch the frame."""
+        lefts, tops, rights, bottoms = self._tile_extents(np.asarray(xs), np.asarray(ys))
+        return (lefts < self.frame_width) & (rights > 0) & (tops < self.frame_height) & (bottoms > 0)
+
     def _get_iso_coor(self, x: float, y: float):
         """Convert bitmap coordinates to isometric coordinates.
         OpenCV draw lines by using integer indices (of course).
@@ -114,6 +152,12 @@ class ColonyViewIso(ColonyView):
         )
         return (new_x, new_y)
 
+    def _get_iso_coors(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Vectorized _get_iso_coor(), giving an (n, 2) array of integer screen coordinates."""
+        new_xs: np.ndarray = (xs * self.tile_width / 2) + (ys * self.tile_width / 2) + self.width_offset
+        new_ys: np.ndarray = (ys * self.tile_height / 2) - (xs * self.tile_height / 2) + self.height_offset
+        return np.stack([new_xs, new_ys], axis=-1).astype(np.int32)
+
     def _get_iso_coor_set(
             self,
             x: float,
@@ -175,22 +219,197 @@ class ColonyViewIso(ColonyView):
         return self.static_frame
 
     def paint_playground(self):
-        """Paint the playground."""
+        """Paint the playground, or load it from background cache."""
         if self.static_frame is None:
             self.static_frame = self._paint_isometric_static_frame()
+        self._load_or_paint_background(self._paint_all_tiles)
+
+    def _paint_all_tiles(self):
+        """Paint every tile of bitmap that shows on frame onto a cleared static frame."""
+        self.static_frame[:] = STAGE_BACKGROUND
+        # only tiles touching frame, in painting order (y ascending, then x descending)
+        tiles: List[Tuple[int, int]] = self._tiles_in_rect((0, 0, self.frame_width, self.frame_height))
+        if not tiles:
+            return
+        xs, ys = np.array(tiles).T
+        # one gather for colors of all tiles
+        colors: List[List[int]] = tile_colors(self.bitmap[ys, xs]).tolist()
+        for (x, y), tile_color in zip(tiles, colors):
+            self.paint_large_pixel(self.static_frame, x, y, tuple(tile_color), background=True)
+
+    def _tile_extents(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Screen bounding boxes (x_start, y_start, x_end, y_end) that may be touched when
+        painting given background tiles, including their depths and outlines."""
+        lefts: np.ndarray = (xs * self.tile_width / 2 + ys * self.tile_width / 2 + self.width_offset).astype(int)
+        tops: np.ndarray = ((ys - xs - 1) * self.tile_height / 2 + self.height_offset).astype(int)
+        return (
+            lefts - ISO_TILE_EXTENT_MARGIN,
+            tops - int(self.tile_upper_depth) - ISO_TILE_EXTENT_MARGIN,
+            lefts + int(np.ceil(self.tile_width)) + ISO_TILE_EXTENT_MARGIN + 1,
+            tops + int(np.ceil(self.tile_height + self.tile_lower_depth)) + ISO_TILE_EXTENT_MARGIN + 1,
+        )
 
-        # the loop order need to be modifed
-        for y in range(len(self.bitmap)):
-            for x in range(len(self.bitmap[0]) - 1, 0 - 1, -1):
-                tile_painting_style: Union[str, Tuple[int, int, int]] = map_ref[self.bitmap[y][x]][-1]
-                if isinstance(tile_painting_style, tuple):  # it's a color, then draw tile using this color
-                    self.paint_large_pixel(self.static_frame, x, y, tile_painting_style, background=True)
-                # elif isinstance(tile_painting_style, str):  
-                # NOTE: there should be an offset to match tile offset when tile-drawing are not from images
-                #     pass  # to be implemented
-                else:
-                    raise ValueError(f"Wrong type of drawing type: {type(tile_painting_style)}, \
-                        check map_generator config file.")
+    def ground_tiles(self, rect: Optional[Rect] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Tile (x, y) whose background surface covers each pixel of a screen rectangle (whole
+        frame if None), as two int32 arrays of rectangle size; -1 where no tile is. Tile depths
+        are not included."""
+        x_start, y_start, x_end, y_end = rect or (0, 0, self.frame_width, self.frame_height)
+        half_width: float = self.tile_width / 2
+        half_height: float = self.tile_height / 2
+        pixel_xs: np.ndarray = np.arange(x_start, x_end, dtype=np.float32)
+        # background surfaces are raised by half of upper depth, see paint_large_pixel()
+        pixel_ys: np.ndarray = np.arange(y_start, y_end, dtype=np.float32) + int(self.tile_upper_depth / 2)
+        # invert _get_iso_coor(): screen x grows with x + y and screen y with y - x
+        sums: np.ndarray = ((pixel_xs - self.width_offset) / half_width)[None, :]
+        diffs: np.ndarray = ((pixel_ys - self.height_offset) / half_height)[:, None]
+        xs: np.ndarray = np.floor((sums - diffs) / 2).astype(np.int32)
+        ys: np.ndarray = np.floor((sums + diffs) / 2).astype(np.int32)
+        inside: np.ndarray = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return np.where(inside, xs, -1), np.where(inside, ys, -1)
+
+    def _tiles_in_rect(self, rect: Rect) -> List[Tuple[int, int]]:
+        """List tiles whose painting may touch a screen rectangle, in painting order."""
+        x_start, y_start, x_end, y_end = rect
+        # screen x grows with x + y and screen y with y - x; find their ranges first
+        half_width: float = self.tile_width / 2
+        half_height: float = self.tile_height / 2
+        depth: float = self.tile_upper_depth + self.tile_lower_depth + ISO_TILE_EXTENT_MARGIN
+        sum_min = int(np.floor((x_start - self.width_offset - self.tile_width) / half_width)) - 2
+        sum_max = int(np.ceil((x_end - self.width_offset) / half_width)) + 2
+        diff_min = int(np.floor((y_start - self.height_offset - depth) / half_height)) - 2
+        diff_max = int(np.ceil((y_end - self.height_offset + depth) / half_height)) + 2
+        xs, ys = np.meshgrid(
+            np.arange(max(0, (sum_min - diff_max) // 2), min(self.width, (sum_max - diff_min) // 2 + 1)),
+            np.arange(max(0, (sum_min + diff_min) // 2), min(self.height, (sum_max + diff_max) // 2 + 1)),
+        )
+        xs, ys = xs.ravel(), ys.ravel()
+        lefts, tops, rights, bottoms = self._tile_extents(xs, ys)
+        touched: np.ndarray = (lefts < x_end) & (rights > x_start) & (tops < y_end) & (bottoms > y_start)
+        xs, ys = xs[touched], ys[touched]
+        # same order as painting the whole playground: y ascending, then x descending
+        order: np.ndarray = np.lexsort((-xs, ys))
+        return list(zip(xs[order].tolist(), ys[order].tolist()))
+
+    def repaint_tiles(self, tiles: Iterable[Tuple[int, int]]) -> List[Rect]:
+        """Repaint only screen regions of changed tiles. Each region is cleared and every tile
+        touching it is painted again in the usual order, clipped to the region, which gives the
+        same pixels as painting the whole playground.
+
+        Returns
+            List[Rect]: repainted regions.
+        """
+        tiles = list(tiles)
+        if not tiles:
+            return []
+        xs: np.ndarray = np.array([tile[0] for tile in tiles])
+        ys: np.ndarray = np.array([tile[1] for tile in tiles])
+        extents = zip(*(extent.tolist() for extent in self._tile_extents(xs, ys)))
+        rects: List[Rect] = [
+            rect for rect in (clip_rect(extent, self.frame_width, self.frame_height) for extent in extents)
+            if rect is not None
+        ]
+        # opencv rasterizes shapes crossing image borders a bit differently, so each patch is
+        # large enough to hold every tile painted on it whole, and only its inside is kept
+        repainted: List[Rect] = merge_rects(rects)
+        for x_start, y_start, x_end, y_end in repainted:
+            tiles_to_paint: List[Tuple[int, int]] = self._tiles_in_rect((x_start, y_start, x_end, y_end))
+            tile_extents = self._tile_extents(
+                np.array([tile[0] for tile in tiles_to_paint]), np.array([tile[1] for tile in tiles_to_paint])
+            )
+            patch_x_start, patch_y_start, patch_x_end, patch_y_end = clip_rect(
+                (
+                    min(x_start, int(tile_extents[0].min())),
+                    min(y_start, int(tile_extents[1].min())),
+                    max(x_end, int(tile_extents[2].max())),
+                    max(y_end, int(tile_extents[3].max())),
+                ),
+                self.frame_width,
+                self.frame_height,
+            )
+            patch: np.ndarray = np.full(
+                (patch_y_end - patch_y_start, patch_x_end - patch_x_start, 3), STAGE_BACKGROUND, dtype=np.uint8
+            )
+            for x, y in tiles_to_paint:
+                tile_color: Tuple[int, int, int] = tuple(tile_colors(self.bitmap[y, x]).tolist())
+                self.paint_large_pixel(
+                    patch, x, y, tile_color, background=True, offset=(-patch_x_start, -patch_y_start)
+                )
+            self.static_frame[y_start:y_end, x_start:x_end] = patch[
+                y_start - patch_y_start: y_end - patch_y_start, x_start - patch_x_start: x_end - patch_x_start
+            ]
+        return repainted
+
+    def object_rect(self, x: int, y: int, size: Tuple[int, int] = (1, 1)) -> Rect:
+        """Screen rectangle that may be touched by paint_large_pixel() of an object. Same as the
+        union of _tile_extents() of its tiles, in scalar maths since it is called per object."""
+        x_far: int = x + size[0] - 1
+        y_far: int = y + size[1] - 1
+        # left-most tile is (x, y), right-most (x_far, y_far), top (x_far, y) and bottom (x, y_far)
+        left: int = int(x * self.tile_width / 2 + y * self.tile_width / 2 + self.width_offset)
+        right: int = int(x_far * self.tile_width / 2 + y_far * self.tile_width / 2 + self.width_offset)
+        top: int = int((y - x_far - 1) * self.tile_height / 2 + self.height_offset)
+        bottom: int = int((y_far - x - 1) * self.tile_height / 2 + self.height_offset)
+        return (
+            left - ISO_TILE_EXTENT_MARGIN,
+            top - int(self.tile_upper_depth) - ISO_TILE_EXTENT_MARGIN,
+            right + int(np.ceil(self.tile_width)) + ISO_TILE_EXTENT_MARGIN + 1,
+            bottom + int(np.ceil(self.tile_height + self.tile_lower_depth)) + ISO_TILE_EXTENT_MARGIN + 1,
+        )
+
+    def paint_large_pixels(
+        self,
+        frame: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        colors: List[Tuple[int, ...]],
+        outline: bool = True,
+        offset: Tuple[int, int] = (0, 0),
+    ):
+        """Batched paint_large_pixel() of many single-tile, non-background mega pixels. Corners
+        of all tiles are projected at once, and faces are drawn with one multi-polygon call per
+        face and color. Tiles must not overlap each other on screen (e.g. they are at least two
+        tiles apart on both axes), since their drawing order is not kept.
+        """
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        outline_color = ISO_TILE_OUTLINE_COLOR if outline else None
+        upper_shifter: np.ndarray = np.array([0, int(self.tile_upper_depth)], dtype=np.int32)
+        half_upper_shifter: np.ndarray = np.array([0, int(self.tile_upper_depth / 2)], dtype=np.int32)
+
+        # four original corners of each tile, (n, 2) each
+        corners: np.ndarray = self._get_iso_coors(
+            np.concatenate([xs, xs + 1, xs, xs + 1]), np.concatenate([ys, ys, ys + 1, ys + 1])
+        ) + np.array(offset, dtype=np.int32)
+        ul, ur, ll, lr = corners.reshape(4, len(xs), 2)
+
+        # same faces and order as paint_large_pixel(): surface, elevated left and right sides
+        faces: List[Tuple[np.ndarray, Union[int, Tuple[int, ...]]]] = [
+            (np.stack([ul, ll, lr, ur], axis=1) - upper_shifter, 0),
+            (
+                np.stack([ul - upper_shifter, ll - upper_shifter, ll - half_upper_shifter, ul - half_upper_shifter], axis=1),
+                ISO_TILE_UPPER_LEFT_COLOR_SHIFT,
+            ),
+            (
+                np.stack([ll - upper_shifter, lr - upper_shifter, lr - half_upper_shifter, ll - half_upper_shifter], axis=1),
+                ISO_TILE_UPPER_RIGHT_COLOR_SHIFT,
+            ),
+        ]
+
+        # tiles sharing a color are drawn together
+        color_groups: Dict[Tuple[int, ...], List[int]] = {}
+        for index, color in enumerate(colors):
+            color_groups.setdefault(tuple(color), []).append(index)
+        for contours, color_shift in faces:
+            for color, indices in color_groups.items():
+                face_color: Tuple[int, ...] = self._shifted_color(color, color_shift) if color_shift else color
+                self.draw_filled_polygon(frame, contours[indices], face_color, outline_color)
+
+    def _shifted_color(self, color: Tuple[int, ...], color_shift: int) -> Tuple[int, ...]:
+        """shift_color() with results kept, as spores only come in a few colors."""
+        key: Tuple[Tuple[int, ...], int] = (color, color_shift)
+        if key not in self.shifted_colors:
+            self.shifted_colors[key] = shift_color(color, color_shift)
+        return self.shifted_colors[key]
 
     def paint_large_pixel_plane(self, frame: np.ndarray, x: int, y: int, color: Tuple):
         """Draw mega pixel without depth info, just overlay them on a plane"""
@@ -208,10 +427,12 @@ class ColonyViewIso(ColonyView):
         outline_color: Tuple[int, ...] = None,
         outline_thickness: int = ISO_TILE_OUTLINE_THICKNESS):
         """Draw a polygon with color, as well as outline if supplied.
-        Basically just combined two opencv functions."""
-        cv2.fillPoly(frame, pts=[contours], color=color)
+        Basically just combined two opencv functions. Contours of shape (n, points, 2) draw n
+        polygons at once."""
+        pts = list(contours) if contours.ndim == 3 else [contours]
+        cv2.fillPoly(frame, pts=pts, color=color)
         if outline_color is not None:
-            cv2.polylines(frame, pts=[contours], isClosed=True, color=outline_color, thickness=outline_thickness)
+            cv2.polylines(frame, pts=pts, isClosed=True, color=outline_color, thickness=outline_thickness)
 
     def paint_large_pixel(
         self,
@@ -222,6 +443,7 @@ class ColonyViewIso(ColonyView):
         size: Tuple[int, int] = (1, 1),
         background: bool = False,
         outline: bool = True,
+        offset: Tuple[int, int] = (0, 0),
     ):
         """Draw mega pixles with depth inofmration. There will be five regions for each tile now.
         1. The surface of tile, which needs an Y offset to elevate from ground; we will use self.tile_upper_depth
@@ -236,6 +458,8 @@ class ColonyViewIso(ColonyView):
 
         Tile outline applies only to player/mimic/whatever-individual tiles, not backgrounds tiles.
         Some lines are overlapping. So different sides will have different number of line drawing statements.
+
+        Offset shifts everything drawn, for painting into a patch cut out of the frame.
         """
         outline_color = ISO_TILE_OUTLINE_COLOR if outline else None
         upper_shifter: Tuple[int, int] = (0, int(self.tile_upper_depth))
@@ -251,7 +475,10 @@ class ColonyViewIso(ColonyView):
             half_lower_shifter = (0, 0)
 
         # four original corners of each tile
-        ul, ur, ll, lr = self._get_iso_coor_set(x, y, size=size)
+        ul, ur, ll, lr = [
+            (corner_x + offset[0], corner_y + offset[1])
+            for corner_x, corner_y in self._get_iso_coor_set(x, y, size=size)
+        ]
 
         # draw surface of a tile      ??? why a positive number causing it shift below ???
         contours: np.ndarray = np.array([ul, ll, lr, ur]) - upper_shifter
@@ -323,6 +550,8 @@ class ColonyViewIsoImage(ColonyViewIso):
         # save current tile width and update when zoom level changes
         self.tile_width: int = self.get_tile_width()
         self.imager.prepare_tileset(self.tile_width)
+        # images of the width on screen stay cached
+        self.imager.pin(self.tile_width)
 
         
     def get_tile_width(self):
@@ -330,6 +559,15 @@ class ColonyViewIsoImage(ColonyViewIso):
         ul, ur, ll, lr = self._get_iso_coor_set(0, 0)
         return abs(ul[0] - lr[0])
 
+    def set_camera(self, camera: Optional[Camera]):
+        """Also rounds tile width to whole pixels, as on creation, so that images of each zoom
+        level are scaled once and kept by the image manager."""
+        old_width: int = self.tile_width
+        super().set_camera(camera)
+        self.tile_width = self.get_tile_width()
+        self.imager.pin(self.tile_width)
+        self.imager.unpin(old_width)
+
 
     @staticmethod
     def _add_alpha_if_necessary(image: np.ndarray):
@@ -356,18 +594,8 @@ class ColonyViewIsoImage(ColonyViewIso):
                 
         # return background
 
-    def paint_image_as_large_pixel(
-        self,
-        frame: np.ndarray,
-        x: int,
-        y: int,
-        image: np.ndarray,
-    ):
-        """Paint a mega pixel from an image array.
-        Caller need to accept a return value as the operation is not in-place.
-        NOTE: I may messed up with what is x and what is y. Consequently, statements work but
-        variables may not have correct names. lol.
-        """
+    def image_rect(self, x: int, y: int, image: Union[np.ndarray, Sprite]) -> Rect:
+        """Screen rectangle covered by an image painted on tile (x, y)."""
         # four original corners of each tile
         ul, ur, ll, lr = self._get_iso_coor_set(x, y)
 
@@ -376,24 +604,38 @@ class ColonyViewIsoImage(ColonyViewIso):
         # images will be shifted upward to compensate for tile thickness.
         y_shifter: int = int(self.tile_upper_depth / 2)
 
-        width: int = abs(ul[0] - lr[0])
         replace_y: int = ll[1] - y_shifter
         replace_x: int = ul[0]
+        img_height, img_width, _ = image.shape
+        return (replace_x, replace_y - img_height, replace_x + img_width, replace_y)
 
-        #overlay_image = self.imager.resize_image_by_width(image, width)
-        overlay_image = image
-        img_height, img_width, _ = overlay_image.shape
-
-        overlayed_part = frame[
-            replace_y - img_height: replace_y, replace_x: replace_x + img_width
-        ]
-        # crop overlapping part and fill with zero for addition operation
-        overlayed_part[np.where(overlay_image[:, :, 3] > 0)] = (0, 0, 0)
-        # add overlaying image (but without alpha) to zero filled regions
-        np.add(overlayed_part, overlay_image[:, :, :3], out=overlayed_part)
-
-        # put the changed part back
-        frame[
-            replace_y - img_height: replace_y, replace_x: replace_x + img_width
-        ] = overlayed_part
+    def paint_image_as_large_pixel(
+        self,
+        frame: np.ndarray,
+        x: int,
+        y: int,
+        image: Union[np.ndarray, Sprite],
+        offset: Tuple[int, int] = (0, 0),
+    ):
+        """Paint a mega pixel from an image, alpha blended onto the frame. Parts of the image out
+        of frame are clipped. Offset shifts the image, for painting into a patch cut out of the
+        frame. Pass a Sprite from the image manager to skip preparing alpha on every call.
+        NOTE: I may messed up with what is x and what is y. Consequently, statements work but
+        variables may not have correct names. lol.
+        """
+        sprite: Sprite = image if isinstance(image, Sprite) else Sprite(image)
+        x_start, y_start, x_end, y_end = self.image_rect(x, y, sprite)
+        visible: Rect = clip_rect(
+            (x_start + offset[0], y_start + offset[1], x_end + offset[0], y_end + offset[1]),
+            frame.shape[1],
+            frame.shape[0],
+        )
+        if visible is None:
+            return frame
+        frame_x_start, frame_y_start, frame_x_end, frame_y_end = visible
+        sprite.blend(
+            frame[frame_y_start: frame_y_end, frame_x_start: frame_x_end],
+            y_start=frame_y_start - y_start - offset[1],
+            x_start=frame_x_start - x_start - offset[0],
+        )
         return frame
@@ -1,14 +1,24 @@
 import numpy as np
 
 from abc import ABC, abstractmethod
-from typing import Tuple, Union
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 
-from colony.configs.map_generator.ref import map_ref
+from colony.utils.disk_cache import cache_key, cache_path, mark_used, prune_cache, write_atomic
+from colony.utils.rect_helpers import Rect
+from colony.utils.tile_helpers import tile_colors
 
 
 # no alpha channel
 STAGE_BACKGROUND: Union[int, Tuple[int, int, int]] = (202, 193, 103)  # color for stage level background
 
+# painted backgrounds are reused across runs for identical maps and viewer sizes
+CACHE_BACKGROUNDS: bool = True
+# bump whenever painting of backgrounds changes, to invalidate cached backgrounds
+BACKGROUND_VERSION: int = 1
+# least recently used backgrounds are deleted once they take more than this on disk
+BACKGROUND_CACHE_BYTES: int = 256 * 1024 ** 2
+
 
 class ColonyView(ABC):
     """Upper viewing panel drawer."""
@@ -41,6 +51,49 @@ class ColonyView(ABC):
         """Add individual large "pixels" onto scene/playground."""
         pass
 
+    def view_key(self) -> Optional[Tuple]:
+        """Values, besides frame size, that decide where tiles land on frame; None if the view
+        is not worth keeping a background of on disk."""
+        return ()
+
+    def repaint_tiles(self, tiles: Iterable[Tuple[int, int]]) -> Optional[List[Rect]]:
+        """Refresh the static frame after given tiles changed on bitmap. Viewers repaint the
+        whole playground unless they know better.
+
+        Returns
+            List[Rect] or None: repainted regions of frame, None if everything was repainted.
+        """
+        self.paint_playground()
+        return None
+
+    def _load_or_paint_background(self, paint: Callable[[], None]):
+        """Fill static frame with a background painted earlier for the same bitmap, viewer size
+        and painter style, or paint it with paint() and store it for later runs. The frame is
+        filled in place, since painters keep references to it.
+        """
+        # streamed bitmaps are not hashed, as that would generate every chunk
+        view_key: Optional[Tuple] = self.view_key()
+        if not CACHE_BACKGROUNDS or view_key is None or not isinstance(self.bitmap, np.ndarray):
+            paint()
+            return
+        key: str = cache_key(
+            type(self).__name__,
+            BACKGROUND_VERSION,
+            self.frame_width,
+            self.frame_height,
+            view_key,
+            self.bitmap.shape,
+            np.ascontiguousarray(self.bitmap[:, :]).tobytes(),
+        )
+        path: Path = cache_path("backgrounds", key, ".npy")
+        if path.is_file():
+            self.static_frame[:] = np.load(path)
+            mark_used(path)
+            return
+        paint()
+        write_atomic(path, lambda temp_path: np.save(temp_path, self.static_frame))
+        prune_cache("backgrounds", BACKGROUND_CACHE_BYTES)
+
 
 class ColonyView2D(ColonyView):
     def __init__(
@@ -56,6 +109,15 @@ class ColonyView2D(ColonyView):
         # viewer.
         self._figure_out_multiplier()
 
+        # pixel span of each tile column and row on frame, ends exclusive
+        self.x_starts: np.ndarray = (np.arange(self.width) * self.multiplier).astype(int) + self.left_blank
+        self.x_ends: np.ndarray = (np.arange(1, self.width + 1) * self.multiplier).astype(int) + self.left_blank
+        self.y_starts: np.ndarray = (np.arange(self.height) * self.multiplier).astype(int) + self.top_blank
+        self.y_ends: np.ndarray = (np.arange(1, self.height + 1) * self.multiplier).astype(int) + self.top_blank
+        # tile column and row of each pixel in playground, for upscaling tiles to pixels
+        self.pixel_xs: np.ndarray = np.repeat(np.arange(self.width), self.x_ends - self.x_starts)
+        self.pixel_ys: np.ndarray = np.repeat(np.arange(self.height), self.y_ends - self.y_starts)
+
     def _figure_out_multiplier(self):
         """To figure out a scalar that we can use to map individual dots to playground by giving them a size."""
         multiplier_x: float = self.frame_width / self.width
@@ -72,7 +134,7 @@ class ColonyView2D(ColonyView):
 
     def get_static_frame(self):
         """Paint the background."""
-        if not self.static_frame:
+        if self.static_frame is None:
             self.static_frame = np.full(
                 (self.frame_height, self.frame_width, 3),
                 STAGE_BACKGROUND,
@@ -81,11 +143,16 @@ class ColonyView2D(ColonyView):
         return self.static_frame
 
     def paint_playground(self):
-        """Paint playground."""
-        for y in range(len(self.bitmap)):
-            for x in range(len(self.bitmap[0])):
-                color = map_ref[self.bitmap[y][x]][-1]
-                self.paint_large_pixel(self.static_frame, y, x, color)
+        """Paint playground: one color lookup for all tiles, then upscaled to pixels by a gather
+        of tile rows and columns."""
+        playground: Tuple[slice, slice] = (
+            slice(self.y_starts[0], self.y_ends[-1]), slice(self.x_starts[0], self.x_ends[-1])
+        )
+        if self.multiplier >= 1:
+            colors: np.ndarray = tile_colors(self.bitmap[:, :])
+            self.static_frame[playground] = colors[self.pixel_ys[:, None], self.pixel_xs[None, :]]
+        else:  # fewer pixels than tiles, so only look up colors of tiles that get a pixel
+            self.static_frame[playground] = tile_colors(self.bitmap[self.pixel_ys[:, None], self.pixel_xs[None, :]])
 
     def paint_large_pixel(self, frame: np.ndarray, x: int, y: int, color: Tuple):
         """Paint a big pixel element on the given frame."""
@@ -95,3 +162,23 @@ class ColonyView2D(ColonyView):
         y_end = int((y + 1) * self.multiplier) + self.top_blank
 
         frame[y_start:y_end, x_start:x_end] = color
+
+    def paint_large_pixels(self, frame: np.ndarray, xs: np.ndarray, ys: np.ndarray, colors: np.ndarray):
+        """Batched paint_large_pixel(), with a single scatter into frame.
+
+        Args
+            xs, ys: tile coordinates, of shape (n,).
+            colors: colors of shape (n, 3).
+        """
+        xs, ys, colors = np.asarray(xs), np.asarray(ys), np.asarray(colors)
+        # when zoomed out below a pixel per tile, some tiles get no pixel at all
+        shown: np.ndarray = (self.x_ends[xs] > self.x_starts[xs]) & (self.y_ends[ys] > self.y_starts[ys])
+        xs, ys, colors = xs[shown], ys[shown], colors[shown]
+        if not len(xs):
+            return
+        # pixel offsets within a tile; tiles may differ in size by one pixel, and offsets past
+        # the end of a tile are folded onto its last pixel, which simply gets written twice
+        block: np.ndarray = np.arange(max(int(np.ceil(self.multiplier)), 1))
+        pixel_xs: np.ndarray = np.minimum(self.x_starts[xs][:, None] + block, self.x_ends[xs][:, None] - 1)
+        pixel_ys: np.ndarray = np.minimum(self.y_starts[ys][:, None] + block, self.y_ends[ys][:, None] - 1)
+        frame[pixel_ys[:, :, None], pixel_xs[:, None, :]] = colors[:, None, None, :]
@@ -96,6 +96,28 @@ class CurvePainter:
             thickness=tracker.thickness,
         )
 
+    def trackers(self) -> List[StatTracker]:
+        """Trackers in the order draw_colony_curves() feeds them."""
+        return [
+            self.population_tracker,
+            self.food_tracker,
+            self.res_21_tracker,
+            self.res_22_tracker,
+            self.res_23_tracker,
+        ]
+
+    def restore_history(self, history: np.ndarray):
+        """Put trackers into the state they would have after drawing every step of history,
+        so that drawing can start in the middle of a run.
+
+        Args
+            history: (steps, 5) array of population, food, res 21, res 22 and res 23 values,
+                oldest first.
+        """
+        for tracker, values in zip(self.trackers(), np.asarray(history).reshape(-1, 5).T.tolist()):
+            tracker.data = values[-DATA_POINT_LIMIT:]
+            tracker.prev_high = max([1] + values)
+
     def draw_colony_curves(self, colony: Colony) -> np.ndarray:
         """Draw a series of curves by reading the current status from a colony instance."""
         # read values from colony instance
@@ -0,0 +1,203 @@
+"""Level-of-detail rendering of the main scene, for views where tiles are too small for cubes
+and building images to be worth drawing.
+"""
+from math import ceil
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from colony.configs.map_generator.ref import map_ref
+from colony.characters.spore import sex_mapper
+from colony.utils.rect_helpers import Rect, clip_rect, merge_rects
+from colony.vis.colony_viewers import ColonyViewIso
+
+
+# views with tiles narrower than this (in pixels) are painted as density
+LOD_TILE_WIDTH: float = 6.
+# tiles are grouped into square blocks at least this wide on screen
+LOD_BLOCK_WIDTH: float = 8.
+# opacity of a block holding a single spore, and the occupied share of a block that is
+# painted fully opaque
+LOD_MIN_ALPHA: float = .35
+LOD_FULL_DENSITY: float = .25
+# changed blocks covering more than this share of frame are painted with the whole frame
+LOD_FULL_REPAINT_SHARE: float = .25
+
+# sex -> column of block counts, and colors of columns
+SEXES: Tuple[int, ...] = tuple(sorted(sex_mapper))
+SEX_COLORS: np.ndarray = np.array([map_ref[sex][-1] for sex in SEXES], dtype=np.uint8)
+SEX_COLUMNS: Dict[int, int] = {sex: column for column, sex in enumerate(SEXES)}
+
+
+def lod_block_size(painter: ColonyViewIso) -> Optional[int]:
+    """Tiles per block side if painter's view should be painted as density, None otherwise."""
+    if painter.tile_width >= LOD_TILE_WIDTH:
+        return None
+    return ceil(LOD_BLOCK_WIDTH / max(painter.tile_width, 1e-6))
+
+
+class DensityLayer:
+    """Spores aggregated into square blocks of tiles, painted over background as flat tinted
+    blocks: the color of the most common sex, more opaque with more spores. Buildings are left
+    to background, which shows them as flat footprints.
+
+    Only blocks under the frame are kept, so memory follows the frame size, not the map size.
+    Block counts are made from spores by np.add.at() in reset(), and updated with tiles that
+    changed afterwards in update(). Colors of blocks form a small block image, which is mapped
+    onto frame by a nearest-neighbour remap through a pixel to block map made once per view.
+    Any region thus gets the same pixels however the frame is split.
+    """
+    def __init__(self, painter: ColonyViewIso, block_size: int):
+        """
+        Args
+            painter: isometric painter whose view is painted.
+            block_size: tiles per block side.
+        """
+        self.painter: ColonyViewIso = painter
+        self.block_size: int = block_size
+        # blocks under the frame, from block (origin_x, origin_y) on
+        xs, ys = painter.ground_tiles()
+        on_map: np.ndarray = xs >= 0
+        if on_map.any():
+            self.origin_x: int = int(xs[on_map].min()) // block_size
+            self.origin_y: int = int(ys[on_map].min()) // block_size
+            self.blocks_x: int = int(xs[on_map].max()) // block_size + 1 - self.origin_x
+            self.blocks_y: int = int(ys[on_map].max()) // block_size + 1 - self.origin_y
+        else:
+            self.origin_x, self.origin_y, self.blocks_x, self.blocks_y = 0, 0, 0, 0
+        # block (x, y) under each pixel, relative to origin, as a fixed-point map of cv2.remap();
+        # (-1, -1) for none, which also leaves tiles with structures untinted
+        self.pixel_map: np.ndarray = np.full((painter.frame_height, painter.frame_width, 2), -1, dtype=np.int16)
+        # spores of each sex in each block, and how blocks are blended (see Sprite)
+        self.counts: np.ndarray = np.zeros((self.blocks_y * self.blocks_x, len(SEXES)), dtype=np.int32)
+        self.premultiplied: np.ndarray = np.zeros((self.blocks_y, self.blocks_x, 3), dtype=np.uint8)
+        self.inverse_alpha: np.ndarray = np.full((self.blocks_y, self.blocks_x, 3), 255, dtype=np.uint8)
+        self.refresh_structures()
+
+    def _blocks_of(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Blocks (x, y) of tiles relative to origin, and whether they are under the frame."""
+        block_xs: np.ndarray = xs // self.block_size - self.origin_x
+        block_ys: np.ndarray = ys // self.block_size - self.origin_y
+        kept: np.ndarray = (block_xs >= 0) & (block_xs < self.blocks_x) & (block_ys >= 0) & (block_ys < self.blocks_y)
+        return block_xs, block_ys, kept
+
+    def refresh_structures(self, tiles: Optional[Iterable[Tuple[int, int]]] = None):
+        """Leave tiles with structures untinted, as spores are never on buildings and their
+        footprints on background should show. Call with tiles changed on bitmap, or None for
+        all tiles."""
+        painter: ColonyViewIso = self.painter
+        if tiles is None:
+            rects: List[Rect] = [(0, 0, painter.frame_width, painter.frame_height)]
+        else:
+            xs, ys = np.array(list(tiles)).reshape(-1, 2).T
+            extents: List[Rect] = list(zip(*(extent.tolist() for extent in painter._tile_extents(xs, ys))))
+            rects = [
+                rect for rect in (clip_rect(rect, painter.frame_width, painter.frame_height) for rect in extents)
+                if rect is not None
+            ]
+        for rect in merge_rects(rects):
+            x_start, y_start, x_end, y_end = rect
+            xs, ys = painter.ground_tiles(rect)
+            block_xs, block_ys, kept = self._blocks_of(xs, ys)
+            kept &= xs >= 0
+            kept[kept] = painter.bitmap["structure"][ys[kept], xs[kept]] == 0
+            self.pixel_map[y_start: y_end, x_start: x_end] = np.where(
+                kept[..., None], np.dstack((block_xs, block_ys)), -1
+            )
+
+    def reset(self, spores: Dict[Tuple[int, int], int]):
+        """Count spores from scratch.
+
+        Args
+            spores: sex of the spore drawn on each tile.
+        """
+        self.counts[:] = 0
+        if spores:
+            xs, ys = np.array(list(spores.keys())).T
+            columns: np.ndarray = np.array([SEX_COLUMNS[sex] for sex in spores.values()])
+            block_xs, block_ys, kept = self._blocks_of(xs, ys)
+            np.add.at(self.counts, ((block_ys * self.blocks_x + block_xs)[kept], columns[kept]), 1)
+        self._refresh_colors(np.arange(len(self.counts)))
+
+    def update(
+        self, changes: Iterable[Tuple[Tuple[int, int], Optional[int], Optional[int]]]
+    ) -> Optional[List[Rect]]:
+        """Apply changed tiles to block counts.
+
+        Args
+            changes: (tile, old sex, new sex), with None for no spore.
+
+        Returns
+            List[Rect] or None: screen rectangles of blocks that changed, None if they cover
+                so much of frame that painting the whole frame is cheaper.
+        """
+        removed: List[Tuple[int, int, int]] = []
+        added: List[Tuple[int, int, int]] = []
+        for (x, y), old_sex, new_sex in changes:
+            if old_sex is not None:
+                removed.append((x, y, SEX_COLUMNS[old_sex]))
+            if new_sex is not None:
+                added.append((x, y, SEX_COLUMNS[new_sex]))
+        changed: List[np.ndarray] = []
+        for tiles, delta in ((removed, -1), (added, 1)):
+            if tiles:
+                xs, ys, columns = np.array(tiles).T
+                block_xs, block_ys, kept = self._blocks_of(xs, ys)
+                blocks: np.ndarray = (block_ys * self.blocks_x + block_xs)[kept]
+                np.add.at(self.counts, (blocks, columns[kept]), delta)
+                changed.append(blocks)
+        if not changed:
+            return []
+        blocks = np.unique(np.concatenate(changed))
+        if not len(blocks):
+            return []
+        self._refresh_colors(blocks)
+        block_ys, block_xs = np.divmod(blocks, self.blocks_x)
+        size: int = self.block_size
+        return self._block_rects((block_xs + self.origin_x) * size, (block_ys + self.origin_y) * size)
+
+    def _block_rects(self, xs: np.ndarray, ys: np.ndarray) -> Optional[List[Rect]]:
+        """Screen rectangles of blocks starting at tiles (xs, ys), like object_rect() of their
+        tiles; None if they add up to more than LOD_FULL_REPAINT_SHARE of frame."""
+        # left-most tile is (x, y), right-most (x_far, y_far), top (x_far, y) and bottom (x, y_far)
+        x_fars, y_fars = xs + self.block_size - 1, ys + self.block_size - 1
+        lefts: np.ndarray = self.painter._tile_extents(xs, ys)[0]
+        tops: np.ndarray = self.painter._tile_extents(x_fars, ys)[1]
+        rights: np.ndarray = self.painter._tile_extents(x_fars, y_fars)[2]
+        bottoms: np.ndarray = self.painter._tile_extents(xs, y_fars)[3]
+        area: int = int(((rights - lefts) * (bottoms - tops)).sum())
+        if area > self.painter.frame_width * self.painter.frame_height * LOD_FULL_REPAINT_SHARE:
+            return None
+        return list(zip(lefts.tolist(), tops.tolist(), rights.tolist(), bottoms.tolist()))
+
+    def _refresh_colors(self, blocks: np.ndarray):
+        counts: np.ndarray = self.counts[blocks]
+        totals: np.ndarray = counts.sum(axis=1)
+        density: np.ndarray = np.minimum(totals / (self.block_size ** 2 * LOD_FULL_DENSITY), 1.)
+        alphas: np.ndarray = np.where(totals > 0, LOD_MIN_ALPHA + (1 - LOD_MIN_ALPHA) * density, 0.)[:, None]
+        self.premultiplied.reshape(-1, 3)[blocks] = (SEX_COLORS[counts.argmax(axis=1)] * alphas + .5).astype(np.uint8)
+        self.inverse_alpha.reshape(-1, 3)[blocks] = ((1 - alphas) * 255 + .5).astype(np.uint8)
+
+    def paint(self, region: np.ndarray, rect: Rect):
+        """Blend blocks over a region of background, in place.
+
+        Args
+            region: background pixels of rect, (y_end - y_start, x_end - x_start, 3).
+            rect: where region is on frame, as (x_start, y_start, x_end, y_end).
+        """
+        x_start, y_start, x_end, y_end = rect
+        if not self.counts.size:  # no block under the frame
+            return
+        pixel_map: np.ndarray = self.pixel_map[y_start: y_end, x_start: x_end]
+        # pixels off blocks take border values, which leave them as they are
+        inverse_alpha: np.ndarray = cv2.remap(
+            self.inverse_alpha, pixel_map, None, cv2.INTER_NEAREST,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255),
+        )
+        premultiplied: np.ndarray = cv2.remap(
+            self.premultiplied, pixel_map, None, cv2.INTER_NEAREST,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0),
+        )
+        cv2.multiply(region, inverse_alpha, dst=region, scale=1 / 255)
+        cv2.add(region, premultiplied, dst=region)
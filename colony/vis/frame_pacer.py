@@ -0,0 +1,74 @@
+"""Paces autoplay: the simulation runs at a target tick rate and frames are shown at a target
+frame rate, independently of each other and of how long a tick or a frame takes.
+"""
+import time
+from typing import Callable
+
+
+# ticks a single frame may run to catch up; further backlog is dropped, so that a slow
+# simulation slows down instead of falling further and further behind
+DEFAULT_MAX_TICKS_PER_FRAME: int = 8
+
+
+class FramePacer:
+    """Schedules simulation ticks and frames against a clock.
+
+    Each frame, ticks_due() tells how many ticks to run to keep up with the tick rate (several
+    if rendering is the bottleneck, none if the simulation is ahead), and wait_ms() how long to
+    wait until the next frame is due, with compute time already subtracted. Frames that are
+    already late are skipped instead of being shown in a burst.
+
+    Usage:
+        pacer = FramePacer(tick_rate=30, fps=10)
+        while True:
+            for _ in range(pacer.ticks_due()):
+                colony.progress_a_step()
+            ...
+            cv2.waitKey(pacer.wait_ms())
+    """
+    def __init__(
+        self,
+        tick_rate: float,
+        fps: float,
+        max_ticks_per_frame: int = DEFAULT_MAX_TICKS_PER_FRAME,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        """
+        Args
+            tick_rate: simulation ticks per second.
+            fps: frames per second.
+            max_ticks_per_frame: most ticks ticks_due() asks for at once.
+            clock: seconds of a monotonic clock.
+        """
+        assert tick_rate > 0 and fps > 0, f"Rates should be positive, got {tick_rate} and {fps}."
+        self.tick_interval: float = 1 / tick_rate
+        self.frame_interval: float = 1 / fps
+        self.max_ticks_per_frame: int = max_ticks_per_frame
+        self.clock: Callable[[], float] = clock
+        start: float = clock()
+        # simulation time reached so far, and when the next frame is due
+        self.tick_time: float = start
+        self.next_frame_time: float = start
+        self.ticks: int = 0
+        self.skipped_frames: int = 0
+
+    def ticks_due(self) -> int:
+        """Number of ticks to run now for simulation time to catch up with the clock."""
+        due: int = int((self.clock() - self.tick_time) / self.tick_interval)
+        if due > self.max_ticks_per_frame:  # too far behind, forget the backlog
+            self.tick_time += (due - self.max_ticks_per_frame) * self.tick_interval
+            due = self.max_ticks_per_frame
+        self.tick_time += due * self.tick_interval
+        self.ticks += due
+        return due
+
+    def wait_ms(self) -> int:
+        """Milliseconds to wait until the next frame is due, at least 1 (as cv2.waitKey(0) would
+        wait forever). Schedules the frame after."""
+        now: float = self.clock()
+        self.next_frame_time += self.frame_interval
+        if self.next_frame_time < now:  # late; skip frames that are past due
+            missed: int = int((now - self.next_frame_time) / self.frame_interval) + 1
+            self.skipped_frames += missed
+            self.next_frame_time += missed * self.frame_interval
+        return max(int((self.next_frame_time - now) * 1000), 1)
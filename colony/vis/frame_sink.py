@@ -0,0 +1,138 @@
+"""Writes rendered frames to disk on a background thread, so that the simulation loop never
+waits on compression or disk.
+"""
+import queue
+import threading
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+DEFAULT_FPS: int = 24
+DEFAULT_FOURCC: str = "mp4v"
+# frames waiting to be written; write() blocks when the writer falls this far behind
+DEFAULT_QUEUE_SIZE: int = 32
+# file names of the image-sequence fallback
+FRAME_NAME_PATTERN: str = "%05d.png"
+
+
+class FrameSink:
+    """Encodes frames straight into a video container with cv2.VideoWriter. If no video
+    encoder can be opened, frames are saved as numbered PNGs in a folder named after the video
+    (e.g. colony/00000.png for colony.mp4) instead.
+
+    Frames are handed to a writer thread through a bounded queue and are not copied, so a
+    frame must not be modified after it is written. StepVisulizer.plot_step() returns a new
+    array every call, which can be written as it is. With background=False frames are encoded
+    right away in the calling thread instead, for frames that are reused afterwards (like those
+    of PipelinedRunner, whose simulation runs elsewhere anyway).
+
+    Usage:
+        with FrameSink("colony.mp4") as sink:
+            sink.write(visualizer.plot_step())
+    """
+    def __init__(
+        self,
+        path: Union[str, Path],
+        fps: int = DEFAULT_FPS,
+        fourcc: str = DEFAULT_FOURCC,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        background: bool = True,
+    ):
+        """
+        Args
+            path: Output video file.
+            fps: Frame rate of the video.
+            fourcc: Four-character code of the video codec.
+            queue_size: Max number of frames waiting to be written.
+            background: Write frames on a writer thread.
+        """
+        self.path: Path = Path(path)
+        self.fps: int = fps
+        self.fourcc: str = fourcc
+        self.frames: queue.Queue = queue.Queue(maxsize=queue_size)
+        # set by writer thread when it fails, raised again in the calling thread
+        self.error: Optional[BaseException] = None
+        # opened when the first frame arrives, as its size is needed
+        self.video: Optional[cv2.VideoWriter] = None
+        self.sequence_folder: Optional[Path] = None
+        self.frame_count: int = 0
+        self.closed: bool = False
+        self.thread: Optional[threading.Thread] = None
+        if background:
+            self.thread = threading.Thread(target=self._run, name="FrameSink", daemon=True)
+            self.thread.start()
+
+    def __enter__(self) -> "FrameSink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, frame: np.ndarray):
+        """Queue a BGR frame for writing. Blocks only if the queue is full."""
+        assert not self.closed, "Writing to a closed frame sink."
+        self._raise_error()
+        if self.thread is None:
+            self._write_frame(frame)
+        else:
+            self.frames.put(frame)
+
+    def close(self):
+        """Write all queued frames and close the output."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is None:
+            self._release()
+        else:
+            self.frames.put(None)  # tells the writer thread to stop
+            self.thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Failed writing frames to {self.path}.") from self.error
+
+    def _open(self, frame_size: Tuple[int, int]):
+        """Open a video writer for frames of (width, height), or fall back to images."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        video: cv2.VideoWriter = cv2.VideoWriter(
+            str(self.path), cv2.VideoWriter_fourcc(*self.fourcc), self.fps, frame_size
+        )
+        if video.isOpened():
+            self.video = video
+            return
+        video.release()
+        self.sequence_folder = self.path.with_suffix("")
+        self.sequence_folder.mkdir(parents=True, exist_ok=True)
+        print(f"Video encoder {self.fourcc} not available, saving frames to {self.sequence_folder}.")
+
+    def _write_frame(self, frame: np.ndarray):
+        if self.video is None and self.sequence_folder is None:
+            self._open((frame.shape[1], frame.shape[0]))
+        if self.video is not None:
+            self.video.write(frame)
+        else:
+            cv2.imwrite(str(self.sequence_folder.joinpath(FRAME_NAME_PATTERN % self.frame_count)), frame)
+        self.frame_count += 1
+
+    def _release(self):
+        if self.video is not None:
+            self.video.release()
+
+    def _run(self):
+        """Writer thread: take frames from the queue until told to stop."""
+        while True:
+            frame: Optional[np.ndarray] = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:  # keep draining so that write() never blocks forever
+                continue
+            try:
+                self._write_frame(frame)
+            except BaseException as error:
+                self.error = error
+        self._release()
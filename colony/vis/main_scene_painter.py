@@ -1,15 +1,19 @@
 """Helps drawing main scene.
 """
 import numpy as np
-from typing import Any, Callable, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
 
-from colony.configs.map_generator.ref import map_ref, STRUCTURE_PREFIX
+from colony.configs.map_generator.ref import map_ref, STRUCTURE_COLOR_LUT
 from colony.characters.colony import Colony
 from colony.characters.spore import Spore
 from colony.characters.buildings import Building
-from colony.utils.image_manager import ImageManager
+from colony.utils.image_manager import ImageManager, Sprite
+from colony.vis.camera import Camera
+from colony.utils.rect_helpers import Rect, clip_rect, merge_rects, union_rect
 from colony.vis.colony_viewers_basic import ColonyView, ColonyView2D
 from colony.vis.colony_viewers import ColonyViewIso, ColonyViewIsoImage
+from colony.vis.density_layer import DensityLayer, lod_block_size
+from colony.vis.scene_index import DepthOrder, ObjectGrid
 
 
 # color of players in BGR
@@ -24,6 +28,17 @@ available_painters: Dict[str, ColonyView] = {
 
 
 class MainScenePainter:
+    """Paints objects (spores and buildings) over the playground.
+
+    The composed scene is retained between frames. Each frame, the object drawn on every tile is
+    compared with the previous frame, and only screen rectangles of changed tiles are restored
+    from the background and drawn again, together with other objects overlapping them in
+    isometric order. Frame cost follows the amount of change rather than the scene size.
+
+    Isometric painters can look through a camera (see set_camera()); objects off the frame are
+    then left out before anything is compared or drawn. When tiles get too small on screen,
+    spores are painted as a density heatmap instead (see DensityLayer).
+    """
     def __init__(
         self,
         style: str,
@@ -40,58 +55,42 @@ class MainScenePainter:
         assert style in available_painters, f"{style} not supported."
         self.style: str = style
         painter_class = available_painters[style]
+        # only image painters take an image manager
+        painter_kwargs: Dict[str, Any] = {}
+        if issubclass(painter_class, ColonyViewIsoImage):
+            painter_kwargs["image_manager"] = image_manager
         self.painter = painter_class(
             self.colony.terrain_man.width,
             self.colony.terrain_man.height,
             width,
             height,
             bitmap=self.bitmap,
-            image_manager=image_manager,
+            **painter_kwargs,
         )
         self.static_frame = self.painter.get_static_frame()
         self.painter.paint_playground()
 
-    def paint_all_objects_iso_image(
-        self,
-        frame: np.ndarray,
-        merged_step: Dict[Tuple[int, int], Any],
-        step_sorted: Dict[Tuple[int, int], Any],
-        image_mode: bool = False,
-    ):
-        """Paint all objects as polygons in isometric view."""
-        for (x, y) in step_sorted:
-            obj_on_tile = merged_step[(x, y)]
-            if isinstance(obj_on_tile, Spore):
-                spore_color = map_ref[obj_on_tile.sex][-1]
-                self.painter.paint_large_pixel(
-                    frame, x, y, spore_color, outline=TILE_OUTLINE
-                )
-            elif isinstance(obj_on_tile, Building):
-                if image_mode:  # we can use image instead of polygons
-                    if obj_on_tile.type in self.colony.image_manager.sizes:
-                        image, _ = self.colony.image_manager.get_tile_image(
-                            building_type=obj_on_tile.type,
-                            width=self.painter.tile_width,
-                            index=obj_on_tile.orientation
-                        )
-                        self.painter.paint_image_as_large_pixel(
-                            frame=frame, x=x, y=y, image=image
-                        )
-
-                else:  # image mode off, or image not available
-                    building_code: int = (
-                        STRUCTURE_PREFIX * 1000 + obj_on_tile.type * 10 + obj_on_tile.tech_level
-                    )
-                    building_color = map_ref[building_code][-1]
-                    self.painter.paint_large_pixel(
-                        frame, x, y, building_color, size=obj_on_tile.size, outline=TILE_OUTLINE
-                    )
-        return frame
+        # retained scene: background plus objects, as painted last frame
+        self.scene_frame: np.ndarray = None
+        # what is drawn on each tile (see _visual_key; sex of spores in density mode), and
+        # where it is on screen
+        self.drawn: Dict[Tuple[int, int], Hashable] = {}
+        self.object_grid: ObjectGrid = ObjectGrid()
+        # painting order of tiles with objects
+        self.depth_order: DepthOrder = DepthOrder(
+            self.colony.terrain_man.width, self.colony.terrain_man.height
+        )
+        # spores aggregated into blocks, if tiles are too small to draw one by one
+        self.density: Optional[DensityLayer] = None
+        self._setup_density()
 
-    def paint_main_scence(self) -> np.ndarray:
-        # make a copy of raw background
-        frame = self.static_frame.copy()
-        # merge building step and spore step
+    @property
+    def image_mode(self) -> bool:
+        return self.style == "isometric_image"
+
+    def merge_steps(self) -> Dict[Tuple[int, int], Any]:
+        """Get the object to draw on each occupied tile: buildings cover spores, and only the
+        top spore of a tile is drawn."""
         building_step: Dict[
             Tuple[int, int], Building
         ] = self.colony.building_man.building_step
@@ -108,16 +107,346 @@ class MainScenePainter:
                 merged_step[coor] = self.colony.spore_man.spores[spore_ids[0]]  # the top spore
             else:  # this tile is occupied by another building/spore already
                 pass
+        if isinstance(self.painter, ColonyViewIso) and self.painter.camera is not None:
+            merged_step = self._cull(merged_step)
+        return merged_step
+
+    def _cull(self, merged_step: Dict[Tuple[int, int], Any]) -> Dict[Tuple[int, int], Any]:
+        """Keep only objects that may show on frame."""
+        if not merged_step:
+            return merged_step
+        coors: List[Tuple[int, int]] = list(merged_step)
+        xs, ys = np.array(coors).T
+        on_frame: List[bool] = self.painter.tiles_on_frame(xs, ys).tolist()
+        frame_width: int = self.painter.frame_width
+        frame_height: int = self.painter.frame_height
+        culled: Dict[Tuple[int, int], Any] = {}
+        for coor, tile_on_frame in zip(coors, on_frame):
+            obj: Any = merged_step[coor]
+            if isinstance(obj, Building):  # may reach beyond its tile
+                rect: Optional[Rect] = self._object_rect(coor, obj)
+                if rect is None or clip_rect(rect, frame_width, frame_height) is None:
+                    continue
+            elif not tile_on_frame:
+                continue
+            culled[coor] = obj
+        return culled
 
-        # need to sort spores to paint them in a correct order, this is needed for isometric
-        _tempList = sorted(merged_step.keys(), key=lambda x: x[0], reverse=True)
-        step_sorted: list = sorted(_tempList, key=lambda x: x[1])
-        # paint all objects
-        if self.style == "isometric":
-            return self.paint_all_objects_iso_image(frame, merged_step, step_sorted)
-        elif self.style == "isometric_image":
-            return self.paint_all_objects_iso_image(
-                frame, merged_step, step_sorted, image_mode=True
+    def set_camera(self, camera: Optional[Camera]):
+        """Look at the map through a camera, or fit the whole map if None. Repaints the
+        playground and the scene on the next frame."""
+        assert isinstance(self.painter, ColonyViewIso), f"Style {self.style} has no camera."
+        self.painter.set_camera(camera)
+        self.painter.paint_playground()
+        self._setup_density()
+        self.scene_frame = None
+
+    def _setup_density(self):
+        """Switch to density mode if tiles of current view are too small."""
+        block_size: Optional[int] = None
+        if isinstance(self.painter, ColonyViewIso):
+            block_size = lod_block_size(self.painter)
+        self.density = None if block_size is None else DensityLayer(self.painter, block_size)
+
+    def sort_steps(self, coors) -> List[Tuple[int, int]]:
+        """Sort tiles in isometric painting order: y ascending, then x descending."""
+        return self.depth_order.sort(coors)
+
+    @staticmethod
+    def _visual_key(obj: Any) -> Hashable:
+        """What decides the look of an object; objects with equal keys are drawn identically."""
+        if isinstance(obj, Spore):
+            return ("spore", obj.sex)
+        return ("building", obj.type, obj.orientation, tuple(obj.size))
+
+    def _building_image(self, building: Building) -> Optional[Sprite]:
+        """Image of a building in image mode, None if not available."""
+        if building.type not in self.colony.image_manager.sizes:
+            return None
+        image, _ = self.colony.image_manager.get_tile_sprite(
+            building_type=building.type,
+            width=self.painter.tile_width,
+            index=building.orientation
+        )
+        return image
+
+    def _object_rect(self, coor: Tuple[int, int], obj: Any) -> Optional[Rect]:
+        """Screen rectangle an object may touch, None if it is not drawn."""
+        x, y = coor
+        if isinstance(obj, Building):
+            if self.image_mode:
+                image: Sprite = self._building_image(obj)
+                return None if image is None else self.painter.image_rect(x, y, image)
+            return self.painter.object_rect(x, y, size=obj.size)
+        return self.painter.object_rect(x, y)
+
+    def _paint_object(
+        self,
+        frame: np.ndarray,
+        coor: Tuple[int, int],
+        obj: Any,
+        offset: Tuple[int, int] = (0, 0),
+    ):
+        """Paint a single spore or building."""
+        x, y = coor
+        if isinstance(obj, Spore):
+            spore_color = map_ref[obj.sex][-1]
+            self.painter.paint_large_pixel(
+                frame, x, y, spore_color, outline=TILE_OUTLINE, offset=offset
             )
+        elif isinstance(obj, Building):
+            if self.image_mode:  # we can use image instead of polygons
+                image: Sprite = self._building_image(obj)
+                if image is not None:
+                    self.painter.paint_image_as_large_pixel(
+                        frame=frame, x=x, y=y, image=image, offset=offset
+                    )
+
+            else:  # image mode off, or image not available
+                building_color = tuple(STRUCTURE_COLOR_LUT[obj.type].tolist())
+                self.painter.paint_large_pixel(
+                    frame, x, y, building_color, size=obj.size, outline=TILE_OUTLINE, offset=offset
+                )
+
+    def _depth_levels(
+        self,
+        merged_step: Dict[Tuple[int, int], Any],
+        step_sorted: List[Tuple[int, int]],
+    ) -> List[List[Tuple[int, int]]]:
+        """Group objects into levels that can be painted one after another, while objects in a
+        level do not overlap on screen and may be painted in any order. Walking objects in
+        painting order, each one gets a level above all earlier objects it overlaps: spores
+        overlap spores only on neighbouring tiles, and buildings are checked by screen
+        rectangles. Overlapping objects are thus still painted in order.
+        """
+        levels: Dict[Tuple[int, int], int] = {}
+        # every object walked so far, for finding what a building overlaps; not needed if
+        # there are only spores
+        object_grid: Optional[ObjectGrid] = None
+        if not all(isinstance(merged_step[coor], Spore) for coor in step_sorted):
+            object_grid = ObjectGrid()
+        buildings: int = 0
+        leveled: List[List[Tuple[int, int]]] = []
+        for coor in step_sorted:
+            obj: Any = merged_step[coor]
+            rect: Optional[Rect] = None
+            if object_grid is not None:
+                rect = self._object_rect(coor, obj)
+                if rect is None:  # not drawn
+                    continue
+            below: int = -1
+            if isinstance(obj, Spore):
+                x, y = coor
+                get = levels.get
+                below = max(
+                    get((x - 1, y - 1), -1), get((x, y - 1), -1), get((x + 1, y - 1), -1),
+                    get((x - 1, y), -1), get((x + 1, y), -1),
+                    get((x - 1, y + 1), -1), get((x, y + 1), -1), get((x + 1, y + 1), -1),
+                )
+                if buildings:
+                    for other in object_grid.query(rect):
+                        if not isinstance(merged_step[other], Spore):
+                            below = max(below, levels[other])
+            else:
+                for other in object_grid.query(rect):
+                    below = max(below, levels[other])
+                buildings += 1
+            level: int = below + 1
+            levels[coor] = level
+            if object_grid is not None:
+                object_grid.add(coor, rect)
+            if level == len(leveled):
+                leveled.append([])
+            leveled[level].append(coor)
+        return leveled
+
+    def paint_all_objects_iso_image(
+        self,
+        frame: np.ndarray,
+        merged_step: Dict[Tuple[int, int], Any],
+        step_sorted: List[Tuple[int, int]],
+        offset: Tuple[int, int] = (0, 0),
+    ):
+        """Paint all objects as polygons (or images, in image mode) in isometric view. Objects
+        are painted level by level (see _depth_levels), and all spores of a level are painted
+        together by a few multi-polygon calls.
+        """
+        for level in self._depth_levels(merged_step, step_sorted):
+            spores: List[Tuple[int, int]] = []
+            for coor in level:
+                obj: Any = merged_step[coor]
+                if isinstance(obj, Spore):
+                    spores.append(coor)
+                else:
+                    self._paint_object(frame, coor, obj, offset=offset)
+            if len(spores) == 1:
+                self._paint_object(frame, spores[0], merged_step[spores[0]], offset=offset)
+            elif spores:
+                self.painter.paint_large_pixels(
+                    frame,
+                    [coor[0] for coor in spores],
+                    [coor[1] for coor in spores],
+                    [map_ref[merged_step[coor].sex][-1] for coor in spores],
+                    outline=TILE_OUTLINE,
+                    offset=offset,
+                )
+        return frame
+
+    def paint_full_scene(self, merged_step: Dict[Tuple[int, int], Any]) -> np.ndarray:
+        """Paint every object over a fresh copy of background. Painting order is taken from
+        depth_order, which should have exactly the tiles of merged_step."""
+        frame: np.ndarray = self.static_frame.copy()
+        return self.paint_all_objects_iso_image(frame, merged_step, self.depth_order.ordered())
+
+    def _redraw_rect(self, rect: Rect, merged_step: Dict[Tuple[int, int], Any]):
+        """Restore a rectangle of the scene from background, and draw every object overlapping
+        it again in painting order. Objects are drawn whole on a patch covering all of them,
+        since opencv rasterizes shapes crossing image borders a bit differently."""
+        coors: List[Tuple[int, int]] = self.sort_steps(self.object_grid.query(rect))
+        patch_rect: Rect = rect
+        for coor in coors:
+            patch_rect = union_rect(patch_rect, self.object_grid.rects[coor])
+        patch_x_start, patch_y_start, patch_x_end, patch_y_end = clip_rect(
+            patch_rect, self.static_frame.shape[1], self.static_frame.shape[0]
+        )
+        patch: np.ndarray = self.static_frame[patch_y_start: patch_y_end, patch_x_start: patch_x_end].copy()
+        self.paint_all_objects_iso_image(patch, merged_step, coors, offset=(-patch_x_start, -patch_y_start))
+        x_start, y_start, x_end, y_end = rect
+        self.scene_frame[y_start: y_end, x_start: x_end] = patch[
+            y_start - patch_y_start: y_end - patch_y_start, x_start - patch_x_start: x_end - patch_x_start
+        ]
+
+    def _reset_scene(self, merged_step: Dict[Tuple[int, int], Any]):
+        """Paint the whole scene and index all objects."""
+        self.depth_order.reset(merged_step.keys())
+        self.scene_frame = self.paint_full_scene(merged_step)
+        self.drawn = {}
+        self.object_grid.clear()
+        for coor, obj in merged_step.items():
+            self.drawn[coor] = self._visual_key(obj)
+            rect: Optional[Rect] = self._object_rect(coor, obj)
+            if rect is not None:
+                self.object_grid.add(coor, rect)
+
+    def _paint_scene_2d(self) -> np.ndarray:
+        """Paint the scene in 2D view: spores are scattered over a copy of background at once.
+        Buildings are already on background, as structures of the bitmap."""
+        changed_tiles = self.colony.terrain_man.pop_changed_tiles()
+        if changed_tiles:
+            self.painter.repaint_tiles(changed_tiles)
+        if self.scene_frame is None:
+            self.scene_frame = np.empty_like(self.static_frame)
+        np.copyto(self.scene_frame, self.static_frame)
+
+        spores: List[Tuple[Tuple[int, int], Spore]] = [
+            (coor, obj) for coor, obj in self.merge_steps().items() if isinstance(obj, Spore)
+        ]
+        if spores:
+            self.painter.paint_large_pixels(
+                self.scene_frame,
+                [coor[0] for coor, _ in spores],
+                [coor[1] for coor, _ in spores],
+                np.array([map_ref[spore.sex][-1] for _, spore in spores], dtype=np.uint8),
+            )
+        return self.scene_frame
+
+    def _paint_scene_density(self) -> np.ndarray:
+        """Paint the scene in density mode, redrawing only blocks whose counts changed."""
+        spores: Dict[Tuple[int, int], int] = {
+            coor: obj.sex for coor, obj in self.merge_steps().items() if isinstance(obj, Spore)
+        }
+        dirty_rects: List[Rect] = []
+        changed_tiles = self.colony.terrain_man.pop_changed_tiles()
+        if changed_tiles:
+            self.density.refresh_structures(changed_tiles)
+            repainted: Optional[List[Rect]] = self.painter.repaint_tiles(changed_tiles)
+            if repainted is None:
+                self.scene_frame = None
+            else:
+                dirty_rects.extend(repainted)
+
+        if self.scene_frame is None:
+            self.density.reset(spores)
         else:
-            return None
+            changed_blocks: Optional[List[Rect]] = self.density.update(
+                (coor, self.drawn.get(coor), spores.get(coor))
+                for coor in self.drawn.keys() | spores.keys()
+                if self.drawn.get(coor) != spores.get(coor)
+            )
+            if changed_blocks is None:
+                self.scene_frame = None
+            else:
+                dirty_rects.extend(changed_blocks)
+        self.drawn = spores
+
+        frame_height, frame_width = self.static_frame.shape[:2]
+        if self.scene_frame is None:
+            self.scene_frame = self.static_frame.copy()
+            self.density.paint(self.scene_frame, (0, 0, frame_width, frame_height))
+            return self.scene_frame
+        clipped: List[Rect] = [
+            rect for rect in (clip_rect(rect, frame_width, frame_height) for rect in dirty_rects)
+            if rect is not None
+        ]
+        for rect in merge_rects(clipped):
+            x_start, y_start, x_end, y_end = rect
+            region: np.ndarray = self.static_frame[y_start: y_end, x_start: x_end].copy()
+            self.density.paint(region, rect)
+            self.scene_frame[y_start: y_end, x_start: x_end] = region
+        return self.scene_frame
+
+    def paint_main_scence(self) -> np.ndarray:
+        """Bring the retained scene up to date and return it. The returned frame is reused by
+        later calls, so callers should copy it before drawing on it."""
+        if not isinstance(self.painter, ColonyViewIso):
+            return self._paint_scene_2d()
+        if self.density is not None:
+            return self._paint_scene_density()
+
+        merged_step: Dict[Tuple[int, int], Any] = self.merge_steps()
+        dirty_rects: List[Rect] = []
+
+        # bring background up to date with terrain changes, like new buildings
+        changed_tiles = self.colony.terrain_man.pop_changed_tiles()
+        if changed_tiles:
+            repainted: Optional[List[Rect]] = self.painter.repaint_tiles(changed_tiles)
+            if repainted is None:
+                self.scene_frame = None
+            else:
+                dirty_rects.extend(repainted)
+
+        if self.scene_frame is None:
+            self._reset_scene(merged_step)
+            return self.scene_frame
+
+        # tiles where objects appeared, left, or changed look since last frame
+        changed: List[Tuple[int, int]] = [
+            coor for coor in self.drawn.keys() - merged_step.keys()
+        ] + [
+            coor for coor, obj in merged_step.items() if self.drawn.get(coor) != self._visual_key(obj)
+        ]
+        for coor in changed:
+            old_rect: Optional[Rect] = self.object_grid.rects.get(coor)
+            if old_rect is not None:
+                dirty_rects.append(old_rect)
+                self.object_grid.remove(coor)
+            obj: Any = merged_step.get(coor)
+            if obj is None:
+                del self.drawn[coor]
+                self.depth_order.remove(coor)
+                continue
+            self.depth_order.add(coor)
+            self.drawn[coor] = self._visual_key(obj)
+            new_rect: Optional[Rect] = self._object_rect(coor, obj)
+            if new_rect is not None:
+                dirty_rects.append(new_rect)
+                self.object_grid.add(coor, new_rect)
+
+        frame_height, frame_width = self.scene_frame.shape[:2]
+        clipped: List[Rect] = [
+            rect for rect in (clip_rect(rect, frame_width, frame_height) for rect in dirty_rects)
+            if rect is not None
+        ]
+        for rect in merge_rects(clipped):
+            self._redraw_rect(rect, merged_step)
+        return self.scene_frame
@@ -0,0 +1,392 @@
+"""Runs simulation and rendering in separate processes, so that a frame costs max(simulation,
+rendering) instead of their sum, and rendering can be spread over several processes.
+
+The simulation process sends a compact StepSnapshot of every step to each render process.
+Render processes keep a ColonyReplica in sync with the snapshots and render their share of
+steps (round robin) into a ring buffer of frames in shared memory, which the main process reads
+in order without copying.
+"""
+import multiprocessing as mp
+import queue
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from colony.characters.buildings import Building
+from colony.characters.spore import Spore
+from colony.utils.info_manager import InfoManager
+
+
+# frame slots of shared memory per render process
+DEFAULT_SLOTS_PER_WORKER: int = 2
+# snapshots each render process may fall behind the simulation
+SNAPSHOT_QUEUE_SIZE: int = 8
+# seconds between checks that child processes are still alive while waiting for frames
+PROCESS_CHECK_INTERVAL: float = 1.
+
+
+@dataclass
+class StepSnapshot:
+    """Everything rendering needs to know about a step, as changes since the previous one.
+
+    Attributes
+        index: frame index, 0 for the colony before the first step.
+        spores: (n, 3) int32 array of x, y and sex of the top spore on each occupied tile.
+        new_buildings: buildings added since the previous snapshot, by location.
+        removed_buildings: locations of buildings gone since the previous snapshot.
+        tiles: changed tiles since the previous snapshot, as (coor, (terrain, structure, tech)).
+        current_pop: population of colony.
+        pop_cap: population cap of colony.
+        res: resources in colony storage.
+        bitmap: full bitmap, only in the first snapshot.
+    """
+    index: int
+    spores: np.ndarray
+    new_buildings: Dict[Tuple[int, int], Building] = field(default_factory=lambda: {})
+    removed_buildings: List[Tuple[int, int]] = field(default_factory=lambda: [])
+    tiles: List[Tuple[Tuple[int, int], Tuple[int, int, int]]] = field(default_factory=lambda: [])
+    current_pop: int = 0
+    pop_cap: int = 0
+    res: Dict[int, int] = field(default_factory=lambda: {})
+    bitmap: Optional[np.ndarray] = None
+
+
+class SnapshotRecorder:
+    """Takes snapshots of a colony step after step, on the simulation side."""
+    def __init__(self, colony):
+        self.colony = colony
+        self.index: int = 0
+        self.sent_buildings: Dict[Tuple[int, int], Building] = {}
+
+    def take(self) -> StepSnapshot:
+        colony = self.colony
+        building_step: Dict[Tuple[int, int], Building] = colony.building_man.building_step
+        # same objects as MainScenePainter.merge_steps(): buildings cover spores
+        spores: np.ndarray = np.array(
+            [
+                (x, y, colony.spore_man.spores[spore_ids[0]].sex)
+                for (x, y), spore_ids in colony.step.items()
+                if (x, y) not in building_step
+            ],
+            dtype=np.int32,
+        ).reshape(-1, 3)
+        new_buildings: Dict[Tuple[int, int], Building] = {
+            coor: building for coor, building in building_step.items()
+            if self.sent_buildings.get(coor) is not building
+        }
+        removed_buildings: List[Tuple[int, int]] = [
+            coor for coor in self.sent_buildings if coor not in building_step
+        ]
+        self.sent_buildings = dict(building_step)
+
+        terrain_man = colony.terrain_man
+        snapshot: StepSnapshot = StepSnapshot(
+            index=self.index,
+            spores=spores,
+            new_buildings=new_buildings,
+            removed_buildings=removed_buildings,
+            tiles=[
+                (coor, terrain_man.bitmap[coor[1], coor[0]].item())
+                for coor in terrain_man.pop_changed_tiles()
+            ],
+            current_pop=colony.spore_man.current_pop,
+            pop_cap=colony.spore_man.pop_cap,
+            res=dict(colony.res_man.storage.res),
+            bitmap=np.array(terrain_man.bitmap[:, :]) if self.index == 0 else None,
+        )
+        self.index += 1
+        return snapshot
+
+
+class _Namespace:
+    """Plain attribute holder, standing in for colony managers."""
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class ColonyReplica:
+    """Mirror of the parts of a Colony that StepVisulizer reads, kept up to date by applying
+    snapshots in order. Changed tiles go through TerrainManager.set_tile(), so painters see
+    them as usual."""
+    def __init__(self, first: StepSnapshot, viewer_width: int, viewer_height: int, image_manager=None):
+        from colony.characters.terrain import TerrainManager
+
+        self.viewer_width: int = viewer_width
+        self.viewer_height: int = viewer_height
+        self.image_manager = image_manager
+        self.current_iteration: int = 0
+        self.terrain_man: TerrainManager = TerrainManager(bitmap=first.bitmap)
+        self.building_man: _Namespace = _Namespace(building_step={})
+        self.spore_man: _Namespace = _Namespace(spores={}, current_pop=0, pop_cap=0)
+        self.res_man: _Namespace = _Namespace(storage=_Namespace(res={}))
+        self.printer: InfoManager = InfoManager(silent_mode=True)
+        self.step: Dict[Tuple[int, int], List[int]] = {}
+        self.apply(first)
+
+    def apply(self, snapshot: StepSnapshot):
+        self.current_iteration = snapshot.index
+        for coor, tile in snapshot.tiles:
+            self.terrain_man.set_tile(coor, tile)
+        for coor in snapshot.removed_buildings:
+            del self.building_man.building_step[coor]
+        self.building_man.building_step.update(snapshot.new_buildings)
+        # spores only need a look; one per occupied tile
+        spores: Dict[int, Spore] = {}
+        step: Dict[Tuple[int, int], List[int]] = {}
+        for spore_id, (x, y, sex) in enumerate(snapshot.spores.tolist()):
+            spores[spore_id] = Spore(sid=spore_id, sex=sex, age=0, pos=(x, y), health=0, storage=None)
+            step[(x, y)] = [spore_id]
+        self.spore_man.spores = spores
+        self.step = step
+        self.spore_man.current_pop = snapshot.current_pop
+        self.spore_man.pop_cap = snapshot.pop_cap
+        self.res_man.storage.res = snapshot.res
+
+
+class _GlobalRandomState:
+    """A state of numpy's global generator of its own, swapped in only inside a with block, so
+    that a simulation draws reproducibly without reseeding the generator of its caller."""
+    def __init__(self, seed: int):
+        outer_state: Tuple = np.random.get_state()
+        np.random.seed(seed)
+        self.state: Tuple = np.random.get_state()
+        self.outer_state: Tuple = outer_state
+        np.random.set_state(outer_state)
+
+    def __enter__(self):
+        self.outer_state = np.random.get_state()
+        np.random.set_state(self.state)
+
+    def __exit__(self, *exc_info):
+        self.state = np.random.get_state()
+        np.random.set_state(self.outer_state)
+
+
+def simulate_snapshots(
+    colony_kwargs: Dict[str, Any],
+    tile_set: str,
+    max_steps: Optional[int] = None,
+) -> Iterator[StepSnapshot]:
+    """Create a colony and progress it, yielding a snapshot of the colony before the first step
+    and after every step, until the colony dies or max_steps is reached."""
+    from colony.characters.colony import Colony
+    from colony.utils.image_manager import ImageManager
+
+    # spore movement draws from the global generator; give the run a seeded state of its own,
+    # used only while simulating, so that runs are reproducible and callers are left alone
+    random_state: _GlobalRandomState = _GlobalRandomState(colony_kwargs.get("seed", 720))
+    with random_state:
+        # buildings pick orientations from image assets, as they do in a single process
+        image_manager: ImageManager = ImageManager(set_name=tile_set, seed=colony_kwargs.get("seed", 720))
+        image_manager.prepare_tileset(0)
+        colony: Colony = Colony(image_manager=image_manager, **colony_kwargs)
+        recorder: SnapshotRecorder = SnapshotRecorder(colony)
+        snapshot: StepSnapshot = recorder.take()
+
+    yield snapshot
+    steps: int = 0
+    while max_steps is None or steps < max_steps:
+        steps += 1
+        with random_state:
+            survived: bool = colony.progress_a_step()
+            colony.printer.print_info()
+            if survived:
+                snapshot = recorder.take()
+        if not survived:
+            break
+        yield snapshot
+
+
+def _simulate(
+    colony_kwargs: Dict[str, Any],
+    tile_set: str,
+    max_steps: Optional[int],
+    snapshot_queues: List[mp.Queue],
+):
+    """Simulation process: send every snapshot to every render process, then None, also when
+    the simulation fails, so that render processes never wait forever."""
+    try:
+        for snapshot in simulate_snapshots(colony_kwargs, tile_set, max_steps):
+            for snapshot_queue in snapshot_queues:
+                snapshot_queue.put(snapshot)
+    finally:
+        for snapshot_queue in snapshot_queues:
+            snapshot_queue.put(None)
+
+
+def _render(
+    worker: int,
+    workers: int,
+    colony_kwargs: Dict[str, Any],
+    painter_style: str,
+    tile_set: str,
+    memory_name: str,
+    slots: int,
+    frame_shape: Tuple[int, int, int],
+    snapshot_queue: mp.Queue,
+    free_slots: mp.Queue,
+    ready: mp.Queue,
+):
+    """Render process: apply every snapshot, and render those of frames worker, worker +
+    workers, ... into free slots of the ring buffer."""
+    from colony.utils.image_manager import ImageManager
+    from colony.vis.step_visulizer import StepVisulizer
+
+    memory: shared_memory.SharedMemory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        ring: np.ndarray = np.ndarray((slots,) + frame_shape, dtype=np.uint8, buffer=memory.buf)
+        replica: Optional[ColonyReplica] = None
+        visualizer: Optional[StepVisulizer] = None
+        while True:
+            snapshot: Optional[StepSnapshot] = snapshot_queue.get()
+            if snapshot is None:
+                break
+            if replica is None:
+                image_manager: ImageManager = ImageManager(set_name=tile_set, seed=colony_kwargs.get("seed", 720))
+                replica = ColonyReplica(
+                    snapshot,
+                    viewer_width=colony_kwargs["viewer_width"],
+                    viewer_height=colony_kwargs["viewer_height"],
+                    image_manager=image_manager,
+                )
+                visualizer = StepVisulizer(colony=replica, painter_style=painter_style, image_manager=image_manager)
+            else:
+                replica.apply(snapshot)
+            if snapshot.index % workers == worker:
+                slot: int = free_slots.get()
+                visualizer.plot_step(output=ring[slot])
+                ready.put((snapshot.index, slot))
+            else:  # curves keep a history, so they follow every step
+                visualizer.curve_painter.draw_colony_curves(replica)
+        del ring
+    finally:
+        memory.close()
+        ready.put(None)
+
+
+def _check_processes(processes: List[mp.Process]):
+    """Raise if any process exited with an error."""
+    for process in processes:
+        if process.exitcode not in (None, 0):
+            raise RuntimeError(f"{process.name} process exited with code {process.exitcode}.")
+
+
+class PipelinedRunner:
+    """Runs a colony and renders it in other processes. Iterate frames() to get frames in order.
+
+    Usage:
+        runner = PipelinedRunner(colony_kwargs, "isometric", render_workers=2)
+        for frame in runner.frames():
+            cv2.imshow(WINDOW_NAME, frame)
+    """
+    def __init__(
+        self,
+        colony_kwargs: Dict[str, Any],
+        painter_style: str,
+        tile_set: str = "space",
+        render_workers: int = 1,
+        slots_per_worker: int = DEFAULT_SLOTS_PER_WORKER,
+        max_steps: Optional[int] = None,
+    ):
+        """
+        Args
+            colony_kwargs: keyword arguments to create the Colony, except image_manager; viewer
+                sizes must be given.
+            painter_style: style of main scene painter, as for StepVisulizer.
+            tile_set: short name of image tileset.
+            render_workers: number of render processes.
+            slots_per_worker: frames each render process may get ahead of the reader.
+            max_steps: stop after this many steps; run until the colony dies if None.
+        """
+        assert render_workers >= 1, "Need at least one render process."
+        self.colony_kwargs: Dict[str, Any] = colony_kwargs
+        self.painter_style: str = painter_style
+        self.tile_set: str = tile_set
+        self.render_workers: int = render_workers
+        self.slots_per_worker: int = slots_per_worker
+        self.max_steps: Optional[int] = max_steps
+
+    def frame_shape(self) -> Tuple[int, int, int]:
+        """Shape of frames, same as StepVisulizer.frame_shape."""
+        height: int = self.colony_kwargs["viewer_height"]
+        return (height + int(height * 0.2), self.colony_kwargs["viewer_width"], 3)
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """Yield frames in order, as views into shared memory. A frame is only valid until the
+        next one is requested; copy it to keep it."""
+        context = mp.get_context("spawn")
+        frame_shape: Tuple[int, int, int] = self.frame_shape()
+        slots: int = self.render_workers * self.slots_per_worker
+        memory: shared_memory.SharedMemory = shared_memory.SharedMemory(
+            create=True, size=slots * int(np.prod(frame_shape))
+        )
+        ring: np.ndarray = np.ndarray((slots,) + frame_shape, dtype=np.uint8, buffer=memory.buf)
+
+        snapshot_queues: List[mp.Queue] = [context.Queue(SNAPSHOT_QUEUE_SIZE) for _ in range(self.render_workers)]
+        # each render process has slots of its own, so that one running ahead cannot take all
+        # slots while the reader waits on another
+        free_slots: List[mp.Queue] = []
+        for worker in range(self.render_workers):
+            free_slots.append(context.Queue())
+            for slot in range(worker * self.slots_per_worker, (worker + 1) * self.slots_per_worker):
+                free_slots[worker].put(slot)
+        ready: mp.Queue = context.Queue()
+
+        processes: List[mp.Process] = [
+            context.Process(
+                target=_simulate,
+                args=(self.colony_kwargs, self.tile_set, self.max_steps, snapshot_queues),
+                name="ColonySimulation",
+                daemon=True,
+            )
+        ] + [
+            context.Process(
+                target=_render,
+                args=(
+                    worker, self.render_workers, self.colony_kwargs, self.painter_style, self.tile_set,
+                    memory.name, slots, frame_shape, snapshot_queues[worker], free_slots[worker], ready,
+                ),
+                name=f"ColonyRender-{worker}",
+                daemon=True,
+            )
+            for worker in range(self.render_workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            pending: Dict[int, int] = {}  # frame index -> slot, rendered but not yet read
+            next_index: int = 0
+            running: int = self.render_workers
+            while running or pending:
+                if next_index in pending:
+                    slot: int = pending.pop(next_index)
+                    yield ring[slot]
+                    free_slots[next_index % self.render_workers].put(slot)
+                    next_index += 1
+                    continue
+                if not running:  # frames left are out of order, some render process failed
+                    _check_processes(processes)
+                    raise RuntimeError(f"Frame {next_index} was never rendered.")
+                try:
+                    message: Optional[Tuple[int, int]] = ready.get(timeout=PROCESS_CHECK_INTERVAL)
+                except queue.Empty:  # a process that died without a word would never answer
+                    _check_processes(processes)
+                    continue
+                if message is None:
+                    running -= 1
+                else:
+                    pending[message[0]] = message[1]
+            # render processes also stop when the simulation fails; tell that from a finished run
+            processes[0].join()
+            _check_processes(processes)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            del ring
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,296 @@
+"""Records what rendering needs from every step of a run, and renders recordings later, at any
+resolution and painter style, with chunks of frames spread over a process pool.
+
+A recording is a folder of two files:
+    spores.bin: x, y and sex (int32) of top spores, of all steps one after another; appended
+        to while recording, so long runs do not pile up in memory.
+    index.npz: where each step starts in spores.bin, per-step stats for the panes, tile changes
+        and building events by step, and the bitmap before the first step.
+"""
+import concurrent.futures
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from colony.characters.buildings import Building
+from colony.characters.storage import RES_MAPPING
+from colony.vis.frame_sink import FrameSink, FRAME_NAME_PATTERN
+from colony.vis.pipeline import ColonyReplica, StepSnapshot, simulate_snapshots
+
+
+SPORE_FILE: str = "spores.bin"
+INDEX_FILE: str = "index.npz"
+
+# columns of per-step stats: population, population cap, then resources
+RES_TYPES: List[int] = sorted(RES_MAPPING)
+# stats columns feeding curves, in the order of CurvePainter.trackers()
+CURVE_COLUMNS: List[int] = [0] + [2 + RES_TYPES.index(res_type) for res_type in (11, 21, 22, 23)]
+
+TILE_CHANGE_DTYPE: np.dtype = np.dtype([
+    ("step", np.int64), ("x", np.int32), ("y", np.int32),
+    ("terrain", np.uint8), ("structure", np.uint16), ("tech", np.uint8),
+])
+BUILDING_EVENT_DTYPE: np.dtype = np.dtype([
+    ("step", np.int64), ("x", np.int32), ("y", np.int32), ("removed", bool),
+    ("id", np.int64), ("type", np.int32), ("tech_level", np.int32),
+    ("orientation", np.int32), ("size_x", np.int32), ("size_y", np.int32),
+])
+
+# PNG compression of frames passed from render processes to the encoder; low is fast
+FRAME_PNG_COMPRESSION: int = 1
+
+
+class RunRecorder:
+    """Writes snapshots of a run, in order, to a recording folder.
+
+    Usage:
+        with RunRecorder("runs/colony") as recorder:
+            for snapshot in simulate_snapshots(colony_kwargs, "space"):
+                recorder.write(snapshot)
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path: Path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.spore_file = open(self.path.joinpath(SPORE_FILE), "wb")
+        self.spore_offsets: List[int] = [0]
+        self.stats: List[List[float]] = []
+        self.tile_changes: List[Tuple] = []
+        self.building_events: List[Tuple] = []
+        self.bitmap: Optional[np.ndarray] = None
+
+    def __enter__(self) -> "RunRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, snapshot: StepSnapshot):
+        step: int = len(self.stats)
+        assert snapshot.index == step, f"Snapshot {snapshot.index} recorded as step {step}."
+        if snapshot.bitmap is not None:
+            self.bitmap = snapshot.bitmap
+        spores: np.ndarray = np.ascontiguousarray(snapshot.spores, dtype=np.int32)
+        self.spore_file.write(spores.tobytes())
+        self.spore_offsets.append(self.spore_offsets[-1] + len(spores))
+        self.stats.append(
+            [snapshot.current_pop, snapshot.pop_cap] + [snapshot.res.get(res_type, 0) for res_type in RES_TYPES]
+        )
+        for (x, y), tile in snapshot.tiles:
+            self.tile_changes.append((step, x, y) + tuple(tile))
+        for (x, y) in snapshot.removed_buildings:
+            self.building_events.append((step, x, y, True, -1, 0, 0, 0, 0, 0))
+        for (x, y), building in snapshot.new_buildings.items():
+            orientation: int = -1 if building.orientation is None else building.orientation
+            self.building_events.append(
+                (step, x, y, False, building.id, building.type, building.tech_level, orientation) + tuple(building.size)
+            )
+
+    def close(self):
+        if self.spore_file.closed:
+            return
+        self.spore_file.close()
+        assert self.bitmap is not None, "Nothing was recorded."
+        np.savez(
+            self.path.joinpath(INDEX_FILE),
+            spore_offsets=np.array(self.spore_offsets, dtype=np.int64),
+            stats=np.array(self.stats, dtype=np.float64).reshape(-1, 2 + len(RES_TYPES)),
+            tile_changes=np.array(self.tile_changes, dtype=TILE_CHANGE_DTYPE),
+            building_events=np.array(self.building_events, dtype=BUILDING_EVENT_DTYPE),
+            bitmap=self.bitmap,
+        )
+
+
+def record_run(
+    path: Union[str, Path],
+    colony_kwargs: Dict[str, Any],
+    tile_set: str = "space",
+    max_steps: Optional[int] = None,
+) -> int:
+    """Simulate a colony (see simulate_snapshots()) and record it. Returns number of frames."""
+    with RunRecorder(path) as recorder:
+        for snapshot in simulate_snapshots(colony_kwargs, tile_set, max_steps):
+            recorder.write(snapshot)
+    return len(recorder.stats)
+
+
+class RecordedRun:
+    """Reads a recording. Snapshots can be taken at any step, so that rendering can start
+    anywhere."""
+    def __init__(self, path: Union[str, Path]):
+        self.path: Path = Path(path)
+        with np.load(self.path.joinpath(INDEX_FILE)) as index:
+            self.spore_offsets: np.ndarray = index["spore_offsets"]
+            self.stats: np.ndarray = index["stats"]
+            self.tile_changes: np.ndarray = index["tile_changes"]
+            self.building_events: np.ndarray = index["building_events"]
+            self.bitmap: np.ndarray = index["bitmap"]
+        self.spores: np.ndarray = np.memmap(self.path.joinpath(SPORE_FILE), dtype=np.int32, mode="r") \
+            if self.spore_offsets[-1] else np.zeros(0, dtype=np.int32)
+        self.spores = self.spores.reshape(-1, 3)
+
+    @property
+    def frames(self) -> int:
+        return len(self.stats)
+
+    @staticmethod
+    def _rows_of_step(table: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Rows of a table sorted by step, with start <= step < end."""
+        return table[np.searchsorted(table["step"], start): np.searchsorted(table["step"], end)]
+
+    @staticmethod
+    def _building(event: np.void) -> Building:
+        return Building(
+            id=int(event["id"]),
+            type=int(event["type"]),
+            tech_level=int(event["tech_level"]),
+            location=(int(event["x"]), int(event["y"])),
+            orientation=None if event["orientation"] < 0 else int(event["orientation"]),
+            size=(int(event["size_x"]), int(event["size_y"])),
+        )
+
+    def _apply_buildings(self, buildings: Dict[Tuple[int, int], Building], events: np.ndarray):
+        for event in events:
+            coor: Tuple[int, int] = (int(event["x"]), int(event["y"]))
+            if event["removed"]:
+                buildings.pop(coor, None)
+            else:
+                buildings[coor] = self._building(event)
+
+    def _snapshot(self, step: int, **fields) -> StepSnapshot:
+        stats: List[float] = self.stats[step].tolist()
+        return StepSnapshot(
+            index=step,
+            spores=np.array(self.spores[self.spore_offsets[step]: self.spore_offsets[step + 1]]),
+            current_pop=int(stats[0]),
+            pop_cap=int(stats[1]),
+            res=dict(zip(RES_TYPES, stats[2:])),
+            **fields,
+        )
+
+    def snapshot(self, step: int) -> StepSnapshot:
+        """Changes of a step, to apply on the state of the previous step."""
+        events: np.ndarray = self._rows_of_step(self.building_events, step, step + 1)
+        new_buildings: Dict[Tuple[int, int], Building] = {}
+        self._apply_buildings(new_buildings, events[~events["removed"]])
+        return self._snapshot(
+            step,
+            new_buildings=new_buildings,
+            removed_buildings=[(int(event["x"]), int(event["y"])) for event in events[events["removed"]]],
+            tiles=[
+                ((int(change["x"]), int(change["y"])), (int(change["terrain"]), int(change["structure"]), int(change["tech"])))
+                for change in self._rows_of_step(self.tile_changes, step, step + 1)
+            ],
+        )
+
+    def state_at(self, step: int) -> StepSnapshot:
+        """Whole state at a step, as a first snapshot (with bitmap) to start a replica from."""
+        bitmap: np.ndarray = self.bitmap.copy()
+        # changes of step 0 are in the recorded bitmap already; replay the rest in order
+        for change in self._rows_of_step(self.tile_changes, 1, step + 1):
+            bitmap[change["y"], change["x"]] = (change["terrain"], change["structure"], change["tech"])
+        buildings: Dict[Tuple[int, int], Building] = {}
+        self._apply_buildings(buildings, self._rows_of_step(self.building_events, 0, step + 1))
+        return self._snapshot(step, new_buildings=buildings, bitmap=bitmap)
+
+    def curve_history(self, step: int) -> np.ndarray:
+        """Curve values of every step before the given one, for CurvePainter.restore_history()."""
+        return self.stats[:step, CURVE_COLUMNS]
+
+
+def _render_chunk(
+    path: Union[str, Path],
+    start: int,
+    end: int,
+    painter_style: str,
+    viewer_width: int,
+    viewer_height: int,
+    tile_set: str,
+    frame_folder: Union[str, Path],
+):
+    """Render frames start to end - 1 of a recording as PNGs into frame_folder."""
+    from colony.utils.image_manager import ImageManager
+    from colony.vis.step_visulizer import StepVisulizer
+
+    run: RecordedRun = RecordedRun(path)
+    image_manager: ImageManager = ImageManager(set_name=tile_set)
+    replica: ColonyReplica = ColonyReplica(
+        run.state_at(start), viewer_width=viewer_width, viewer_height=viewer_height, image_manager=image_manager
+    )
+    visualizer: StepVisulizer = StepVisulizer(colony=replica, painter_style=painter_style, image_manager=image_manager)
+    # curves show the last steps before this chunk as well
+    visualizer.curve_painter.restore_history(run.curve_history(start))
+    for step in range(start, end):
+        if step > start:
+            replica.apply(run.snapshot(step))
+        cv2.imwrite(
+            str(Path(frame_folder).joinpath(FRAME_NAME_PATTERN % step)),
+            visualizer.plot_step(),
+            [cv2.IMWRITE_PNG_COMPRESSION, FRAME_PNG_COMPRESSION],
+        )
+
+
+def render_recording(
+    path: Union[str, Path],
+    output: Union[str, Path],
+    painter_style: str,
+    viewer_width: int,
+    viewer_height: int,
+    tile_set: str = "space",
+    workers: Optional[int] = None,
+    chunks: Optional[int] = None,
+    fps: int = 24,
+):
+    """Render a recording. The frame range is split into contiguous chunks rendered by a pool
+    of processes, and the chunks are merged in order as they complete.
+
+    Args
+        path: recording folder.
+        output: video file; or a folder (no suffix) to keep frames as numbered PNGs.
+        painter_style: style of main scene painter, as for StepVisulizer.
+        viewer_width, viewer_height: size of main viewer, as for Colony.
+        tile_set: short name of image tileset.
+        workers: number of render processes; number of CPUs if None.
+        chunks: number of chunks; as many as workers if None.
+        fps: frame rate of video.
+    """
+    run: RecordedRun = RecordedRun(path)
+    workers = workers or os.cpu_count() or 1
+    bounds: np.ndarray = np.linspace(0, run.frames, min(chunks or workers, run.frames) + 1).astype(int)
+    output = Path(output)
+    keep_frames: bool = output.suffix == ""
+    if keep_frames:
+        output.mkdir(parents=True, exist_ok=True)
+        frame_folder: Path = output
+    else:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        frame_folder = Path(tempfile.mkdtemp(prefix=output.stem + ".", dir=output.parent))
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+            futures: List[concurrent.futures.Future] = [
+                pool.submit(
+                    _render_chunk, path, start, end, painter_style, viewer_width, viewer_height,
+                    tile_set, frame_folder,
+                )
+                for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+            ]
+            if keep_frames:
+                for future in futures:
+                    future.result()
+                return
+            with FrameSink(output, fps=fps) as sink:
+                for future, start, end in zip(futures, bounds[:-1].tolist(), bounds[1:].tolist()):
+                    future.result()  # chunks after this one keep rendering meanwhile
+                    for step in range(start, end):
+                        frame_path: Path = frame_folder.joinpath(FRAME_NAME_PATTERN % step)
+                        sink.write(cv2.imread(str(frame_path)))
+                        frame_path.unlink()
+    finally:
+        if not keep_frames:
+            shutil.rmtree(frame_folder, ignore_errors=True)
@@ -0,0 +1,107 @@
+"""Indices of objects drawn on the main scene: a spatial index for finding objects that overlap
+a rectangle of the frame that needs redrawing, and the painting order of occupied tiles.
+"""
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from colony.utils.rect_helpers import Rect, rects_overlap
+
+# side length of grid cells in pixels
+GRID_CELL_SIZE: int = 64
+
+
+class ObjectGrid:
+    """Buckets object rectangles by coarse screen cells. Adding, removing and querying cost
+    O(cells covered), independent of how many objects are on the scene.
+    """
+    def __init__(self, cell_size: int = GRID_CELL_SIZE):
+        self.cell_size: int = cell_size
+        self.cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.rects: Dict[Hashable, Rect] = {}
+
+    def _cells_of(self, rect: Rect) -> List[Tuple[int, int]]:
+        x_start, y_start, x_end, y_end = rect
+        size: int = self.cell_size
+        return [
+            (cell_x, cell_y)
+            for cell_y in range(y_start // size, (y_end - 1) // size + 1)
+            for cell_x in range(x_start // size, (x_end - 1) // size + 1)
+        ]
+
+    def add(self, key: Hashable, rect: Rect):
+        """Add an object, or move it if already added."""
+        if key in self.rects:
+            self.remove(key)
+        self.rects[key] = rect
+        for cell in self._cells_of(rect):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """Remove an object if it is there."""
+        rect: Rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        for cell in self._cells_of(rect):
+            bucket: Set[Hashable] = self.cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, rect: Rect) -> Set[Hashable]:
+        """Get objects whose rectangles overlap the given one."""
+        found: Set[Hashable] = set()
+        for cell in self._cells_of(rect):
+            found.update(self.cells.get(cell, ()))
+        return {key for key in found if rects_overlap(self.rects[key], rect)}
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+
+
+class DepthOrder:
+    """Isometric painting order of occupied tiles: y ascending, then x descending. Each tile has
+    a fixed rank in that order, computed from its coordinates, and the ranks of occupied tiles
+    are kept in a set, so the painting order is one sort of occupied ranks instead of sorting
+    coordinate pairs. Memory follows the number of occupied tiles, not the map size.
+    """
+    def __init__(self, width: int, height: int):
+        self.width: int = width
+        self.height: int = height
+        self.occupied: Set[int] = set()
+
+    def rank(self, coor: Tuple[int, int]) -> int:
+        x, y = coor
+        return y * self.width + (self.width - 1 - x)
+
+    def _ranks(self, coors: List[Tuple[int, int]]) -> np.ndarray:
+        xs, ys = np.array(coors, dtype=np.int64).T
+        return ys * self.width + (self.width - 1 - xs)
+
+    def add(self, coor: Tuple[int, int]):
+        self.occupied.add(self.rank(coor))
+
+    def remove(self, coor: Tuple[int, int]):
+        self.occupied.discard(self.rank(coor))
+
+    def reset(self, coors: Iterable[Tuple[int, int]]):
+        """Flag exactly the given tiles as occupied."""
+        coors = list(coors)
+        self.occupied = set(self._ranks(coors).tolist()) if coors else set()
+
+    def _coors_of(self, ranks: np.ndarray) -> List[Tuple[int, int]]:
+        ys, flipped_xs = np.divmod(ranks, self.width)
+        return list(zip((self.width - 1 - flipped_xs).tolist(), ys.tolist()))
+
+    def ordered(self) -> List[Tuple[int, int]]:
+        """All occupied tiles in painting order."""
+        ranks: np.ndarray = np.fromiter(self.occupied, dtype=np.int64, count=len(self.occupied))
+        return self._coors_of(np.sort(ranks))
+
+    def sort(self, coors: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Given tiles in painting order."""
+        coors = list(coors)
+        if not coors:
+            return []
+        return self._coors_of(np.sort(self._ranks(coors)))
@@ -5,7 +5,7 @@ from colony.configs.map_generator.ref import map_ref
 from colony.characters.colony import Colony
 from colony.utils.image_manager import ImageManager
 from colony.vis.curve_painter import CurvePainter
-from colony.configuration import MapSetup, map_cfg, world_cfg, WorldSetup
+from colony.configuration import MapSetup
 from colony.characters.storage import RES_MAPPING
 
 from colony.vis.main_scene_painter import MainScenePainter
@@ -24,21 +24,23 @@ class StepVisulizer:
         colony: Colony,
         painter_style: str,
         image_manager: ImageManager = None,
-        map_cfg: MapSetup = map_cfg,
+        map_cfg: MapSetup = None,
     ):
         """
         Args
             colony: pointer to a colony object saved in memory
-            map_cfg: map configuration instance
+            map_cfg: map configuration instance; colony's own bitmap is used if not given
         """
 
         self.colony: Colony = colony
         frame_height: int = colony.viewer_height
         frame_width: int = colony.viewer_width
-        self.bitmap: np.ndarray = map_cfg.bitmap
+        self.bitmap: np.ndarray = colony.terrain_man.bitmap if map_cfg is None else map_cfg.bitmap
 
         # setup pane sizes
         info_pane_height: int = int(frame_height * 0.2)  # shared by two lower panes
+        # shape of frames made by plot_step()
+        self.frame_shape: Tuple[int, int, int] = (frame_height + info_pane_height, frame_width, 3)
         left_info_pane_width: int = int(frame_width / 2)
         right_info_pane_width: int = frame_width - left_info_pane_width
 
@@ -60,11 +62,16 @@ class StepVisulizer:
         # pop curve painter
         self.curve_painter = CurvePainter(right_info_pane_width, info_pane_height)
 
-    def paint_main_viewer(self, with_info: bool = False) -> np.ndarray:
+    def paint_main_viewer(self, frame: np.ndarray = None, with_info: bool = False) -> np.ndarray:
         """Paint the colony main viewer, i.e. the dots and playground.
-        This mutates the input frame as a result of np.array manipulation.
+        The main scene painter retains its frame between steps, so the scene is copied into
+        frame (a new array if not given) before text is added on it.
         """
-        frame = self.main_painter.paint_main_scence()
+        scene: np.ndarray = self.main_painter.paint_main_scence()
+        if frame is None:
+            frame = scene.copy()
+        else:
+            frame[:] = scene
 
         res11_info = "{}: {:5d}".format(RES_MAPPING[11], int(self.colony.res_man.storage.res[11]))
         res21_info = "{}: {:5d}".format(RES_MAPPING[21], int(self.colony.res_man.storage.res[21]))
@@ -98,7 +105,7 @@ class StepVisulizer:
         ])
         return left_info
 
-    def plot_step(self):
+    def plot_step(self, output: np.ndarray = None):
         """
         Plot a step. Info is accessed by the pointer to colony object.
 
@@ -108,12 +115,13 @@ class StepVisulizer:
                 left pane showing current population and cycle number
                 right pane showing population curve
 
+        The returned array is newly allocated on every call and not kept, so it can be handed
+        to consumers like FrameSink without copying.
+
         Args:
-            cycle: cycle number that will be displayed on info pane
+            output: array of frame_shape to paint into, e.g. a slot of shared memory; a new
+                array is allocated if not given
         """        
-        # paint viewer pane (upper pane)
-        viewer_pane: np.ndarray = self.paint_main_viewer(with_info=False)  # with_info enables on-screen print
-
         # paint lower panes
         # left info pane
         info_pane: np.ndarray = self.paint_info_pane()
@@ -123,5 +131,13 @@ class StepVisulizer:
 
         # put lower two panes together
         below_addon = np.concatenate([info_pane, curve_pane], axis=1)
-        # return concatenated uppwer and lower panes
-        return np.concatenate([viewer_pane, below_addon], axis=0)
+
+        # upper and lower panes share one output array, and the viewer pane is painted straight
+        # into its upper part
+        viewer_height: int = self.colony.viewer_height
+        if output is None:
+            output = np.empty(self.frame_shape, dtype=np.uint8)
+        output[viewer_height:] = below_addon
+        # paint viewer pane (upper pane)
+        self.paint_main_viewer(frame=output[:viewer_height], with_info=False)  # with_info enables on-screen print
+        return output